@@ -10,8 +10,9 @@ Journey: J-LLM-FIRST-CONVERSATION
 from __future__ import annotations
 
 import math
+import struct
 import time
-from dataclasses import dataclass
+from dataclasses import FrozenInstanceError
 from typing import Optional
 
 # ── FNV-1a constants (must match ccf-core Rust implementation) ───────────────
@@ -19,14 +20,18 @@ _FNV_OFFSET_BASIS: int = 2166136261
 _FNV_PRIME: int = 16777619
 
 
+_PACK_KEY = struct.Struct("<IIIII").pack
+
+
 def _fnv1a(*values: int) -> int:
     """FNV-1a hash of a sequence of u32 values. 32-bit, matches Rust impl."""
+    if len(values) == 5:
+        buf = _PACK_KEY(*values)
+    else:
+        buf = struct.pack(f"<{len(values)}I", *values)
     h = _FNV_OFFSET_BASIS
-    for v in values:
-        for byte_pos in range(4):
-            byte = (v >> (byte_pos * 8)) & 0xFF
-            h ^= byte
-            h = (h * _FNV_PRIME) & 0xFFFFFFFF
+    for byte in buf:
+        h = ((h ^ byte) * _FNV_PRIME) & 0xFFFFFFFF
     return h
 
 
@@ -288,7 +293,15 @@ def _sentence_transformer_cluster(text: str) -> int:
 
 # ── TextContextKey ────────────────────────────────────────────────────────────
 
-@dataclass(frozen=True)
+# Bit layout of TextContextKey._packed (14 bits used):
+#   [0:6] topic_domain  [6:8] conversation_depth  [8:10] emotional_register
+#   [10:12] time_of_day  [12:14] session_phase
+_DEPTH_SHIFT = 6
+_REGISTER_SHIFT = 8
+_TIME_SHIFT = 10
+_PHASE_SHIFT = 12
+
+
 class TextContextKey:
     """
     5-dimensional SensorVocabulary for LLM conversation contexts.
@@ -309,6 +322,10 @@ class TextContextKey:
     session_phase : int
         0=opening(turns 0–3), 1=middle(turns 4–20), 2=closing(turns 21+).
 
+    The five dimensions are packed into a single 14-bit int (``_packed``) and
+    exposed as read-only properties, so a key costs one small int per instance.
+    Instances are immutable; equality and ``hash()`` key off ``_packed``.
+
     Invariants
     ----------
     I-LLM-001 : Identical inputs always produce the same hash (FNV-1a).
@@ -323,33 +340,112 @@ class TextContextKey:
     >>> key.feature_vector()      # 5 floats in [0, 1]
     """
 
-    topic_domain: int       # 0–63 embedding cluster
-    conversation_depth: int    # 0=shallow, 1=moderate, 2=deep
-    emotional_register: int    # 0=neutral, 1=warm, 2=vulnerable, 3=intense
-    time_of_day: int           # 0=morning, 1=afternoon, 2=evening, 3=night
-    session_phase: int         # 0=opening, 1=middle, 2=closing
-
-    def __post_init__(self) -> None:
-        if not (0 <= self.topic_domain <= 63):
+    __slots__ = ("_packed", "_hash")
+
+    def __init__(
+        self,
+        topic_domain: int,
+        conversation_depth: int,
+        emotional_register: int,
+        time_of_day: int,
+        session_phase: int,
+    ) -> None:
+        if not (0 <= topic_domain <= 63):
             raise ValueError(
-                f"topic_domain must be 0–63, got {self.topic_domain}"
+                f"topic_domain must be 0–63, got {topic_domain}"
             )
-        if not (0 <= self.conversation_depth <= 2):
+        if not (0 <= conversation_depth <= 2):
             raise ValueError(
-                f"conversation_depth must be 0–2, got {self.conversation_depth}"
+                f"conversation_depth must be 0–2, got {conversation_depth}"
             )
-        if not (0 <= self.emotional_register <= 3):
+        if not (0 <= emotional_register <= 3):
             raise ValueError(
-                f"emotional_register must be 0–3, got {self.emotional_register}"
+                f"emotional_register must be 0–3, got {emotional_register}"
             )
-        if not (0 <= self.time_of_day <= 3):
+        if not (0 <= time_of_day <= 3):
             raise ValueError(
-                f"time_of_day must be 0–3, got {self.time_of_day}"
+                f"time_of_day must be 0–3, got {time_of_day}"
             )
-        if not (0 <= self.session_phase <= 2):
+        if not (0 <= session_phase <= 2):
             raise ValueError(
-                f"session_phase must be 0–2, got {self.session_phase}"
+                f"session_phase must be 0–2, got {session_phase}"
             )
+        object.__setattr__(
+            self,
+            "_packed",
+            topic_domain
+            | (conversation_depth << _DEPTH_SHIFT)
+            | (emotional_register << _REGISTER_SHIFT)
+            | (time_of_day << _TIME_SHIFT)
+            | (session_phase << _PHASE_SHIFT),
+        )
+        object.__setattr__(self, "_hash", None)
+
+    # ── Dimensions (unpacked on access) ──────────────────────────────────────
+
+    @property
+    def topic_domain(self) -> int:
+        """0–63 embedding cluster."""
+        return self._packed & 0x3F
+
+    @property
+    def conversation_depth(self) -> int:
+        """0=shallow, 1=moderate, 2=deep."""
+        return (self._packed >> _DEPTH_SHIFT) & 0x3
+
+    @property
+    def emotional_register(self) -> int:
+        """0=neutral, 1=warm, 2=vulnerable, 3=intense."""
+        return (self._packed >> _REGISTER_SHIFT) & 0x3
+
+    @property
+    def time_of_day(self) -> int:
+        """0=morning, 1=afternoon, 2=evening, 3=night."""
+        return (self._packed >> _TIME_SHIFT) & 0x3
+
+    @property
+    def session_phase(self) -> int:
+        """0=opening, 1=middle, 2=closing."""
+        return (self._packed >> _PHASE_SHIFT) & 0x3
+
+    # ── Value semantics ──────────────────────────────────────────────────────
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise FrozenInstanceError(f"cannot assign to field {name!r}")
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field {name!r}")
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._packed == other._packed
+
+    def __hash__(self) -> int:
+        return hash(self._packed)
+
+    def __reduce__(self):
+        return (self.__class__, self._dims())
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"topic_domain={self.topic_domain}, "
+            f"conversation_depth={self.conversation_depth}, "
+            f"emotional_register={self.emotional_register}, "
+            f"time_of_day={self.time_of_day}, "
+            f"session_phase={self.session_phase})"
+        )
+
+    def _dims(self) -> tuple[int, int, int, int, int]:
+        p = self._packed
+        return (
+            p & 0x3F,
+            (p >> _DEPTH_SHIFT) & 0x3,
+            (p >> _REGISTER_SHIFT) & 0x3,
+            (p >> _TIME_SHIFT) & 0x3,
+            (p >> _PHASE_SHIFT) & 0x3,
+        )
 
     # ── Core API ─────────────────────────────────────────────────────────────
 
@@ -359,14 +455,14 @@ class TextContextKey:
 
         Stable across Python versions, runs, and machines.
         Matches the Rust ccf-core implementation (I-LLM-001).
+        Computed once per instance — the key is frozen, so the cached value
+        can never go stale.
         """
-        return _fnv1a(
-            self.topic_domain,
-            self.conversation_depth,
-            self.emotional_register,
-            self.time_of_day,
-            self.session_phase,
-        )
+        h = self._hash
+        if h is None:
+            h = _fnv1a(*self._dims())
+            object.__setattr__(self, "_hash", h)
+        return h
 
     def feature_vector(self) -> list[float]:
         """
@@ -374,12 +470,13 @@ class TextContextKey:
 
         Layout: [topic/63, depth/2, register/3, time/3, phase/2]
         """
+        topic, depth, register, tod, phase = self._dims()
         return [
-            self.topic_domain / 63.0,
-            self.conversation_depth / 2.0,
-            self.emotional_register / 3.0,
-            self.time_of_day / 3.0,
-            self.session_phase / 2.0,
+            topic / 63.0,
+            depth / 2.0,
+            register / 3.0,
+            tod / 3.0,
+            phase / 2.0,
         ]
 
     def cosine_similarity(self, other: "TextContextKey") -> float:
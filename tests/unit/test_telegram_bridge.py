@@ -0,0 +1,65 @@
+"""
+Unit tests for the Telegram bridge's webhook dispatch (tools/telegram_bridge.py).
+
+A chat's updates must reach handle_message in the order they arrived:
+"forward" then "stop" must never run as "stop" then "forward".
+
+Run with:
+    python -m pytest tests/unit/test_telegram_bridge.py -v
+"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, "tools")
+
+import telegram_bridge
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Record handle_message calls; "forward" is slow, so a later update
+    that was not queued behind it would overtake it."""
+    seen = []
+    lock = threading.Lock()
+
+    def handle_message(user, text):
+        if text == "forward":
+            time.sleep(0.2)
+        with lock:
+            seen.append(text)
+        return text
+
+    monkeypatch.setattr(telegram_bridge, "handle_message", handle_message)
+    monkeypatch.setattr(telegram_bridge, "tg_request", lambda *args, **kwargs: None)
+    return seen
+
+
+# ── ChatLanes ─────────────────────────────────────────────────────────────────
+
+class TestChatLanes:
+    def test_one_chat_is_answered_in_order(self, calls):
+        lanes = telegram_bridge.ChatLanes("token")
+        lanes.submit(42, "user", "forward")
+        lanes.submit(42, "user", "stop")
+        lanes.shutdown(wait=True)
+        assert calls == ["forward", "stop"]
+
+    def test_other_chats_do_not_wait(self, calls):
+        lanes = telegram_bridge.ChatLanes("token", lanes=2)
+        lanes.submit(0, "user", "forward")  # slow, on lane 0
+        lanes.submit(1, "user", "hello")    # lane 1
+        lanes.shutdown(wait=True)
+        assert calls == ["hello", "forward"]
+
+    def test_chat_locks_are_dropped(self, calls):
+        lanes = telegram_bridge.ChatLanes("token")
+        for chat_id in range(20):
+            lanes.submit(chat_id, "user", "stop")
+        lanes.shutdown(wait=True)
+        assert telegram_bridge.CHAT_LOCKS == {}
@@ -29,18 +29,19 @@ from ccf_core.text_context_key import (
 
 # ── 1. Hash stability (I-LLM-001) ────────────────────────────────────────────
 
-def test_hash_stability_1000_repetitions():
+@pytest.mark.parametrize("dims,reference", [
+    ((0, 1, 0, 1, 1), 2463662628),
+    ((3, 1, 0, 1, 1), 2473782231),
+    ((28, 2, 3, 3, 2), 233644505),
+    ((0, 0, 0, 0, 0), 3120489557),
+])
+def test_hash_stability_1000_repetitions(dims, reference):
     """Same 5-tuple must produce the same hash every call (I-LLM-001)."""
-    key = TextContextKey(
-        topic_domain=0,
-        conversation_depth=1,
-        emotional_register=0,
-        time_of_day=1,
-        session_phase=1,
-    )
+    key = TextContextKey(*dims)
     first = key.context_hash()
+    assert first == reference, f"Expected pinned hash {reference}, got {first}"
     for _ in range(999):
-        assert key.context_hash() == first, "Hash is not stable across calls"
+        assert key.context_hash() is first, "Hash is not stable across calls"
 
 
 # ── 2. Different topics produce different hashes ──────────────────────────────
@@ -92,6 +93,32 @@ def test_dimension_bounds_validation(field, bad_value):
         TextContextKey(**kwargs)
 
 
+@pytest.mark.parametrize("dims", [
+    (0, 0, 0, 0, 0),
+    (63, 2, 3, 3, 2),
+    (17, 1, 2, 0, 1),
+])
+def test_packed_dimensions_round_trip(dims):
+    """Dimensions packed into one int must unpack to the constructor values."""
+    key = TextContextKey(*dims)
+    assert (
+        key.topic_domain,
+        key.conversation_depth,
+        key.emotional_register,
+        key.time_of_day,
+        key.session_phase,
+    ) == dims
+    assert key == TextContextKey(*dims)
+    assert hash(key) == hash(TextContextKey(*dims))
+
+
+def test_key_is_immutable():
+    """Assigning to a dimension must fail — the hash is cached per instance."""
+    key = TextContextKey(0, 1, 0, 1, 1)
+    with pytest.raises(AttributeError):
+        key.topic_domain = 5
+
+
 # ── 4. Feature vector values in [0, 1] ───────────────────────────────────────
 
 @pytest.mark.parametrize("key_args", [
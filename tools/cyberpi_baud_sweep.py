@@ -9,6 +9,8 @@ Strategy 4: Send code in normal mode (before mode upload)
 Strategy 5: Use file write + soft reset (no RTS toggle) to run main.py
 """
 
+import select
+import sys
 import serial
 import time
 
@@ -22,14 +24,31 @@ def log(msg):
         f.write(f"{msg}\n")
 
 def read_all(ser, timeout=2.0):
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
-        n = ser.in_waiting
-        if n:
-            buf += ser.read(n)
-        time.sleep(0.01)
-    return buf
+    """Collect everything that arrives within timeout, sleeping in select()."""
+    if sys.platform == "win32":
+        # pyserial ports are not selectable on Windows; poll instead
+        end = time.monotonic() + timeout
+        buf = b""
+        while time.monotonic() < end:
+            n = ser.in_waiting
+            if n:
+                buf += ser.read(n)
+            time.sleep(0.01)
+        return buf
+
+    deadline = time.monotonic() + timeout
+    buf = bytearray()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        r, _, _ = select.select([ser.fileno()], [], [], remaining)
+        if not r:
+            break
+        chunk = ser.read(ser.in_waiting or 1)
+        if chunk:
+            buf.extend(chunk)
+    return bytes(buf)
 
 def show(label, data):
     log(f"\n  [{label}] {len(data)} bytes")
@@ -54,6 +73,12 @@ def enter_repl(ser):
     resp = read_all(ser, 3.0)
     return b">>>" in resp, resp
 
+def send_lines(ser, lines, per_line=0.5):
+    """Write a block of REPL lines in one write, then wait for all of them."""
+    ser.write(b"".join(line.encode() + b"\r\n" for line in lines))
+    ser.flush()
+    time.sleep(per_line * len(lines))
+
 def main():
     with open(LOGFILE, "w") as f:
         f.write(f"=== Multi-Strategy Probe - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
@@ -153,13 +178,11 @@ def main():
             # Green LED = WiFi commands sent
             "cyberpi.led.on(0, 255, 0)",
         ]
-        for cmd in wifi_cmds:
-            ser.write(cmd.encode() + b"\r\n")
-            time.sleep(0.5)
-            # Check for any response
-            resp = read_all(ser, 0.3)
-            if resp:
-                show(f"WiFi cmd: {cmd[:20]}", resp)
+        send_lines(ser, wifi_cmds)
+        # Check for any response
+        resp = read_all(ser, 0.3)
+        if resp:
+            show("WiFi cmds", resp)
 
         # Check for AP
         log("  WiFi commands sent. Checking for AP in 5 seconds...")
@@ -189,9 +212,7 @@ def main():
             "w.config(essid='mBot2Status')",
             "import cyberpi; cyberpi.led.on(0, 255, 255)",
         ]
-        for cmd in wifi_cmds:
-            ser.write(cmd.encode() + b"\r\n")
-            time.sleep(0.5)
+        send_lines(ser, wifi_cmds)
 
         log("  WiFi commands sent via 'status' mode. Checking...")
         time.sleep(5.0)
@@ -241,9 +262,7 @@ def main():
             "f.write('  time.sleep(0.3)\\n')",
             "f.close()",
         ]
-        for line in file_lines:
-            ser.write(line.encode() + b"\r\n")
-            time.sleep(0.3)
+        send_lines(ser, file_lines, per_line=0.3)
 
         log("  main.py written. Attempting soft reset...")
         # machine.soft_reset() is different from RTS toggle
@@ -14,52 +14,107 @@ Plan:
 Also tests: sending exec code WITHOUT entering upload mode first.
 """
 
+import atexit
 import serial
 import time
-import subprocess
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_ble.log"
+LOGFH = None  # opened once by main(), flushed and closed at exit
 
 def log(msg):
     print(msg)
-    with open(LOGFILE, "a") as f:
-        f.write(f"{msg}\n")
+    LOGFH.write(f"{msg}\n")
 
-def read_all(ser, timeout=2.0):
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
+IDLE_GAP = 0.1  # seconds of silence after data that ends a reply
+
+def read_all(ser, timeout=2.0, idle=IDLE_GAP):
+    """Read until timeout, or until the line goes quiet once data has arrived.
+
+    Relies on ser.timeout (set in main) to block inside ser.read() instead
+    of spinning on in_waiting.
+    """
+    hard_end = time.monotonic() + timeout
+    end = hard_end
+    buf = bytearray()
+    while time.monotonic() < end:
+        chunk = ser.read(4096)
+        if chunk:
+            buf.extend(chunk)
+            end = min(hard_end, time.monotonic() + idle)
+    return bytes(buf)
+
+def drain(ser, max_ms=50):
+    """Read and discard pending input until the line is quiet for 20ms.
+
+    Used instead of reset_input_buffer(): no TCFLSH ioctl, and anything
+    still in flight is consumed rather than racing the flush.
+    """
+    end = time.monotonic() + max_ms / 1000
+    while time.monotonic() < end:
         n = ser.in_waiting
         if n:
-            buf += ser.read(n)
-        time.sleep(0.01)
-    return buf
+            ser.read(n)
+            continue
+        time.sleep(0.02)
+        if not ser.in_waiting:
+            break
+
+def read_until_marker(ser, marker, timeout):
+    """Read until marker is seen or timeout expires; returns everything read."""
+    end = time.monotonic() + timeout
+    buf = bytearray()
+    while time.monotonic() < end:
+        chunk = ser.read(4096)
+        if chunk:
+            buf.extend(chunk)
+            if marker in buf:
+                break
+    return bytes(buf)
 
 def enter_repl(ser):
-    ser.reset_input_buffer()
+    """Switch to upload mode and wait for the >>> prompt (7s worst case)."""
+    drain(ser)
     ser.write(b"mode upload\r\n")
-    time.sleep(2.0)
-    ser.reset_input_buffer()
+    read_until_marker(ser, b"upload", 2.0)
+    drain(ser)
     ser.write(b"\x01")
-    time.sleep(2.0)
-    resp = read_all(ser, 3.0)
+    resp = read_until_marker(ser, b">>>", 5.0)
     return b">>>" in resp
 
+def exec_raw(ser, lines, timeout=5.0):
+    """Run a block of REPL lines as one raw-REPL (Ctrl-A ... Ctrl-D) exec.
+
+    Returns the raw-REPL reply: b"OK<stdout>\\x04<stderr>\\x04>".
+    Leaves the device back at the friendly >>> prompt.
+    """
+    for line in lines:
+        log(f"  Sending: {line}")
+    ser.write(b"\x01")
+    read_until_marker(ser, b"raw REPL", 1.0)
+    ser.write("\n".join(lines).encode() + b"\x04")
+    resp = read_until_marker(ser, b"\x04>", timeout)
+    ser.write(b"\x02")
+    read_until_marker(ser, b">>>", 1.0)
+    return resp
+
 def send(ser, cmd, delay=0.5):
+    """Send one REPL line; delay + 0.3s is the upper bound on the reply wait."""
     ser.write(cmd.encode() + b"\r\n")
-    time.sleep(delay)
-    return read_all(ser, 0.3)
+    return read_all(ser, delay + 0.3)
 
 def main():
-    with open(LOGFILE, "w") as f:
-        f.write(f"=== CyberPi BLE Bridge Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+    global LOGFH
+    LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+    atexit.register(LOGFH.close)
+    LOGFH.write(f"=== CyberPi BLE Bridge Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
 
     ser = serial.Serial()
     ser.port = PORT
     ser.baudrate = BAUD
-    ser.timeout = 0.01
+    ser.timeout = 0.05
+    ser.write_timeout = 0.5
     ser.dtr = False
     ser.rts = False
     ser.open()
@@ -72,7 +127,7 @@ def main():
     time.sleep(0.1)
     ser.rts = False
     time.sleep(5.0)
-    ser.reset_input_buffer()
+    drain(ser)
 
     # ========================================
     # TEST A: Try BLE from REPL
@@ -92,14 +147,6 @@ def main():
             # If we get here, BLE is working
             "cyberpi.led.on(0, 255, 0)",  # Green = BLE active
         ]
-        for cmd in ble_setup:
-            log(f"  Sending: {cmd}")
-            resp = send(ser, cmd, 0.8)
-            if resp:
-                log(f"    Response: {resp!r}")
-
-        log("  LED should be GREEN if BLE activated, MAGENTA if it failed")
-        time.sleep(1.0)
 
         # Set up BLE GATT server with sensor characteristic
         log("\n  Setting up BLE GATT service...")
@@ -116,11 +163,9 @@ def main():
             # Yellow LED = advertising
             "cyberpi.led.on(255, 255, 0)",
         ]
-        for cmd in gatt_setup:
-            log(f"  Sending: {cmd}")
-            resp = send(ser, cmd, 0.5)
-            if resp:
-                log(f"    Response: {resp!r}")
+        resp = exec_raw(ser, ble_setup + gatt_setup)
+        if resp:
+            log(f"    Response: {resp!r}")
 
         log("\n  BLE GATT setup sent. LED should be:")
         log("    YELLOW = BLE advertising as 'mBot'")
@@ -129,17 +174,30 @@ def main():
 
         # Start sensor streaming loop
         log("\n  Starting sensor data write loop...")
+        # Timer-driven: one preallocated buffer updated in place every 50ms,
+        # so the loop does not allocate and the REPL stays responsive.
+        # ESP32 has no virtual Timer(-1); hardware timer 0 is used instead.
+        # Four samples share one 20-byte notification: u32 ticks_ms of the
+        # last sample, then four (loudness, brightness) u16 pairs taken 50ms
+        # apart, oldest first (decoded by cyberpi_ble_discover.SENSOR_PACKET).
         sensor_loop = (
-            "import time\n"
-            "while True:\n"
+            "from machine import Timer\n"
+            "from time import ticks_ms\n"
+            "sensor_buf = bytearray(20)\n"
+            "sensor_n = 0\n"
+            "def sensor_tick(t):\n"
+            "  global sensor_n\n"
             "  try:\n"
-            "    snd = cyberpi.get_loudness()\n"
-            "    lgt = cyberpi.get_brightness()\n"
-            "    data = struct.pack('<HH', snd, lgt)\n"
-            "    ble.gatts_write(sensor_handle, data)\n"
-            "    ble.gatts_notify(0, sensor_handle, data)\n"
+            "    struct.pack_into('<HH', sensor_buf, 4 + 4 * sensor_n, cyberpi.get_loudness(), cyberpi.get_brightness())\n"
+            "    sensor_n += 1\n"
+            "    if sensor_n == 4:\n"
+            "      sensor_n = 0\n"
+            "      struct.pack_into('<I', sensor_buf, 0, ticks_ms())\n"
+            "      ble.gatts_write(sensor_handle, sensor_buf)\n"
+            "      ble.gatts_notify(0, sensor_handle, sensor_buf)\n"
             "  except: pass\n"
-            "  time.sleep_ms(50)\n"
+            "sensor_timer = Timer(0)\n"
+            "sensor_timer.init(period=50, mode=Timer.PERIODIC, callback=sensor_tick)\n"
         )
         # Send as exec() one-liner
         exec_cmd = "exec('" + sensor_loop.replace("'", "\\'").replace("\n", "\\n") + "')"
@@ -161,43 +219,34 @@ def main():
     # ========================================
     log("\n=== TEST B: BLE scan from laptop ===")
     try:
-        # Use bluetoothctl to scan
-        result = subprocess.run(
-            ["timeout", "5", "bluetoothctl", "scan", "on"],
-            capture_output=True, text=True, timeout=10
-        )
-        log(f"  BLE scan output:\n{result.stdout[:500]}")
-    except Exception as e:
-        log(f"  bluetoothctl scan failed: {e}")
-
-    # Also try hcitool
-    try:
-        result = subprocess.run(
-            ["timeout", "5", "hcitool", "lescan"],
-            capture_output=True, text=True, timeout=10
-        )
-        for line in result.stdout.split('\n'):
-            if 'mbot' in line.lower() or 'mBot' in line or 'cyber' in line.lower():
-                log(f"  *** FOUND BLE DEVICE: {line} ***")
-        log(f"  hcitool output ({len(result.stdout)} chars)")
-    except Exception as e:
-        log(f"  hcitool scan failed: {e}")
-
-    # Try Python BLE scan
-    try:
-        log("\n  Trying Python BLE scan (bleak)...")
+        log("  Scanning with bleak (up to 5s, stops at first mBot/CyberPi)...")
         import asyncio
 
         async def scan():
             try:
                 from bleak import BleakScanner
-                devices = await BleakScanner.discover(timeout=5.0)
-                for d in devices:
-                    if 'mbot' in (d.name or '').lower() or 'cyber' in (d.name or '').lower():
-                        log(f"  *** FOUND: {d.name} ({d.address}) RSSI:{d.rssi} ***")
-                    elif d.name:
-                        log(f"    BLE: {d.name} ({d.address})")
-                if not devices:
+                seen = set()
+                found = asyncio.Event()
+
+                def on_detect(d, adv):
+                    if d.address in seen:
+                        return
+                    seen.add(d.address)
+                    name = d.name or adv.local_name or ""
+                    if 'mbot' in name.lower() or 'cyber' in name.lower():
+                        log(f"  *** FOUND: {name} ({d.address}) RSSI:{adv.rssi} ***")
+                        found.set()
+                    elif name:
+                        log(f"    BLE: {name} ({d.address}) RSSI:{adv.rssi}")
+
+                scanner = BleakScanner(detection_callback=on_detect)
+                await scanner.start()
+                try:
+                    await asyncio.wait_for(found.wait(), 5.0)
+                except asyncio.TimeoutError:
+                    pass
+                await scanner.stop()
+                if not seen:
                     log("    No BLE devices found")
             except ImportError:
                 log("    bleak not installed. pip install bleak")
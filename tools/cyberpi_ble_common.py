@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+CyberPi BLE shared connection
+
+One place to open the BLE connection so the discover / UART / handshake
+tools can run back to back on a single link instead of each paying its own
+scan + connect + service discovery, plus the f3 sweep the handshake and
+protocol-map tools share.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from bleak import BleakClient
+
+DEVICE_ADDR = "10:97:BD:8F:4D:D2"
+
+@asynccontextmanager
+async def session(address=DEVICE_ADDR, timeout=15.0):
+    """Connected BleakClient; services are resolved once on connect and
+    cached on client.services for every phase that reuses the client."""
+    async with BleakClient(address, timeout=timeout) as client:
+        yield client
+
+async def negotiate_chunk(client):
+    """Largest write-without-response payload for this connection (ATT MTU - 3)."""
+    backend = getattr(client, "_backend", None)
+    if hasattr(backend, "_acquire_mtu"):
+        # BlueZ only reports the real MTU after it has been acquired
+        try:
+            await backend._acquire_mtu()
+        except Exception:
+            pass
+    return max(20, (client.mtu_size or 23) - 3)
+
+async def write_chunked(client, char, data, chunk):
+    """Write data to char in `chunk`-byte write-without-response pieces
+    (see negotiate_chunk)."""
+    for i in range(0, len(data), chunk):
+        await client.write_gatt_char(char, data[i:i + chunk], response=False)
+
+async def _hci(*args):
+    proc = await asyncio.create_subprocess_exec(
+        "hcitool", *args, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL)
+    out, _ = await proc.communicate()
+    return proc.returncode, out.decode(errors="replace")
+
+async def tune_connection(client, log=print, interval_units=6):
+    """Ask for a 7.5ms connection interval and the LE 2M PHY.
+
+    Best effort: needs hcitool and permission to issue HCI commands, and
+    the peripheral may still reject either request. Without it the link
+    stays at the peripheral's default interval on the 1M PHY.
+    """
+    try:
+        _, out = await _hci("con")
+        handle = None
+        for line in out.splitlines():
+            if client.address.upper() in line.upper() and "handle" in line:
+                handle = int(line.split("handle")[1].split()[0])
+                break
+        if handle is None:
+            log("  Connection tuning: handle not found, keeping defaults")
+            return
+        # Interval in 1.25ms units, supervision timeout in 10ms units
+        rc, _ = await _hci("lecup", "--handle", str(handle),
+                           "--min", str(interval_units), "--max", str(interval_units),
+                           "--latency", "0", "--timeout", "500")
+        log(f"  Connection interval: requested {interval_units * 1.25:.2f}ms"
+            f"{'' if rc == 0 else ' (rejected)'}")
+        # HCI LE Set PHY (OGF 0x08, OCF 0x0032): handle, all_phys=0,
+        # tx_phys=rx_phys=2M, phy_options=0
+        rc, _ = await _hci("cmd", "0x08", "0x0032",
+                           f"0x{handle & 0xff:02x}", f"0x{handle >> 8:02x}",
+                           "0x00", "0x02", "0x02", "0x00", "0x00")
+        log(f"  PHY: requested LE 2M{'' if rc == 0 else ' (rejected)'}")
+    except Exception as e:
+        log(f"  Connection tuning failed ({e})")
+
+# Sweep frames awaiting a reply, as (key, frame, future): a reply frame is
+# routed to the pending frame whose key follows its f3 head, and an exact
+# echo of a pending frame is skipped. sweep() never has two frames with the
+# same key in flight, so the match is unambiguous; a reply that matches no
+# pending frame is kept in UNATTRIBUTED instead of guessed. Key None takes
+# any reply, f3 or not (sweep() re-probes a frame alone with it)
+PENDING = []
+UNATTRIBUTED = []
+STRAY = []  # time.monotonic() of every unattributed reply or non-f3 data
+SWEEP_BUF = bytearray()
+SWEEP_OPEN = False  # True from the first write of a sweep until it returns
+
+def take_f3_frames(buf):
+    """Remove every complete f3 ... f4 frame from the bytearray buf.
+
+    Returns (frames, other): the frames, and the bytes around them that are
+    not part of any frame. A trailing partial frame is left in buf.
+    """
+    frames, other = [], bytearray()
+    pos = 0
+    while True:
+        start = buf.find(b"\xf3", pos)
+        end = buf.find(b"\xf4", start + 1) if start != -1 else -1
+        if end == -1:
+            # Keep an unfinished frame for the next notification
+            stop = len(buf) if start == -1 else start
+            other += buf[pos:stop]
+            pos = stop
+            break
+        other += buf[pos:start]
+        frames.append(bytes(buf[start:end + 1]))
+        pos = end + 1
+    del buf[:pos]
+    return frames, bytes(other)
+
+def _resolve(fut, reply):
+    PENDING[:] = [p for p in PENDING if p[2] is not fut]
+    if not fut.done():
+        fut.set_result(reply)
+
+def feed_sweep(data, log=print):
+    """Route a notification's bytes to the running sweep; call it from the
+    notify handler. Returns False, doing nothing, while no sweep runs."""
+    if not SWEEP_OPEN:
+        return False
+    SWEEP_BUF.extend(data)
+    frames, other = take_f3_frames(SWEEP_BUF)
+    catch_all = next((fut for key, _, fut in PENDING if key is None), None)
+    if other:
+        if catch_all is not None:
+            _resolve(catch_all, other)
+            catch_all = None
+        else:
+            log(f"  Non-f3 data during sweep: {other.hex(' ')}")
+            STRAY.append(time.monotonic())
+    sent = {frame for _, frame, _ in PENDING}
+    for frame in frames:
+        if frame in sent:
+            continue  # the device echoing a frame back is not its reply
+        fut = next((f for k, _, f in PENDING
+                    if k is None or frame[1:1 + len(k)] == k), None)
+        if fut is None:
+            UNATTRIBUTED.append(frame)
+            STRAY.append(time.monotonic())
+            log(f"  Unattributed reply during sweep: {frame.hex(' ')}")
+            continue
+        _resolve(fut, frame)
+    return True
+
+async def sweep(write, frames, timeout, inflight, keys=None):
+    """Pipeline frames through the coroutine function write(frame) with at
+    most `inflight` awaiting a reply (fed in by feed_sweep).
+
+    keys[i] is the bytes frame i's reply carries after its f3 head (default:
+    the frame's type byte). A frame left without a reply while unattributed
+    or non-f3 data came in (up to `timeout` after it gave up) is then sent
+    again on its own and credited with whatever comes back, as
+    cyberpi_serial_common.probe_burst does, so a reply in another format is
+    neither lost nor guessed. Returns one reply (or None) per input frame,
+    in input order.
+    """
+    if keys is None:
+        keys = [frame[1:2] for frame in frames]
+    sem = asyncio.Semaphore(inflight)
+    locks = {key: asyncio.Lock() for key in keys}
+    loop = asyncio.get_running_loop()
+    results = [None] * len(frames)
+    windows = {}  # frame index -> (sent, gave up) for frames without a reply
+
+    async def ask(frame, key):
+        fut = loop.create_future()
+        PENDING.append((key, frame, fut))
+        await write(frame)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            PENDING[:] = [p for p in PENDING if p[2] is not fut]
+            return None
+
+    async def one(i, frame, key):
+        # Frames sharing a key go one at a time, so a reply is never
+        # credited to the wrong one of them
+        async with locks[key], sem:
+            sent = time.monotonic()
+            results[i] = await ask(frame, key)
+            if results[i] is None:
+                windows[i] = (sent, time.monotonic())
+
+    global SWEEP_OPEN
+    SWEEP_BUF.clear()
+    del STRAY[:]
+    SWEEP_OPEN = True
+    try:
+        await asyncio.gather(*(one(i, f, k) for i, (f, k) in enumerate(zip(frames, keys))))
+        if STRAY:
+            # Late replies to the last frames arrive within one more timeout
+            await asyncio.sleep(timeout)
+            stray = list(STRAY)
+            for i in sorted(windows):
+                sent, gave_up = windows[i]
+                if any(sent <= t <= gave_up + timeout for t in stray):
+                    SWEEP_BUF.clear()
+                    results[i] = await ask(frames[i], None)
+    finally:
+        SWEEP_OPEN = False
+    return results
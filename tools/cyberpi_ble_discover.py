@@ -11,35 +11,198 @@ without any serial hacking.
 """
 
 import asyncio
+import atexit
+import struct
 import sys
-from bleak import BleakClient, BleakScanner
+from bleak import BleakScanner
+from cyberpi_ble_common import session
 
 LOGFILE = "/tmp/cyberpi_ble_discover.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
+
+# Precompiled decoders for characteristic values
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+F32 = struct.Struct('<f')
+
+# Sensor characteristic registered by cyberpi_ble_bridge.py: u32 ticks_ms
+# followed by four (loudness, brightness) u16 pairs per notification
+SENSOR_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
+SENSOR_PACKET = struct.Struct('<I8H')
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    LOGFH.flush()
+
+async def explore(client):
+    """Enumerate and probe the GATT table of an already-connected client."""
+    log(f"MTU: {client.mtu_size}")
+
+    # Read every readable characteristic and every descriptor up
+    # front, concurrently; logging below walks the results in order
+    targets = [c for svc in client.services for c in svc.characteristics
+               if "read" in c.properties]
+    descs = [d for svc in client.services for c in svc.characteristics
+             for d in c.descriptors]
+    results = await asyncio.gather(
+        *(client.read_gatt_char(c) for c in targets),
+        *(client.read_gatt_descriptor(d.handle) for d in descs),
+        return_exceptions=True,
+    )
+    char_values = {c.handle: v for c, v in zip(targets, results)}
+    desc_values = {d.handle: v for d, v in zip(descs, results[len(targets):])}
+
+    # Enumerate all services
+    log(f"\n=== GATT Services ({len(client.services.services)}) ===\n")
+
+    for service in client.services:
+        log(f"Service: {service.uuid}")
+        log(f"  Description: {service.description}")
+        log(f"  Handle: {service.handle}")
+
+        for char in service.characteristics:
+            props = ", ".join(char.properties)
+            log(f"\n  Characteristic: {char.uuid}")
+            log(f"    Description: {char.description}")
+            log(f"    Properties: {props}")
+            log(f"    Handle: {char.handle}")
+
+            # Try to read if readable
+            if "read" in char.properties:
+                try:
+                    value = char_values[char.handle]
+                    if isinstance(value, Exception):
+                        raise value
+                    # Try to decode as text
+                    try:
+                        text = value.decode('utf-8')
+                    except UnicodeDecodeError:
+                        text = None
+                    if text is not None and text.isprintable():
+                        log(f"    Value ({len(value)} bytes): {value.hex(' ')}")
+                        log(f"    Text: {text!r}")
+                    else:
+                        log(f"    Value ({len(value)} bytes): {value.hex()}")
+                    # Try to decode as numbers
+                    if len(value) == 2:
+                        val = U16.unpack(value)[0]
+                        log(f"    uint16: {val}")
+                    elif len(value) == 4:
+                        val = F32.unpack(value)[0]
+                        log(f"    float32: {val}")
+                        val2 = U32.unpack(value)[0]
+                        log(f"    uint32: {val2}")
+                except Exception as e:
+                    log(f"    Read error: {e}")
+
+            # List descriptors
+            for desc in char.descriptors:
+                log(f"    Descriptor: {desc.uuid}")
+                log(f"      Description: {desc.description}")
+                try:
+                    value = desc_values[desc.handle]
+                    if isinstance(value, Exception):
+                        raise value
+                    log(f"      Value: {value.hex(' ')}")
+                except Exception as e:
+                    log(f"      Read error: {e}")
+
+        log("")
+
+    # Try subscribing to notify characteristics
+    log("\n=== Testing Notify Characteristics ===\n")
+
+    notify_chars = []
+    for service in client.services:
+        for char in service.characteristics:
+            if "notify" in char.properties or "indicate" in char.properties:
+                notify_chars.append(char)
+
+    if notify_chars:
+        received_data = {}
+
+        for char in notify_chars:
+            log(f"Subscribing to notifications: {char.uuid}...")
+
+            def make_handler(uuid):
+                def handler(sender, data):
+                    if uuid not in received_data:
+                        received_data[uuid] = []
+                    received_data[uuid].append(data)
+                return handler
+
+            try:
+                await client.start_notify(char, make_handler(char.uuid))
+                log(f"  Subscribed to {char.uuid}")
+            except Exception as e:
+                log(f"  Subscribe error: {e}")
+
+        # Wait for notifications
+        log(f"\nWaiting 5 seconds for notifications...")
+        await asyncio.sleep(5.0)
+
+        # Report what we received
+        for uuid, data_list in received_data.items():
+            log(f"\n  {uuid}: received {len(data_list)} notifications")
+            for i, data in enumerate(data_list[:5]):
+                log(f"    [{i}] {data.hex(' ')} ({len(data)} bytes)")
+                # Bridge sensor packets carry 4 samples each
+                if uuid == SENSOR_CHAR_UUID and len(data) == SENSOR_PACKET.size:
+                    ts, *vals = SENSOR_PACKET.unpack(data)
+                    log(f"         t={ts}ms sound/light: {list(zip(vals[::2], vals[1::2]))}")
+                # Try decoding
+                try:
+                    text = data.decode('utf-8')
+                    if text.isprintable():
+                        log(f"         Text: {text!r}")
+                except:
+                    pass
+
+        # Unsubscribe
+        for char in notify_chars:
+            try:
+                await client.stop_notify(char)
+            except:
+                pass
+
+    else:
+        log("No notify/indicate characteristics found.")
+
+    # Check for our custom service (from the BLE bridge test)
+    custom_uuid = "12345678-1234-5678-1234-56789abcdef0"
+    for service in client.services:
+        if custom_uuid in service.uuid:
+            log(f"\n*** CUSTOM SERVICE FOUND: {service.uuid} ***")
+            log("*** Our BLE bridge setup worked! ***")
 
 async def main():
     log(f"=== CyberPi BLE Discovery ===\n")
 
     # Scan for CyberPi
     log("Scanning for Makeblock BLE devices...")
-    devices = await BleakScanner.discover(timeout=10.0)
-
+    # Stop scanning at the first match; 10s is only the upper bound
+    found = asyncio.Event()
     target = None
-    for d in devices:
-        name = d.name or ""
-        if "makeblock" in name.lower() or "mbot" in name.lower() or "cyber" in name.lower():
+
+    def on_detect(d, adv):
+        nonlocal target
+        name = (d.name or "").lower()
+        if target is None and ("makeblock" in name or "mbot" in name or "cyber" in name):
             log(f"  FOUND: {d.name} ({d.address})")
             target = d
-        elif d.name:
-            pass  # skip other devices
+            found.set()
+
+    scanner = BleakScanner(detection_callback=on_detect)
+    await scanner.start()
+    try:
+        await asyncio.wait_for(found.wait(), 10.0)
+    except asyncio.TimeoutError:
+        pass
+    await scanner.stop()
 
     if not target:
         log("No Makeblock BLE device found!")
@@ -50,125 +213,10 @@ async def main():
     log(f"\nConnecting to {target.name} ({target.address})...")
 
     try:
-        async with BleakClient(target.address, timeout=15.0) as client:
-            log(f"Connected! MTU: {client.mtu_size}")
-
-            # Enumerate all services
-            log(f"\n=== GATT Services ({len(client.services.services)}) ===\n")
-
-            for service in client.services:
-                log(f"Service: {service.uuid}")
-                log(f"  Description: {service.description}")
-                log(f"  Handle: {service.handle}")
-
-                for char in service.characteristics:
-                    props = ", ".join(char.properties)
-                    log(f"\n  Characteristic: {char.uuid}")
-                    log(f"    Description: {char.description}")
-                    log(f"    Properties: {props}")
-                    log(f"    Handle: {char.handle}")
-
-                    # Try to read if readable
-                    if "read" in char.properties:
-                        try:
-                            value = await client.read_gatt_char(char)
-                            log(f"    Value ({len(value)} bytes): {value.hex(' ')}")
-                            # Try to decode as text
-                            try:
-                                text = value.decode('utf-8')
-                                if text.isprintable():
-                                    log(f"    Text: {text!r}")
-                            except:
-                                pass
-                            # Try to decode as numbers
-                            if len(value) == 2:
-                                import struct
-                                val = struct.unpack('<H', value)[0]
-                                log(f"    uint16: {val}")
-                            elif len(value) == 4:
-                                import struct
-                                val = struct.unpack('<f', value)[0]
-                                log(f"    float32: {val}")
-                                val2 = struct.unpack('<I', value)[0]
-                                log(f"    uint32: {val2}")
-                        except Exception as e:
-                            log(f"    Read error: {e}")
-
-                    # List descriptors
-                    for desc in char.descriptors:
-                        log(f"    Descriptor: {desc.uuid}")
-                        log(f"      Description: {desc.description}")
-                        try:
-                            value = await client.read_gatt_descriptor(desc.handle)
-                            log(f"      Value: {value.hex(' ')}")
-                        except Exception as e:
-                            log(f"      Read error: {e}")
-
-                log("")
-
-            # Try subscribing to notify characteristics
-            log("\n=== Testing Notify Characteristics ===\n")
-
-            notify_chars = []
-            for service in client.services:
-                for char in service.characteristics:
-                    if "notify" in char.properties or "indicate" in char.properties:
-                        notify_chars.append(char)
-
-            if notify_chars:
-                received_data = {}
-
-                for char in notify_chars:
-                    log(f"Subscribing to notifications: {char.uuid}...")
-
-                    def make_handler(uuid):
-                        def handler(sender, data):
-                            if uuid not in received_data:
-                                received_data[uuid] = []
-                            received_data[uuid].append(data)
-                        return handler
-
-                    try:
-                        await client.start_notify(char, make_handler(char.uuid))
-                        log(f"  Subscribed to {char.uuid}")
-                    except Exception as e:
-                        log(f"  Subscribe error: {e}")
-
-                # Wait for notifications
-                log(f"\nWaiting 5 seconds for notifications...")
-                await asyncio.sleep(5.0)
-
-                # Report what we received
-                for uuid, data_list in received_data.items():
-                    log(f"\n  {uuid}: received {len(data_list)} notifications")
-                    for i, data in enumerate(data_list[:5]):
-                        log(f"    [{i}] {data.hex(' ')} ({len(data)} bytes)")
-                        # Try decoding
-                        try:
-                            text = data.decode('utf-8')
-                            if text.isprintable():
-                                log(f"         Text: {text!r}")
-                        except:
-                            pass
-
-                # Unsubscribe
-                for char in notify_chars:
-                    try:
-                        await client.stop_notify(char)
-                    except:
-                        pass
-
-            else:
-                log("No notify/indicate characteristics found.")
-
-            # Check for our custom service (from the BLE bridge test)
-            custom_uuid = "12345678-1234-5678-1234-56789abcdef0"
-            for service in client.services:
-                if custom_uuid in service.uuid:
-                    log(f"\n*** CUSTOM SERVICE FOUND: {service.uuid} ***")
-                    log("*** Our BLE bridge setup worked! ***")
-
-            log(f"\nDisconnecting...")
+        async with session(target.address) as client:
+            log(f"Connected!")
+            await explore(client)
+        log("\nDisconnected.")
 
     except Exception as e:
         log(f"Connection failed: {e}")
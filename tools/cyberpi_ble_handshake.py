@@ -8,114 +8,179 @@ The handshake might "unlock" the text protocol on BLE.
 
 import asyncio
 import time
-from bleak import BleakClient
+from cyberpi_ble_common import (DEVICE_ADDR, feed_sweep, negotiate_chunk, session,
+                                tune_connection, write_chunked)
+from cyberpi_ble_common import sweep as sweep_frames
 
-DEVICE_ADDR = "10:97:BD:8F:4D:D2"
 NOTIFY_UUID = "0000ffe2-0000-1000-8000-00805f9b34fb"
 WRITE_UUID = "0000ffe3-0000-1000-8000-00805f9b34fb"
 
 RX = []
 
+# Step 5 sweep: f3 types just above the known f5/f6 handshake commands
+SWEEP_TYPES = range(0xf7, 0x100)
+SWEEP_PAYLOADS = [b"\x00", b"\x01", b"\x02\x00\x08",
+                  b"\x03\x00\x0d\x00\x00\x0d",
+                  b"\x01\x00\x00\x00"]
+
+SWEEP_INFLIGHT = 4         # frames allowed to await a reply at once
+SWEEP_REPLY_TIMEOUT = 0.15  # seconds to wait for each frame's reply
+
+WRITE_CHUNK = 20  # default ATT payload; raised to MTU-3 after connect
+WRITE_CHAR = WRITE_UUID  # replaced by the resolved characteristic after connect
+
 def log(msg):
     print(msg)
 
+# Maps every byte that is not printable ASCII (or \n \r) to '.'
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\n\r" else 0x2e for b in range(256))
+
 def on_notify(sender, data):
-    RX.append(data)
-    text = data.decode('utf-8', errors='replace')
-    printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
-    log(f"  <<< [{len(data)}] HEX: {data.hex(' ')}")
-    if printable.strip():
-        log(f"      TXT: {printable.strip()}")
+    # While a sweep runs, feed_sweep routes and logs the data
+    if not feed_sweep(data, log):
+        RX.append(data)
+
+def dump(rx):
+    """Log captured notifications once collection is done."""
+    for data in rx:
+        log(f"  <<< [{len(data)}] HEX: {data.hex(' ')}")
+        printable = data.translate(PRINTABLE).decode('ascii')
+        if printable.strip():
+            log(f"      TXT: {printable.strip()}")
+
+def flush_rx():
+    """Log notifications that arrived since the last collection, then clear
+    RX, so nothing that came in between commands goes unreported."""
+    if RX:
+        log(f"  ({len(RX)} notifications since the last command)")
+        dump(RX)
+        RX.clear()
+
+def f3_frame(cmd_type, payload):
+    return bytes([0xf3, cmd_type]) + payload + b"\xf4"
+
+async def sweep(client, frames, inflight=SWEEP_INFLIGHT, timeout=SWEEP_REPLY_TIMEOUT):
+    """Pipeline frames with at most `inflight` awaiting a reply (see
+    cyberpi_ble_common.sweep). Returns one reply frame (or None) per input
+    frame, in input order."""
+    async def write(frame):
+        await write_chunked(client, WRITE_CHAR, frame, WRITE_CHUNK)
+    return await sweep_frames(write, frames, timeout, inflight)
+
+async def send_variants(client, variants, label, timeout=0.3):
+    """Send variants one at a time, each waiting up to `timeout` for its reply.
+
+    The variants share a type byte (and mostly their opcode bytes), so a
+    reply could not be told apart if several were in flight at once.
+    """
+    log(f"\n>>> {label}: {len(variants)} frames, one in flight")
+    replies = await sweep(client, variants, inflight=1, timeout=timeout)
+    for variant, reply in zip(variants, replies):
+        log(f"  {label}: {variant.hex(' ')} -> {reply.hex(' ') if reply else '(no response)'}")
+    return replies
 
 async def tx(client, data, label="", wait=1.0):
-    global RX
-    RX.clear()
+    flush_rx()
     if isinstance(data, str):
         data = data.encode()
     log(f"\n>>> {label} TX: {data!r}")
-    await client.write_gatt_char(WRITE_UUID, data, response=False)
+    await write_chunked(client, WRITE_CHAR, data, WRITE_CHUNK)
     await asyncio.sleep(wait)
+    dump(RX)
     result = b"".join(RX)
     if not RX:
         log("  (no response)")
+    RX.clear()
     return result
 
-async def main():
+async def run(client):
+    """Run the handshake tests on an already-connected client."""
+    global WRITE_CHUNK, WRITE_CHAR
     log(f"=== BLE Handshake + Protocol Test ===\n")
-    async with BleakClient(DEVICE_ADDR, timeout=15.0) as client:
-        log("Connected!")
-        await client.start_notify(NOTIFY_UUID, on_notify)
-        await asyncio.sleep(0.5)
-
-        # Step 1: f5 handshake
-        log("\n--- HANDSHAKE ---")
-        await tx(client, bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4]), "f5 handshake", 1.0)
-        await tx(client, bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]), "f6 config", 1.0)
-
-        # Step 2: Try text commands AFTER handshake
-        log("\n--- TEXT COMMANDS (post-handshake) ---")
-        await tx(client, "help\r\n", "help", 2.0)
-        await tx(client, "status\r\n", "status", 2.0)
-        await tx(client, "mode upload\r\n", "mode upload", 3.0)
-
-        # Step 3: Try Ctrl+A for REPL entry
-        log("\n--- REPL ENTRY (post-handshake) ---")
-        await tx(client, b"\x01", "Ctrl+A", 2.0)
-        await tx(client, b"\x02", "Ctrl+B", 2.0)
-
-        # Step 4: Try print if we might be in REPL
-        await tx(client, b"print('HELLO')\r\n", "print test", 2.0)
-
-        # Step 5: Try with different f3 frame after handshake
-        log("\n--- MORE F3 FRAMES (post-handshake) ---")
-
-        # Maybe there's a "start live mode" command
-        # Try f3 with types near f5/f6
-        for cmd_type in [0xf7, 0xf8, 0xf9, 0xfa, 0xfb, 0xfc, 0xfd, 0xfe, 0xff]:
-            for payload in [b"\x00", b"\x01", b"\x02\x00\x08",
-                           b"\x03\x00\x0d\x00\x00\x0d",
-                           b"\x01\x00\x00\x00"]:
-                resp = await tx(client, bytes([0xf3, cmd_type]) + payload + bytes([0xf4]),
-                               f"f3 {cmd_type:02x} {payload.hex()}", 0.2)
-                if resp:
-                    log(f"  *** GOT RESPONSE for f3 {cmd_type:02x} ***")
-
-        # Step 6: What about doing a second handshake with different values?
-        log("\n--- VARIED HANDSHAKES ---")
-        handshake_variants = [
-            bytes([0xf3, 0xf5, 0x01, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=01
-            bytes([0xf3, 0xf5, 0x02, 0x00, 0x04, 0xc0, 0xc8, 0xf4]),  # byte[4]=04
-            bytes([0xf3, 0xf5, 0x02, 0x00, 0x10, 0xc0, 0xc8, 0xf4]),  # byte[4]=10
-            bytes([0xf3, 0xf5, 0x02, 0x01, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[3]=01
-            bytes([0xf3, 0xf5, 0x03, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=03
-            bytes([0xf3, 0xf5, 0x04, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=04
-        ]
-        for variant in handshake_variants:
-            resp = await tx(client, variant, f"f5 variant: {variant.hex(' ')}", 0.5)
-
-        # Step 7: Try the f6 with different configs
-        log("\n--- VARIED CONFIGS ---")
-        config_variants = [
-            bytes([0xf3, 0xf6, 0x01, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-            bytes([0xf3, 0xf6, 0x02, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-            bytes([0xf3, 0xf6, 0x03, 0x01, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-            bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x01, 0x00, 0x0d, 0xf4]),
-            bytes([0xf3, 0xf6, 0x04, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-        ]
-        for variant in config_variants:
-            resp = await tx(client, variant, f"f6 variant: {variant.hex(' ')}", 0.5)
-
-        # Step 8: After all that, check for late notifications
-        log("\n--- FINAL LISTEN (3s) ---")
-        RX.clear()
-        await asyncio.sleep(3.0)
-        if RX:
-            for data in RX:
-                log(f"  Late data: {data.hex(' ')}")
-
-        await client.stop_notify(NOTIFY_UUID)
+    WRITE_CHUNK = await negotiate_chunk(client)
+    log(f"Write chunk: {WRITE_CHUNK} bytes")
+    # Resolve characteristics once so writes skip the per-call UUID lookup
+    WRITE_CHAR = client.services.get_characteristic(WRITE_UUID)
+    notify_char = client.services.get_characteristic(NOTIFY_UUID)
+    await client.start_notify(notify_char, on_notify)
+    await tune_connection(client, log)
+    await asyncio.sleep(0.5)
+    flush_rx()
+
+    # Step 1: f5 handshake
+    log("\n--- HANDSHAKE ---")
+    await tx(client, bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4]), "f5 handshake", 1.0)
+    await tx(client, bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]), "f6 config", 1.0)
+
+    # Step 2: Try text commands AFTER handshake
+    log("\n--- TEXT COMMANDS (post-handshake) ---")
+    await tx(client, "help\r\n", "help", 2.0)
+    await tx(client, "status\r\n", "status", 2.0)
+    await tx(client, "mode upload\r\n", "mode upload", 3.0)
+
+    # Step 3: Try Ctrl+A for REPL entry
+    log("\n--- REPL ENTRY (post-handshake) ---")
+    await tx(client, b"\x01", "Ctrl+A", 2.0)
+    await tx(client, b"\x02", "Ctrl+B", 2.0)
+
+    # Step 4: Try print if we might be in REPL
+    await tx(client, b"print('HELLO')\r\n", "print test", 2.0)
+
+    # Step 5: Try with different f3 frame after handshake
+    log("\n--- MORE F3 FRAMES (post-handshake) ---")
+
+    # Maybe there's a "start live mode" command
+    # Try f3 with types near f5/f6, pipelined SWEEP_INFLIGHT frames deep
+    frames = [f3_frame(t, p) for t in SWEEP_TYPES for p in SWEEP_PAYLOADS]
+    log(f"\n>>> f3 sweep {SWEEP_TYPES[0]:02x}-{SWEEP_TYPES[-1]:02x}: "
+        f"{len(frames)} frames, {SWEEP_INFLIGHT} in flight")
+    replies = await sweep(client, frames)
+    for frame, reply in zip(frames, replies):
+        if reply:
+            log(f"  *** GOT RESPONSE for f3 {frame[1]:02x} {frame[2:-1].hex()}: "
+                f"{reply.hex(' ')} ***")
+    if not any(replies):
+        log("  (no f3 responses)")
+
+    # Step 6: What about doing a second handshake with different values?
+    log("\n--- VARIED HANDSHAKES ---")
+    handshake_variants = [
+        bytes([0xf3, 0xf5, 0x01, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=01
+        bytes([0xf3, 0xf5, 0x02, 0x00, 0x04, 0xc0, 0xc8, 0xf4]),  # byte[4]=04
+        bytes([0xf3, 0xf5, 0x02, 0x00, 0x10, 0xc0, 0xc8, 0xf4]),  # byte[4]=10
+        bytes([0xf3, 0xf5, 0x02, 0x01, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[3]=01
+        bytes([0xf3, 0xf5, 0x03, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=03
+        bytes([0xf3, 0xf5, 0x04, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),  # byte[2]=04
+    ]
+    await send_variants(client, handshake_variants, "f5 variant")
+
+    # Step 7: Try the f6 with different configs
+    log("\n--- VARIED CONFIGS ---")
+    config_variants = [
+        bytes([0xf3, 0xf6, 0x01, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
+        bytes([0xf3, 0xf6, 0x02, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
+        bytes([0xf3, 0xf6, 0x03, 0x01, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
+        bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x01, 0x00, 0x0d, 0xf4]),
+        bytes([0xf3, 0xf6, 0x04, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
+    ]
+    await send_variants(client, config_variants, "f6 variant")
+
+    # Step 8: After all that, check for late notifications
+    flush_rx()
+    log("\n--- FINAL LISTEN (3s) ---")
+    await asyncio.sleep(3.0)
+    if RX:
+        for data in RX:
+            log(f"  Late data: {data.hex(' ')}")
+
+    await client.stop_notify(notify_char)
 
     log("\n=== COMPLETE ===")
 
+async def main():
+    async with session(DEVICE_ADDR) as client:
+        log("Connected!")
+        await run(client)
+
 if __name__ == "__main__":
     asyncio.run(main())
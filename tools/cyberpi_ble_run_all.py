@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+CyberPi BLE test driver
+
+Runs discovery, UART and handshake phases over one BLE connection.
+Each tool still runs standalone via its own __main__.
+"""
+
+import asyncio
+import cyberpi_ble_discover
+import cyberpi_ble_handshake
+import cyberpi_ble_uart
+from cyberpi_ble_common import DEVICE_ADDR, session
+
+async def main():
+    print(f"Connecting to {DEVICE_ADDR}...")
+    async with session(DEVICE_ADDR) as client:
+        print("Connected!")
+        await cyberpi_ble_discover.explore(client)
+        await cyberpi_ble_uart.run(client)
+        await cyberpi_ble_handshake.run(client)
+
+if __name__ == "__main__":
+    asyncio.run(main())
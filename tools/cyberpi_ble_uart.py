@@ -12,183 +12,228 @@ Let's test bidirectional communication via BLE.
 """
 
 import asyncio
+import atexit
 import time
-from bleak import BleakClient, BleakScanner
+from cyberpi_ble_common import DEVICE_ADDR, negotiate_chunk, session, tune_connection, write_chunked
 
-DEVICE_ADDR = "10:97:BD:8F:4D:D2"
 NOTIFY_UUID = "0000ffe2-0000-1000-8000-00805f9b34fb"
 WRITE_UUID = "0000ffe3-0000-1000-8000-00805f9b34fb"
 
 LOGFILE = "/tmp/cyberpi_ble_uart.log"
-LOG = []
-RX_DATA = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
+
+# Every notification of the session is appended to one contiguous buffer;
+# RX_OFFSETS holds (monotonic time, end offset in RX_BUF) per notification
+RX_BUF = bytearray()
+RX_OFFSETS = []
+
+# A reply is complete once the REPL prompt (or raw-REPL end marker) shows up
+REPLY_TERMINATORS = (b"\r\n>>> ", b"\x04>")
+REPLY_START = 0  # RX_BUF offset where the current command's reply begins
+REPLY_DONE = None  # asyncio.Event, created inside the running loop by run()
+WRITE_CHUNK = 20    # default ATT payload; raised to MTU-3 after connect
+WRITE_CHAR = WRITE_UUID  # replaced by the resolved characteristic after connect
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    LOGFH.flush()
+
+# Maps every byte that is not printable ASCII (or \t \n \r) to '.'
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\t\n\r" else 0x2e for b in range(256))
 
 def on_notify(sender, data):
-    """Callback for BLE notifications."""
-    timestamp = time.time()
-    RX_DATA.append((timestamp, data))
-    text = data.decode('utf-8', errors='replace')
-    log(f"  RX [{len(data)}]: {data.hex(' ')}")
-    printable = ''.join(c if c.isprintable() or c in '\n\r\t' else '.' for c in text)
-    if printable.strip():
-        log(f"      TXT: {printable.strip()!r}")
+    """Callback for BLE notifications. Formatting is deferred to dump()."""
+    RX_BUF.extend(data)
+    RX_OFFSETS.append((time.monotonic(), len(RX_BUF)))
+    # Search back far enough to catch a terminator split across notifications
+    since = max(REPLY_START, len(RX_BUF) - len(data) - 5)
+    if any(RX_BUF.find(t, since) != -1 for t in REPLY_TERMINATORS):
+        REPLY_DONE.set()
+
+def dump(first=0):
+    """Log notifications RX_OFFSETS[first:] once collection is done."""
+    start = RX_OFFSETS[first - 1][1] if first else 0
+    for _, end in RX_OFFSETS[first:]:
+        data = bytes(RX_BUF[start:end])
+        start = end
+        log(f"  RX [{len(data)}]: {data.hex(' ')}")
+        printable = data.translate(PRINTABLE).decode('ascii')
+        if printable.strip():
+            log(f"      TXT: {printable.strip()!r}")
 
 async def send_and_wait(client, data, label, wait=3.0):
-    """Send data and wait for notifications."""
-    global RX_DATA
-    RX_DATA.clear()
+    """Send data and wait for the reply prompt, giving up after `wait` seconds."""
+    global REPLY_START
+    REPLY_START = len(RX_BUF)
+    first = len(RX_OFFSETS)
+    REPLY_DONE.clear()
 
     log(f"\n--- {label} ---")
     if isinstance(data, str):
         data = data.encode()
     log(f"  TX [{len(data)}]: {data!r}")
 
-    await client.write_gatt_char(WRITE_UUID, data, response=False)
-    await asyncio.sleep(wait)
+    await write_chunked(client, WRITE_CHAR, data, WRITE_CHUNK)
+    try:
+        await asyncio.wait_for(REPLY_DONE.wait(), wait)
+    except asyncio.TimeoutError:
+        pass
 
-    if RX_DATA:
-        total = b"".join(d[1] for d in RX_DATA)
-        log(f"  Total RX: {len(total)} bytes in {len(RX_DATA)} notifications")
+    if len(RX_OFFSETS) > first:
+        dump(first)
+        total = bytes(RX_BUF[REPLY_START:])
+        log(f"  Total RX: {len(total)} bytes in {len(RX_OFFSETS) - first} notifications")
         return total
     else:
         log(f"  No response received")
         return b""
 
-async def main():
+async def run(client):
+    """Run the UART tests on an already-connected client."""
+    global REPLY_DONE, WRITE_CHUNK, WRITE_CHAR
+    REPLY_DONE = asyncio.Event()
     log(f"=== CyberPi BLE UART Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
 
-    log(f"Connecting to {DEVICE_ADDR}...")
-    async with BleakClient(DEVICE_ADDR, timeout=15.0) as client:
-        log(f"Connected!")
-
-        # Subscribe to notifications
-        await client.start_notify(NOTIFY_UUID, on_notify)
-        log("Subscribed to ffe2 notifications\n")
-
-        # Wait briefly for any initial data
-        await asyncio.sleep(1.0)
-        if RX_DATA:
-            log(f"Received {len(RX_DATA)} initial notifications")
-
-        # ========================================
-        # TEST 1: Text commands
-        # ========================================
-        log("\n=== TEST 1: Text commands ===")
-
-        resp = await send_and_wait(client, "help\r\n", "help", 2.0)
-        resp = await send_and_wait(client, "status\r\n", "status", 3.0)
-        resp = await send_and_wait(client, "version\r\n", "version", 2.0)
-
-        # ========================================
-        # TEST 2: mode upload + REPL entry
-        # ========================================
-        log("\n=== TEST 2: mode upload + REPL ===")
-
-        resp = await send_and_wait(client, "mode upload\r\n", "mode upload", 3.0)
-
-        # Ctrl+A (raw REPL or enter REPL)
-        resp = await send_and_wait(client, b"\x01", "Ctrl+A", 2.0)
-
-        # Check for >>> prompt
-        all_rx = b"".join(d[1] for d in RX_DATA)
-        if b">>>" in all_rx:
-            log("\n*** GOT REPL PROMPT VIA BLE! ***")
-
-        # ========================================
-        # TEST 3: REPL commands over BLE
-        # ========================================
-        log("\n=== TEST 3: REPL commands via BLE ===")
-
-        # Simple print
-        resp = await send_and_wait(client, "print('BLE_HELLO_12345')\r\n", "print test", 3.0)
-        if b"BLE_HELLO_12345" in resp:
-            log("\n*** PRINT OUTPUT RECEIVED VIA BLE! ***")
-
-        # Expression
-        resp = await send_and_wait(client, "2+2\r\n", "2+2", 2.0)
-        if b"4" in resp:
-            log("\n*** EXPRESSION RESULT RECEIVED! ***")
-
-        # Import and sensor read
-        resp = await send_and_wait(client, "import cyberpi\r\n", "import cyberpi", 2.0)
-        resp = await send_and_wait(client, "print(cyberpi.get_loudness())\r\n", "get_loudness", 2.0)
-        resp = await send_and_wait(client, "print(cyberpi.get_brightness())\r\n", "get_brightness", 2.0)
-
-        # LED test to confirm execution
-        resp = await send_and_wait(client, "cyberpi.led.on(0, 255, 0)\r\n", "LED green", 1.0)
-
-        # ========================================
-        # TEST 4: Raw REPL (Ctrl+A, send code + Ctrl+D)
-        # ========================================
-        log("\n=== TEST 4: Raw REPL via BLE ===")
-
-        # Enter raw REPL
-        resp = await send_and_wait(client, b"\x03", "Ctrl+C", 1.0)  # Interrupt
-        resp = await send_and_wait(client, b"\x01", "Ctrl+A raw REPL", 2.0)
-
-        # Send code + Ctrl+D
-        code = b"print('RAW_BLE_OK')\x04"
-        resp = await send_and_wait(client, code, "raw REPL print", 3.0)
-        if b"RAW_BLE_OK" in resp:
-            log("\n*** RAW REPL OUTPUT VIA BLE! ***")
-
-        # ========================================
-        # TEST 5: Sensor data read via BLE
-        # ========================================
-        log("\n=== TEST 5: Multi-sensor read ===")
-
-        # Back to normal REPL
-        resp = await send_and_wait(client, b"\x02", "Ctrl+B normal REPL", 2.0)
-
-        sensor_cmd = (
-            "import cyberpi, mbuild; "
-            "print('S:', cyberpi.get_loudness(), "
-            "cyberpi.get_brightness(), "
-            "cyberpi.get_gyro('x'), "
-            "cyberpi.get_gyro('y'), "
-            "cyberpi.get_gyro('z'))\r\n"
-        )
-        resp = await send_and_wait(client, sensor_cmd, "multi-sensor read", 3.0)
-        if b"S:" in resp:
-            log("\n*** SENSOR DATA RECEIVED VIA BLE! ***")
-
-        # ========================================
-        # TEST 6: f3 protocol commands
-        # ========================================
-        log("\n=== TEST 6: f3 protocol ===")
-
-        # Try sending f3 frames
-        f3_cmds = [
-            bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),
-            bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-            bytes([0xf3, 0x01, 0x00, 0xf4]),
-        ]
-        for cmd in f3_cmds:
-            resp = await send_and_wait(client, cmd, f"f3 frame: {cmd.hex(' ')}", 1.0)
-
-        # Turn off LED
-        await send_and_wait(client, "cyberpi.led.off()\r\n", "LED off", 0.5)
-
-        # Unsubscribe
-        await client.stop_notify(NOTIFY_UUID)
+    WRITE_CHUNK = await negotiate_chunk(client)
+    log(f"Write chunk: {WRITE_CHUNK} bytes")
+    # Resolve characteristics once so writes skip the per-call UUID lookup
+    WRITE_CHAR = client.services.get_characteristic(WRITE_UUID)
+    notify_char = client.services.get_characteristic(NOTIFY_UUID)
+
+    # Subscribe to notifications
+    # Notifications are unacknowledged; indications cost an ATT confirm per
+    # packet. WinRT honours force_indicate, BlueZ already prefers notify.
+    mode = "notify" if "notify" in notify_char.properties else "indicate"
+    await client.start_notify(notify_char, on_notify, force_indicate=False)
+    log(f"Subscription mode: {mode} (properties: {', '.join(notify_char.properties)})")
+    log("Subscribed to ffe2 notifications\n")
+    await tune_connection(client, log)
+
+    # Wait briefly for any initial data
+    await asyncio.sleep(1.0)
+    if RX_OFFSETS:
+        log(f"Received {len(RX_OFFSETS)} initial notifications")
+        dump()
+
+    # ========================================
+    # TEST 1: Text commands
+    # ========================================
+    log("\n=== TEST 1: Text commands ===")
+
+    resp = await send_and_wait(client, "help\r\n", "help", 2.0)
+    resp = await send_and_wait(client, "status\r\n", "status", 3.0)
+    resp = await send_and_wait(client, "version\r\n", "version", 2.0)
+
+    # ========================================
+    # TEST 2: mode upload + REPL entry
+    # ========================================
+    log("\n=== TEST 2: mode upload + REPL ===")
+
+    resp = await send_and_wait(client, "mode upload\r\n", "mode upload", 3.0)
+
+    # Ctrl+A (raw REPL or enter REPL)
+    resp = await send_and_wait(client, b"\x01", "Ctrl+A", 2.0)
+
+    # Check for >>> prompt
+    if b">>>" in resp:
+        log("\n*** GOT REPL PROMPT VIA BLE! ***")
+
+    # ========================================
+    # TEST 3: REPL commands over BLE
+    # ========================================
+    log("\n=== TEST 3: REPL commands via BLE ===")
+
+    # Simple print
+    resp = await send_and_wait(client, "print('BLE_HELLO_12345')\r\n", "print test", 3.0)
+    if b"BLE_HELLO_12345" in resp:
+        log("\n*** PRINT OUTPUT RECEIVED VIA BLE! ***")
+
+    # Expression
+    resp = await send_and_wait(client, "2+2\r\n", "2+2", 2.0)
+    if b"4" in resp:
+        log("\n*** EXPRESSION RESULT RECEIVED! ***")
+
+    # Import and sensor read
+    resp = await send_and_wait(client, "import cyberpi\r\n", "import cyberpi", 2.0)
+    resp = await send_and_wait(client, "print(cyberpi.get_loudness())\r\n", "get_loudness", 2.0)
+    resp = await send_and_wait(client, "print(cyberpi.get_brightness())\r\n", "get_brightness", 2.0)
+
+    # LED test to confirm execution
+    resp = await send_and_wait(client, "cyberpi.led.on(0, 255, 0)\r\n", "LED green", 1.0)
+
+    # ========================================
+    # TEST 4: Raw REPL (Ctrl+A, send code + Ctrl+D)
+    # ========================================
+    log("\n=== TEST 4: Raw REPL via BLE ===")
+
+    # Enter raw REPL
+    resp = await send_and_wait(client, b"\x03", "Ctrl+C", 1.0)  # Interrupt
+    resp = await send_and_wait(client, b"\x01", "Ctrl+A raw REPL", 2.0)
+
+    # Send code + Ctrl+D
+    code = b"print('RAW_BLE_OK')\x04"
+    resp = await send_and_wait(client, code, "raw REPL print", 3.0)
+    if b"RAW_BLE_OK" in resp:
+        log("\n*** RAW REPL OUTPUT VIA BLE! ***")
+
+    # ========================================
+    # TEST 5: Sensor data read via BLE
+    # ========================================
+    log("\n=== TEST 5: Multi-sensor read ===")
+
+    # Back to normal REPL
+    resp = await send_and_wait(client, b"\x02", "Ctrl+B normal REPL", 2.0)
+
+    sensor_cmd = (
+        "import cyberpi, mbuild; "
+        "print('S:', cyberpi.get_loudness(), "
+        "cyberpi.get_brightness(), "
+        "cyberpi.get_gyro('x'), "
+        "cyberpi.get_gyro('y'), "
+        "cyberpi.get_gyro('z'))\r\n"
+    )
+    resp = await send_and_wait(client, sensor_cmd, "multi-sensor read", 3.0)
+    if b"S:" in resp:
+        log("\n*** SENSOR DATA RECEIVED VIA BLE! ***")
+
+    # ========================================
+    # TEST 6: f3 protocol commands
+    # ========================================
+    log("\n=== TEST 6: f3 protocol ===")
+
+    # Try sending f3 frames
+    f3_cmds = [
+        bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),
+        bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
+        bytes([0xf3, 0x01, 0x00, 0xf4]),
+    ]
+    for cmd in f3_cmds:
+        resp = await send_and_wait(client, cmd, f"f3 frame: {cmd.hex(' ')}", 1.0)
+
+    # Turn off LED
+    await send_and_wait(client, "cyberpi.led.off()\r\n", "LED off", 0.5)
+
+    # Unsubscribe
+    await client.stop_notify(notify_char)
 
     log("\n========================================")
     log("BLE UART TEST COMPLETE")
 
     # Summary
-    total_rx = sum(len(d[1]) for d in RX_DATA)
-    log(f"\nTotal: {len(RX_DATA)} notifications, {total_rx} bytes received")
+    log(f"\nTotal: {len(RX_OFFSETS)} notifications, {len(RX_BUF)} bytes received")
     log(f"Log: {LOGFILE}")
     log("========================================")
     save_log()
 
+async def main():
+    log(f"Connecting to {DEVICE_ADDR}...")
+    async with session(DEVICE_ADDR) as client:
+        log(f"Connected!")
+        await run(client)
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -20,9 +20,17 @@ Also test:
 """
 
 import asyncio
+import atexit
+import collections
+import re
 import serial
 import time
+try:
+    import termios
+except ImportError:  # Windows
+    termios = None
 from bleak import BleakClient, BleakScanner
+from cyberpi_ble_common import negotiate_chunk, tune_connection, write_chunked
 
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUD = 115200
@@ -31,55 +39,138 @@ NOTIFY_UUID = "0000ffe2-0000-1000-8000-00805f9b34fb"
 WRITE_UUID  = "0000ffe3-0000-1000-8000-00805f9b34fb"
 
 LOGFILE = "/tmp/cyberpi_dual_channel.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
+# Notifications recorded by trace() wait here as raw (monotonic time, data)
+# tuples; they are formatted into the log file by the next log()/save_log()
+TRACE = collections.deque()
+# Cross-channel results for the summary: "ble_output", "serial_response",
+# "ble_activity"
+FOUND = set()
 BLE_RX = []
+RX_EVENT = None  # asyncio.Event set by every notification; created by main()
+
+def flush_traces():
+    while TRACE:
+        _, data = TRACE.popleft()
+        LOGFH.write(f"  BLE <<< [{len(data)}] {data.hex(' ')}\n")
+        printable = data.translate(PRINTABLE).decode('ascii').strip()
+        if printable:
+            LOGFH.write(f"  BLE TXT: {printable}\n")
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    flush_traces()
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
+
+def trace(data):
+    """Record a BLE notification without formatting or printing it."""
+    TRACE.append((time.monotonic(), data))
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    flush_traces()
+    LOGFH.flush()
+
+# Maps every byte that is not printable ASCII (or \n \r) to '.'
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\n\r" else 0x2e for b in range(256))
+
+# Output markers printed by the test commands; matched on raw bytes as each
+# notification arrives, with a short tail kept for markers split across two.
+# BLE_TO_SERIAL is left out: TEST 4 sends it over BLE, so an echo would match
+_MARKERS = re.compile(rb"HELLO|SENSOR|BT_OK|UBT_OK|BLE_ACTIVE")
+_MARKER_TAIL = 9  # longest marker minus one
+MARKERS_SEEN = set()
+_marker_window = b""
 
 def on_ble_notify(sender, data):
-    """BLE notification callback."""
+    """BLE notification callback. Formatting is deferred to flush_traces()."""
+    global _marker_window
     BLE_RX.append(data)
-    log(f"  BLE <<< [{len(data)}] {data.hex(' ')}")
-    text = data.decode('utf-8', errors='replace')
-    printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
-    if printable.strip():
-        log(f"  BLE TXT: {printable.strip()}")
+    trace(data)
+    window = _marker_window + data
+    for m in _MARKERS.finditer(window):
+        MARKERS_SEEN.add(m.group())
+    _marker_window = window[-_MARKER_TAIL:]
+    RX_EVENT.set()
+
+IDLE_GAP = 0.05  # seconds of silence that ends a serial read
+
+def drain(ser, idle=IDLE_GAP):
+    """Read until the line has been quiet for `idle` seconds; returns the bytes.
+
+    Each ser.read() blocks in the kernel for up to `idle`, so there is no
+    in_waiting polling or sleep between reads.
+    """
+    if ser.timeout != idle:
+        ser.timeout = idle
+    buf = bytearray()
+    chunk = ser.read(ser.in_waiting or 1)
+    while chunk:
+        buf.extend(chunk)
+        chunk = ser.read(ser.in_waiting or 1)
+    return bytes(buf)
+
+def flush_in(ser):
+    """Discard pending serial input with a single TCIFLUSH ioctl."""
+    if termios is None:
+        ser.reset_input_buffer()
+    else:
+        termios.tcflush(ser.fileno(), termios.TCIFLUSH)
 
 def serial_send(ser, cmd, label, wait=1.0):
-    """Send via serial, read serial response."""
-    ser.reset_input_buffer()
+    """Send via serial, read serial response.
+
+    Returns as soon as the >>> prompt arrives; `wait` is the upper bound.
+    """
+    flush_in(ser)
     if isinstance(cmd, str):
         cmd = cmd.encode()
     ser.write(cmd)
-    time.sleep(wait)
-    resp = b""
-    while ser.in_waiting:
-        resp += ser.read(ser.in_waiting)
-        time.sleep(0.05)
-    return resp
+    ser.timeout = wait
+    resp = ser.read_until(b">>> ", 4096)
+    return resp + drain(ser)
+
+RX_SETTLE = 0.1  # quiet time after a notification that ends a reply
+
+async def wait_rx(wait, settle=RX_SETTLE):
+    """Wait for the first notification, then until none has arrived for
+    `settle` seconds. Never takes longer than `wait` in total."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + wait
+    try:
+        await asyncio.wait_for(RX_EVENT.wait(), wait)
+        while loop.time() < end:
+            RX_EVENT.clear()
+            await asyncio.wait_for(RX_EVENT.wait(), min(settle, end - loop.time()))
+    except asyncio.TimeoutError:
+        pass
+
+WRITE_CHUNK = 20  # default ATT payload; raised to MTU-3 after connect
 
 async def ble_send(client, data, label, wait=1.0):
-    """Send via BLE, wait for notifications."""
+    """Send via BLE, wait for notifications; `wait` is the upper bound."""
     global BLE_RX
     BLE_RX.clear()
+    RX_EVENT.clear()
     if isinstance(data, str):
         data = data.encode()
-    await client.write_gatt_char(WRITE_UUID, data, response=False)
-    await asyncio.sleep(wait)
+    await write_chunked(client, WRITE_UUID, data, WRITE_CHUNK)
+    await wait_rx(wait)
     return b"".join(BLE_RX)
 
 def hex_dump(data):
+    """First 60 bytes as spaced hex; only the shown slice is formatted."""
     if not data:
         return "(empty)"
-    return data.hex(' ')[:120]
+    return memoryview(data)[:60].hex(' ')
 
 async def main():
+    # Blocking serial I/O runs in worker threads so BLE notifications keep
+    # being dispatched while a serial read is waiting
+    global RX_EVENT, WRITE_CHUNK
+    RX_EVENT = asyncio.Event()
     log(f"=== CyberPi Dual-Channel Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
     log("HYPOTHESIS: Serial IN + BLE OUT = full bidirectional communication\n")
 
@@ -90,38 +181,45 @@ async def main():
     ser = serial.Serial()
     ser.port = SERIAL_PORT
     ser.baudrate = BAUD
-    ser.timeout = 0.1
+    ser.timeout = IDLE_GAP
     ser.dtr = False
     ser.rts = False
     ser.open()
     ser.dtr = False
     ser.rts = False
-    time.sleep(0.1)
+    await asyncio.sleep(0.1)
 
     # Reset
     ser.rts = True
-    time.sleep(0.1)
+    await asyncio.sleep(0.1)
     ser.rts = False
-    log("Reset pulse sent. Waiting for boot (5s)...")
-    time.sleep(5.0)
-
-    # Drain boot data
-    boot = b""
-    while ser.in_waiting:
-        boot += ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    log("Reset pulse sent. Waiting for boot (5s) while BLE connects...")
+
+    async def boot_wait():
+        await asyncio.sleep(5.0)
+        return await asyncio.to_thread(drain, ser)
+
+    # The BLE connect does not depend on the boot drain: BlueZ keeps trying
+    # until the device starts advertising, so both run at once
+    client = BleakClient(DEVICE_ADDR, timeout=15.0)
+    boot, connected = await asyncio.gather(
+        boot_wait(), client.connect(), return_exceptions=True)
+    if isinstance(boot, Exception):
+        raise boot
     log(f"Boot data: {len(boot)} bytes drained")
 
     # ==========================================
     # STEP 2: Connect BLE while serial is open
     # ==========================================
     log("\n=== STEP 2: Connect BLE (serial stays open) ===")
-    log(f"Scanning for {DEVICE_ADDR}...")
+    log(f"Connecting to {DEVICE_ADDR} (started during boot)...")
 
     try:
-        client = BleakClient(DEVICE_ADDR, timeout=15.0)
-        await client.connect()
-        log(f"BLE connected! MTU: {client.mtu_size}")
+        if isinstance(connected, Exception):
+            raise connected
+        WRITE_CHUNK = await negotiate_chunk(client)
+        log(f"BLE connected! MTU: {client.mtu_size}, write chunk: {WRITE_CHUNK} bytes")
+        await tune_connection(client, log)
         await client.start_notify(NOTIFY_UUID, on_ble_notify)
         log("Subscribed to BLE ffe2 notifications")
         await asyncio.sleep(1.0)
@@ -145,7 +243,7 @@ async def main():
 
     BLE_RX.clear()
     log("Sending 'mode upload' via serial...")
-    resp_serial = serial_send(ser, b"mode upload\r\n", "mode upload", 3.0)
+    resp_serial = await asyncio.to_thread(serial_send, ser, b"mode upload\r\n", "mode upload", 3.0)
     log(f"  Serial RX: [{len(resp_serial)}] {hex_dump(resp_serial)}")
     await asyncio.sleep(1.0)  # Give BLE time
     if BLE_RX:
@@ -155,7 +253,7 @@ async def main():
 
     BLE_RX.clear()
     log("\nSending Ctrl+A via serial...")
-    resp_serial = serial_send(ser, b"\x01", "Ctrl+A", 2.0)
+    resp_serial = await asyncio.to_thread(serial_send, ser, b"\x01", "Ctrl+A", 2.0)
     log(f"  Serial RX: [{len(resp_serial)}] {hex_dump(resp_serial)}")
     await asyncio.sleep(1.0)
     if BLE_RX:
@@ -182,14 +280,14 @@ async def main():
     for cmd, label in commands:
         BLE_RX.clear()
         log(f"\n  Sending via serial: {cmd!r}")
-        resp_serial = serial_send(ser, cmd, label, 1.5)
+        resp_serial = await asyncio.to_thread(serial_send, ser, cmd, label, 1.5)
         log(f"  Serial RX: [{len(resp_serial)}] {hex_dump(resp_serial)}")
         await asyncio.sleep(0.5)
         if BLE_RX:
             log(f"  *** BLE got {len(BLE_RX)} notifications! ***")
             for data in BLE_RX:
-                text = data.decode('utf-8', errors='replace')
-                if 'HELLO' in text or 'SENSOR' in text or '4' in text:
+                if b"HELLO" in data or b"SENSOR" in data or b"4" in data:
+                    FOUND.add("ble_output")
                     log(f"  *** OUTPUT RECEIVED VIA BLE! ***")
         else:
             log(f"  BLE: no notifications")
@@ -212,7 +310,7 @@ async def main():
     for cmd in ble_write_cmds:
         BLE_RX.clear()
         log(f"\n  Sending: {cmd[:80]!r}...")
-        resp_serial = serial_send(ser, cmd, "ble write", 2.0)
+        resp_serial = await asyncio.to_thread(serial_send, ser, cmd, "ble write", 2.0)
         log(f"  Serial RX: [{len(resp_serial)}] {hex_dump(resp_serial)}")
         await asyncio.sleep(0.5)
         if BLE_RX:
@@ -232,16 +330,14 @@ async def main():
 
     for cmd, label in ble_commands:
         BLE_RX.clear()
-        ser.reset_input_buffer()
+        flush_in(ser)
         log(f"\n  Sending via BLE: {cmd!r}")
         await ble_send(client, cmd, label, 2.0)
         # Check serial for response
-        time.sleep(0.5)
-        serial_data = b""
-        while ser.in_waiting:
-            serial_data += ser.read(ser.in_waiting)
-            time.sleep(0.05)
+        await asyncio.sleep(0.5)
+        serial_data = await asyncio.to_thread(drain, ser)
         if serial_data:
+            FOUND.add("serial_response")
             log(f"  *** SERIAL got response! [{len(serial_data)}] {hex_dump(serial_data)} ***")
             text = serial_data.decode('utf-8', errors='replace')
             if text.strip():
@@ -263,10 +359,8 @@ async def main():
     if BLE_RX:
         log(f"  BLE f5 response: YES! {len(BLE_RX)} notifications")
     # Check serial too
-    time.sleep(0.3)
-    serial_data = b""
-    while ser.in_waiting:
-        serial_data += ser.read(ser.in_waiting)
+    await asyncio.sleep(0.3)
+    serial_data = await asyncio.to_thread(drain, ser)
     if serial_data:
         log(f"  Serial during BLE f5: {hex_dump(serial_data)}")
 
@@ -299,15 +393,13 @@ async def main():
 
     for cmd in ble_module_cmds:
         BLE_RX.clear()
-        ser.reset_input_buffer()
         log(f"\n  Sending via serial: {cmd[:70]!r}...")
-        serial_send(ser, cmd, "BLE module", 2.0)
+        await asyncio.to_thread(serial_send, ser, cmd, "BLE module", 2.0)
         await asyncio.sleep(1.0)
         if BLE_RX:
+            FOUND.add("ble_activity")
             log(f"  *** BLE notifications during BLE module test! ***")
-        serial_data = b""
-        while ser.in_waiting:
-            serial_data += ser.read(ser.in_waiting)
+        serial_data = await asyncio.to_thread(drain, ser)
         if serial_data:
             log(f"  *** Serial data: {hex_dump(serial_data)} ***")
 
@@ -331,9 +423,9 @@ async def main():
         await ble_send(client, pat, "pattern", 1.5)
         if BLE_RX:
             log(f"  BLE RX: {len(BLE_RX)} notifications")
-        time.sleep(0.3)
-        if ser.in_waiting:
-            d = ser.read(ser.in_waiting)
+        await asyncio.sleep(0.3)
+        d = await asyncio.to_thread(drain, ser)
+        if d:
             log(f"  Serial: {hex_dump(d)}")
 
     # ==========================================
@@ -341,14 +433,14 @@ async def main():
     # ==========================================
     log("\n=== FINAL: Extended listen on both channels (5s) ===")
     BLE_RX.clear()
-    ser.reset_input_buffer()
+    flush_in(ser)
     await asyncio.sleep(5.0)
     if BLE_RX:
         log(f"Late BLE: {len(BLE_RX)} notifications")
-    if ser.in_waiting:
-        d = ser.read(ser.in_waiting)
-        log(f"Late serial: {hex_dump(d)}")
-    if not BLE_RX and not ser.in_waiting:
+    late = await asyncio.to_thread(drain, ser)
+    if late:
+        log(f"Late serial: {hex_dump(late)}")
+    if not BLE_RX and not late:
         log("No late data on either channel")
 
     # Cleanup
@@ -363,12 +455,13 @@ async def main():
     log("\n" + "="*60)
     log("DUAL-CHANNEL SUMMARY")
     log("="*60)
-    all_log = "\n".join(LOG)
-    if "OUTPUT RECEIVED VIA BLE" in all_log:
+    if MARKERS_SEEN or "ble_output" in FOUND:
         log("SUCCESS: REPL output found on BLE channel!")
-    elif "SERIAL got response" in all_log:
+        if MARKERS_SEEN:
+            log(f"  Markers seen on BLE: {', '.join(sorted(m.decode() for m in MARKERS_SEEN))}")
+    elif "serial_response" in FOUND:
         log("SUCCESS: BLE commands produced serial output!")
-    elif "BLE notifications during" in all_log:
+    elif "ble_activity" in FOUND:
         log("PARTIAL: Some BLE activity detected during commands")
     else:
         log("NEGATIVE: No cross-channel output detected")
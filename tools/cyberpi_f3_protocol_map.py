@@ -14,46 +14,110 @@ and record which ones get responses. Then vary payloads for responders.
 """
 
 import asyncio
+import atexit
+import collections
 import time
 from bleak import BleakClient, BleakScanner
+from cyberpi_ble_common import feed_sweep, tune_connection
+from cyberpi_ble_common import sweep as sweep_frames
 
 DEVICE_ADDR = "10:97:BD:8F:4D:D2"
 NOTIFY_UUID = "0000ffe2-0000-1000-8000-00805f9b34fb"
 WRITE_UUID = "0000ffe3-0000-1000-8000-00805f9b34fb"
 
 LOGFILE = "/tmp/cyberpi_f3_map.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
 RX_BUFFER = []
+RX_EVENT = None  # asyncio.Event set by every notification; created by main()
+
+F3_HEAD = b"\xf3"
+F3_TAIL = b"\xf4"
+# One single-byte object per f3 type, so framing never builds bytes([type])
+F3_TYPES = tuple(bytes((t,)) for t in range(0x100))
+
+# Known handshake/config payloads
+F5_HANDSHAKE = b"\x02\x00\x08\xc0\xc8"
+F6_CONFIG = b"\x03\x00\x0d\x00\x00\x0d"
+
+# PHASE 3: payloads of various lengths tried on every responding type
+PHASE3_PAYLOADS = (b"", b"\x00", b"\x01", b"\x00\x00", b"\x01\x00", b"\x00\x01",
+                   b"\x02\x00", b"\x00\x00\x00", b"\x01\x00\x00", b"\x02\x00\x08",
+                   b"\x03\x00\x0d\x00\x00\x0d")
+
+# PHASE 5: command types probed with every (device id, port) payload
+PHASE5_TYPES = (0x01, 0x02, 0x03, 0x04, 0x05, 0x10, 0x20,
+                0xf5, 0xf6, 0xf7, 0xf8, 0xf9)
+# A type with no replies from device ids below this is not probed further
+PHASE5_PROBE_DEVICES = 8
+
+SWEEP_INFLIGHT = 16  # frames allowed to await a reply at once
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    LOGFH.flush()
+
+def f3_frame(cmd_type, payload=b""):
+    return b"".join((F3_HEAD, F3_TYPES[cmd_type], payload, F3_TAIL))
 
 def on_notify(sender, data):
     RX_BUFFER.append((time.time(), data))
+    RX_EVENT.set()
+    feed_sweep(data, log)
+
+RX_SETTLE = 0.1  # quiet time after a notification that ends a reply
+
+async def wait_rx(wait, settle=RX_SETTLE):
+    """Wait for the first notification, then until none has arrived for
+    `settle` seconds. Never takes longer than `wait` in total."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + wait
+    try:
+        await asyncio.wait_for(RX_EVENT.wait(), wait)
+        while loop.time() < end:
+            RX_EVENT.clear()
+            await asyncio.wait_for(RX_EVENT.wait(), min(settle, end - loop.time()))
+    except asyncio.TimeoutError:
+        pass
 
 async def send_f3(client, cmd_type, payload=b"", wait=0.3):
-    """Send f3 frame and return response."""
+    """Send f3 frame and return response; `wait` bounds the wait for a reply."""
     RX_BUFFER.clear()
-    frame = bytes([0xf3, cmd_type]) + payload + bytes([0xf4])
-    await client.write_gatt_char(WRITE_UUID, frame, response=False)
-    await asyncio.sleep(wait)
+    RX_EVENT.clear()
+    await client.write_gatt_char(WRITE_UUID, f3_frame(cmd_type, payload), response=False)
+    await wait_rx(wait)
 
     if RX_BUFFER:
         resp = b"".join(d[1] for d in RX_BUFFER)
         return resp
     return None
 
+async def sweep(client, frames, timeout, inflight=SWEEP_INFLIGHT, keys=None):
+    """Pipeline frames with at most `inflight` awaiting a reply (see
+    cyberpi_ble_common.sweep).
+
+    Writes go out back to back instead of one per sleep, so the sweep is
+    paced by the connection interval. Returns one reply frame (or None) per
+    input frame, in input order.
+    """
+    async def write(frame):
+        await client.write_gatt_char(WRITE_UUID, frame, response=False)
+    return await sweep_frames(write, frames, timeout, inflight, keys)
+
 async def main():
+    global RX_EVENT
+    RX_EVENT = asyncio.Event()
     log(f"=== CyberPi f3 Protocol Mapper - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
 
     log(f"Connecting to {DEVICE_ADDR}...")
     async with BleakClient(DEVICE_ADDR, timeout=15.0) as client:
         log("Connected!")
+        await tune_connection(client, log)
         await client.start_notify(NOTIFY_UUID, on_notify)
         log("Subscribed to notifications\n")
         await asyncio.sleep(0.5)
@@ -62,10 +126,10 @@ async def main():
         # PHASE 1: Handshake (known working)
         # ========================================
         log("=== PHASE 1: Handshake ===")
-        resp = await send_f3(client, 0xf5, bytes([0x02, 0x00, 0x08, 0xc0, 0xc8]), 1.0)
+        resp = await send_f3(client, 0xf5, F5_HANDSHAKE, 1.0)
         if resp:
             log(f"  f5 handshake: {resp.hex(' ')}")
-        resp = await send_f3(client, 0xf6, bytes([0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d]), 1.0)
+        resp = await send_f3(client, 0xf6, F6_CONFIG, 1.0)
         if resp:
             log(f"  f6 config: {resp.hex(' ')}")
 
@@ -76,8 +140,9 @@ async def main():
         log("Sending f3 [type] 00 f4 for types 0x00-0xff...\n")
 
         responders = {}
-        for cmd in range(0x00, 0x100):
-            resp = await send_f3(client, cmd, bytes([0x00]), 0.15)
+        frames = [f3_frame(cmd, b"\x00") for cmd in range(0x00, 0x100)]
+        replies = await sweep(client, frames, 0.15)
+        for cmd, resp in enumerate(replies):
             if resp:
                 responders[cmd] = resp
                 log(f"  0x{cmd:02x}: RESPONSE {resp.hex(' ')}")
@@ -91,21 +156,7 @@ async def main():
         for cmd in sorted(responders.keys()):
             log(f"\n  --- Type 0x{cmd:02x} ---")
 
-            # Try various payload lengths
-            payloads = [
-                bytes([]),
-                bytes([0x00]),
-                bytes([0x01]),
-                bytes([0x00, 0x00]),
-                bytes([0x01, 0x00]),
-                bytes([0x00, 0x01]),
-                bytes([0x02, 0x00]),
-                bytes([0x00, 0x00, 0x00]),
-                bytes([0x01, 0x00, 0x00]),
-                bytes([0x02, 0x00, 0x08]),
-                bytes([0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d]),
-            ]
-            for payload in payloads:
+            for payload in PHASE3_PAYLOADS:
                 resp = await send_f3(client, cmd, payload, 0.15)
                 if resp:
                     log(f"    payload {payload.hex(' '):20s} -> {resp.hex(' ')}")
@@ -138,14 +189,25 @@ async def main():
 
         # Makeblock device IDs (from old protocol):
         # 1=ultrasonic, 3=light, 6=gyro, 7=sound, etc.
-        for device_id in range(0, 32):
-            for port in range(0, 4):
-                payload = bytes([device_id, port])
-                for cmd_type in [0x01, 0x02, 0x03, 0x04, 0x05, 0x10, 0x20,
-                                 0xf5, 0xf6, 0xf7, 0xf8, 0xf9]:
-                    resp = await send_f3(client, cmd_type, payload, 0.1)
-                    if resp and resp != bytes([0xf3, cmd_type]) + payload + bytes([0xf4]):
+        hits_per_cmd = collections.Counter()
+        for cmd_type in PHASE5_TYPES:
+            for device_ids in (range(0, PHASE5_PROBE_DEVICES),
+                               range(PHASE5_PROBE_DEVICES, 32)):
+                probes = [(device_id, port) for device_id in device_ids
+                          for port in range(0, 4)]
+                frames = [f3_frame(cmd_type, bytes(probe)) for probe in probes]
+                # Key each frame on its own type, device and port bytes: a
+                # reply that does not carry them is not credited to whichever
+                # port frame is pending; sweep() re-probes its frame alone
+                replies = await sweep(client, frames, 0.1,
+                                      keys=[frame[1:4] for frame in frames])
+                for (device_id, port), resp in zip(probes, replies):
+                    if resp:
+                        hits_per_cmd[cmd_type] += 1
                         log(f"  type=0x{cmd_type:02x} dev={device_id} port={port}: {resp.hex(' ')}")
+                if not hits_per_cmd[cmd_type]:
+                    log(f"  type=0x{cmd_type:02x}: no replies from dev 0-{PHASE5_PROBE_DEVICES - 1}, skipping the rest")
+                    break
 
         # ========================================
         # PHASE 6: Continuous monitoring
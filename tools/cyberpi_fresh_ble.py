@@ -10,6 +10,7 @@ import asyncio
 import serial
 import time
 from bleak import BleakClient, BleakScanner
+from cyberpi_ble_common import negotiate_chunk, tune_connection, write_chunked
 
 SERIAL_PORT = "/dev/ttyUSB0"
 DEVICE_ADDR = "10:97:BD:8F:4D:D2"
@@ -17,29 +18,80 @@ NOTIFY_UUID = "0000ffe2-0000-1000-8000-00805f9b34fb"
 WRITE_UUID = "0000ffe3-0000-1000-8000-00805f9b34fb"
 
 RX = []
+RX_EVENT = None  # asyncio.Event set by every notification; created by main()
 
 def log(msg):
     print(msg)
 
+# Maps every byte that is not printable ASCII (or \n \r) to '.'
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\n\r" else 0x2e for b in range(256))
+# Maps the same printable bytes to 0 and everything else to 1
+PRINTABLE_MASK = bytes(0 if 32 <= b < 127 or b in b"\n\r" else 1 for b in range(256))
+
 def on_notify(sender, data):
     RX.append(data)
-    log(f"  <<< [{len(data)}] {data.hex(' ')}")
-    text = data.decode('utf-8', errors='replace')
-    printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
-    if printable.strip():
-        log(f"      TXT: {printable.strip()}")
-
-async def tx(client, data, label="", wait=1.0):
-    global RX
-    RX.clear()
+    RX_EVENT.set()
+
+def dump(rx):
+    """Log captured notifications once collection is done."""
+    for data in rx:
+        log(f"  <<< [{len(data)}] {data.hex(' ')}")
+        printable = data.translate(PRINTABLE).decode('ascii')
+        if printable.strip():
+            log(f"      TXT: {printable.strip()}")
+
+def flush_rx():
+    """Log notifications that arrived since the last collection, then clear
+    RX, so nothing that came in between commands goes unreported."""
+    if RX:
+        log(f"  ({len(RX)} notifications since the last command)")
+        dump(RX)
+        RX.clear()
+
+# A reply is complete once one of its markers shows up: the REPL prompt or
+# raw-REPL end marker by default, the f4 tail for f3 frames
+REPLY_TERMINATORS = (b"\r\n>>> ", b"\x04>")
+F3_TERMINATORS = (b"\xf4",)
+RAW_REPL_PROMPT = (b"\r\n>",)
+
+async def wait_rx(wait, done=REPLY_TERMINATORS):
+    """Wait until the notifications in RX contain one of the `done` markers,
+    or `wait` seconds pass. With no markers, waits the full `wait`."""
+    loop = asyncio.get_running_loop()
+    end = loop.time() + wait
+    while True:
+        if done and RX:
+            reply = b"".join(RX)
+            if any(m in reply for m in done):
+                return
+        remaining = end - loop.time()
+        if remaining <= 0:
+            return
+        RX_EVENT.clear()
+        try:
+            await asyncio.wait_for(RX_EVENT.wait(), remaining)
+        except asyncio.TimeoutError:
+            return
+
+WRITE_CHUNK = 20  # default ATT payload; raised to MTU-3 after connect
+
+async def tx(client, data, label="", wait=1.0, done=REPLY_TERMINATORS):
+    """Send data and collect the reply until a `done` marker (see wait_rx).
+    Anything arriving later is logged by the next flush_rx()."""
+    flush_rx()
+    RX_EVENT.clear()
     if isinstance(data, str):
         data = data.encode()
-    log(f"\n>>> [{label}] TX: {data.hex(' ')}" if not all(32 <= b < 127 or b in (10,13) for b in data) else f"\n>>> [{label}] TX: {data!r}")
-    await client.write_gatt_char(WRITE_UUID, data, response=False)
-    await asyncio.sleep(wait)
+    is_text = 1 not in data.translate(PRINTABLE_MASK)
+    log(f"\n>>> [{label}] TX: {data!r}" if is_text else f"\n>>> [{label}] TX: {data.hex(' ')}")
+    await write_chunked(client, WRITE_UUID, data, WRITE_CHUNK)
+    await wait_rx(wait, done)
+    dump(RX)
+    result = b"".join(RX)
     if not RX:
         log("  (no response)")
-    return b"".join(RX)
+    RX.clear()
+    return result
 
 def reset_cyberpi():
     """Reset CyberPi via serial RTS toggle, then close serial."""
@@ -60,16 +112,14 @@ def reset_cyberpi():
     ser.rts = False
     time.sleep(3.0)  # Wait for boot
 
-    # Read and discard boot output
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
-        time.sleep(0.1)
-
+    # Boot output is left unread: closing the port discards it
     ser.close()
     log("Serial port closed. CyberPi should be in fresh boot state.")
     time.sleep(2.0)  # Extra wait for BLE to come up
 
 async def main():
+    global RX_EVENT, WRITE_CHUNK
+    RX_EVENT = asyncio.Event()
     log(f"=== Fresh BLE Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
 
     # Step 1: Reset via serial
@@ -93,6 +143,9 @@ async def main():
     log(f"\nConnecting to {target.name} ({target.address})...")
     async with BleakClient(target.address, timeout=15.0) as client:
         log("Connected!")
+        WRITE_CHUNK = await negotiate_chunk(client)
+        log(f"Write chunk: {WRITE_CHUNK} bytes")
+        await tune_connection(client, log)
         await client.start_notify(NOTIFY_UUID, on_notify)
         log("Subscribed to ffe2")
 
@@ -101,18 +154,20 @@ async def main():
         await asyncio.sleep(3.0)
         if RX:
             log(f"  Got {len(RX)} initial notifications!")
+            dump(RX)
+            RX.clear()
         else:
             log("  No initial data")
 
         # Test 1: f5 handshake (first thing after fresh connection)
         log("\n--- TEST 1: f5 handshake ---")
         resp = await tx(client, bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),
-                        "f5 handshake", 2.0)
+                        "f5 handshake", 2.0, F3_TERMINATORS)
 
         # Test 2: f6 config
         log("\n--- TEST 2: f6 config ---")
         resp = await tx(client, bytes([0xf3, 0xf6, 0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d, 0xf4]),
-                        "f6 config", 2.0)
+                        "f6 config", 2.0, F3_TERMINATORS)
 
         # Test 3: Text commands
         log("\n--- TEST 3: Text commands after handshake ---")
@@ -122,7 +177,7 @@ async def main():
 
         # Test 4: REPL
         log("\n--- TEST 4: REPL entry ---")
-        await tx(client, b"\x01", "Ctrl+A", 2.0)
+        await tx(client, b"\x01", "Ctrl+A", 2.0, RAW_REPL_PROMPT)
         await tx(client, b"print('BLE_TEST')\r\n", "print", 2.0)
 
         # Test 5: LED command to verify BLE writes execute
@@ -150,11 +205,12 @@ async def main():
             bytes([0xaa, 0x55, 0x00]),
         ]
         for proto in alt_protos:
-            resp = await tx(client, proto, f"alt: {proto.hex(' ')}", 0.5)
+            # Unknown protocols have no end marker: listen the full 0.5s
+            resp = await tx(client, proto, f"alt: {proto.hex(' ')}", 0.5, ())
 
         # Test 7: Long listen
+        flush_rx()
         log("\n--- TEST 7: Final listen (5s) ---")
-        RX.clear()
         await asyncio.sleep(5.0)
         if RX:
             for data in RX:
@@ -19,7 +19,11 @@ Response format:
   Response data[3:] contains Python repr like "{'ret': 42}"
 """
 
+import ast
+import functools
+import re
 import serial
+import struct
 import time
 import sys
 import threading
@@ -34,51 +38,76 @@ TYPE_ONLINE = 0x0d
 MODE_RUN_WITHOUT_RESPONSE = 0x00
 MODE_RUN_WITH_RESPONSE = 0x01
 
+# Expected hdr_check byte for every (datalen_lo << 8 | datalen_hi) pair
+HDR_CHECK = bytes((lo + hi + 0xf3) & 0xff for lo in range(256) for hi in range(256))
 
-def build_script_frame(script: str, idx: int = 1, mode: int = MODE_RUN_WITH_RESPONSE) -> bytearray:
-    """Build a HalocodePackData frame containing a Python script."""
+# Receive buffer shared by every read_all() call; grown in place if one
+# read window ever overflows it
+RX_BUF = bytearray(8192)
+
+# The common script reply, "{'ret': <number>}", parsed without literal_eval
+_RET_RE = re.compile(rb"\{'ret':\s*(-?[\d.eE+-]+)\}$")
+
+
+def _parse_result(raw: bytes, text: str):
+    """Python literal in a script reply, without ever eval()ing device output."""
+    m = _RET_RE.match(raw)
+    if m:
+        for number in (int, float):
+            try:
+                return {'ret': number(m.group(1))}
+            except ValueError:
+                pass
+    return ast.literal_eval(text)
+
+# Scratch buffer build_script_frame() assembles frames in; only larger
+# frames get a buffer of their own. Not safe to share between threads.
+_TX_SCRATCH = bytearray(4096)
+_TX_VIEW = memoryview(_TX_SCRATCH)
+
+
+@functools.lru_cache(maxsize=64)
+def _script_template(script: str, mode: int):
+    """Frame for script with idx 0, and its checksum without the idx bytes.
+
+    Only idx and the checksum change between sends of the same script, so
+    the encode, header pack and sum are done once per (script, mode).
+    """
     script_bytes = script.encode('utf-8')
     script_len = len(script_bytes)
 
-    # data = [script_len_lo, script_len_hi, *script_bytes]
-    data = [script_len & 0xff, (script_len >> 8) & 0xff]
-    data.extend(script_bytes)
-
     typ = TYPE_SCRIPT
-    idx_lo = idx & 0xff
-    idx_hi = (idx >> 8) & 0xff
 
+    # data = [script_len_lo, script_len_hi, *script_bytes]
     # datalen includes type + mode + idx_lo + idx_hi + data
-    datalen = len(data) + 4
-
-    # Build frame
-    buf = bytearray()
-    buf.append(0xf3)  # header
+    datalen = script_len + 2 + 4
 
     # header check byte
     hdr_check = (((datalen >> 8) & 0xff) + (datalen & 0xff) + 0xf3) & 0xff
-    buf.append(hdr_check)
 
-    buf.append(datalen & 0xff)
-    buf.append((datalen >> 8) & 0xff)
+    # datalen, idx and script_len go in as little-endian u16 fields
+    header = struct.pack('<BBHBBHH', 0xf3, hdr_check, datalen, typ, mode, 0, script_len)
 
-    buf.append(typ)
-    buf.append(mode)
-    buf.append(idx_lo)
-    buf.append(idx_hi)
+    # checksum: type, mode, idx (0) and script_len are header[4:]; sum()
+    # reduces them and the script bytes in C, and the mod is taken once
+    cksum = (sum(header[4:]) + sum(script_bytes)) & 0xff
 
-    for b in data:
-        buf.append(b)
+    return header + script_bytes + bytes((cksum, 0xf4)), cksum  # checksum, footer
 
-    # checksum
-    cksum = typ + mode + idx_hi + idx_lo
-    for b in data:
-        cksum += b
-    cksum &= 0xff
-    buf.append(cksum)
 
-    buf.append(0xf4)  # footer
-    return buf
+def build_script_frame(script: str, idx: int = 1, mode: int = MODE_RUN_WITH_RESPONSE) -> bytes:
+    """Build a HalocodePackData frame containing a Python script."""
+    template, partial = _script_template(script, mode)
+    n = len(template)
+    if n <= len(_TX_SCRATCH):
+        frame, view = _TX_SCRATCH, _TX_VIEW
+    else:
+        frame = bytearray(n)
+        view = memoryview(frame)
+    view[:n] = template
+    struct.pack_into('<H', frame, 6, idx & 0xffff)
+    frame[n - 2] = (partial + frame[6] + frame[7]) & 0xff
+    return bytes(view[:n])
 
 
 def build_online_mode_frame() -> bytearray:
@@ -93,51 +122,76 @@ def build_offline_mode_frame() -> bytearray:
 
 
 class F3Parser:
-    """Parse incoming f3/f4 frames byte-by-byte (mirrors HalocodeProtocol.on_parse)."""
+    """Parse incoming f3/f4 frames (mirrors HalocodeProtocol.on_parse).
+
+    Bytes are scanned in bulk with bytearray.find rather than one feed()
+    call per byte, but framing matches on_parse exactly: a valid header
+    anywhere in the stream (including inside a frame still being received)
+    restarts the frame there.
+    """
 
     def __init__(self):
-        self._buffer = []
-        self._is_receiving = False
-        self._datalen = 0
+        self._buffer = bytearray()
         self.ready = False
         self.frames = []  # collected complete frames
+        self.by_idx = {}  # idx -> latest complete frame carrying it
 
     def feed(self, byte: int):
-        self._buffer.append(byte)
-
-        # Detect header: check if last 4 bytes form valid header
-        if len(self._buffer) > 3:
-            b = self._buffer
-            # hdr_check validation: (b[-1] + b[-2] + b[-4]) & 0xff == b[-3]
-            # and b[-4] == 0xf3
-            if b[-4] == 0xf3 and ((b[-1] + b[-2] + b[-4]) & 0xff) == b[-3]:
-                # Valid header found, reset buffer to just the header
-                self._buffer = [0xf3, b[-3], b[-2], b[-1]]
-                self._datalen = self._buffer[2] + (self._buffer[3] << 8)
-                self._is_receiving = True
-
-        if self._is_receiving:
+        self.feedall(bytes((byte,)))
+
+    def _find_header(self, start, last):
+        """Offset of the first valid 4-byte header starting in [start, last]."""
+        rx = self._buffer
+        last = min(last, len(rx) - 4)
+        i = rx.find(0xf3, start)
+        while i != -1 and i <= last:
+            # hdr_check validation: (f3 + len_lo + len_hi) & 0xff == hdr_check
+            if rx[i + 1] == HDR_CHECK[(rx[i + 2] << 8) | rx[i + 3]]:
+                return i
+            i = rx.find(0xf3, i + 1)
+        return None
+
+    def feedall(self, data: bytes):
+        rx = self._buffer
+        rx.extend(data)
+        while True:
+            start = self._find_header(0, len(rx))
+            if start is None:
+                # Keep a possible partial header for the next chunk
+                del rx[:-3]
+                return
+            datalen = rx[start + 2] + (rx[start + 3] << 8)
             # Complete frame: datalen + 6 (4 header + checksum + footer)
-            if len(self._buffer) - 6 == self._datalen and self._buffer[0] == 0xf3:
-                self.ready = True
-                frame = list(self._buffer)
-                self.frames.append(frame)
-
-                # Extract type
-                if len(frame) > 4:
-                    frame_type = frame[4]
-                    if frame_type == TYPE_SCRIPT:
-                        self._parse_script_response(frame)
-                    elif frame_type == TYPE_SUBSCRIBE:
-                        self._parse_subscribe_response(frame)
-                    elif frame_type == TYPE_ONLINE:
-                        print(f"  [ONLINE] mode response")
-                    else:
-                        print(f"  [TYPE 0x{frame_type:02x}] unknown")
-
-                self._buffer = []
-                self._datalen = 0
-                self._is_receiving = False
+            end = start + datalen + 6
+            # A header that is complete before the frame is restarts it
+            resync = self._find_header(start + 1, end - 4)
+            if resync is not None:
+                del rx[:resync]
+                continue
+            if len(rx) < end:
+                del rx[:start]
+                return
+            frame = bytes(rx[start:end])
+            del rx[:end]
+            self._on_frame(frame)
+
+    def _on_frame(self, frame):
+        self.ready = True
+        self.frames.append(frame)
+        if len(frame) > 8:
+            self.by_idx[frame[6] | (frame[7] << 8)] = frame
+
+        # Extract type
+        if len(frame) > 4:
+            frame_type = frame[4]
+            if frame_type == TYPE_SCRIPT:
+                self._parse_script_response(frame)
+            elif frame_type == TYPE_SUBSCRIBE:
+                self._parse_subscribe_response(frame)
+            elif frame_type == TYPE_ONLINE:
+                print(f"  [ONLINE] mode response")
+            else:
+                print(f"  [TYPE 0x{frame_type:02x}] unknown")
 
     def _parse_script_response(self, frame):
         """Parse TYPE_SCRIPT response - data[3:] contains Python repr."""
@@ -152,7 +206,7 @@ class F3Parser:
                 result_str = bytes(data[3:]).decode('utf-8', errors='replace')
                 print(f"  [SCRIPT RESPONSE] raw={result_str}")
                 try:
-                    result = eval(result_str)
+                    result = _parse_result(bytes(data[3:]), result_str)
                     if isinstance(result, dict) and 'ret' in result:
                         print(f"  [VALUE] ret = {result['ret']}")
                 except:
@@ -176,9 +230,11 @@ class F3Parser:
                 print(f"  [SUBSCRIBE] raw data: {[hex(b) for b in data]}")
 
 
-def hex_dump(data, prefix=""):
-    """Pretty-print bytes."""
-    return prefix + " ".join(f"{b:02x}" for b in data)
+HEX_DUMP_MAX = 200  # bytes shown by hex_dump
+
+def hex_dump(data, prefix="", limit=HEX_DUMP_MAX):
+    """Pretty-print bytes (at most the first `limit`), without copying them."""
+    return prefix + memoryview(data)[:limit].hex(' ')
 
 
 def main():
@@ -200,26 +256,51 @@ def main():
 
     parser = F3Parser()
 
-    def read_all(timeout=2.0, label=""):
-        """Read all available data for timeout seconds, feeding to parser."""
-        raw = bytearray()
-        start = time.time()
-        while time.time() - start < timeout:
-            chunk = ser.read(256)
-            if chunk:
-                raw.extend(chunk)
-                for b in chunk:
-                    parser.feed(b)
-            else:
-                time.sleep(0.01)
+    def new_frame():
+        """Predicate for read_all: true once a frame beyond the current count arrives."""
+        n = len(parser.frames)
+        return lambda: len(parser.frames) > n
+
+    def read_all(timeout=2.0, label="", until=None):
+        """Read all available data for timeout seconds, feeding to parser.
+
+        If given, `until` is checked after every read and ends the window
+        early once it returns True.
+
+        Reads land in the shared RX_BUF; the returned memoryview is only
+        valid until the next call.
+        """
+        end = 0
+        mv = memoryview(RX_BUF)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if end == len(RX_BUF):
+                mv.release()
+                RX_BUF.extend(bytes(len(RX_BUF)))
+                mv = memoryview(RX_BUF)
+            # Block in the driver until data arrives or the window closes,
+            # then take whatever else is already buffered in the same read
+            ser.timeout = remaining
+            want = min(max(ser.in_waiting, 1), len(RX_BUF) - end)
+            n = ser.readinto(mv[end:end + want])
+            if not n:
+                break
+            parser.feedall(mv[end:end + n])
+            end += n
+            if until and until():
+                break
+        raw = mv[:end]
         if raw:
             # Show both raw hex and any ASCII
-            ascii_str = raw.decode('ascii', errors='replace').replace('\r', '\\r').replace('\n', '\\n')
+            ascii_str = str(raw, 'ascii', errors='replace').replace('\r', '\\r').replace('\n', '\\n')
             print(f"  [{label}] {len(raw)} bytes raw")
             if len(raw) <= 200:
                 print(f"  HEX: {hex_dump(raw)}")
             else:
-                print(f"  HEX (first 100): {hex_dump(raw[:100])}")
+                print(f"  HEX (first 100): {hex_dump(raw, limit=100)}")
             if any(32 <= b < 127 for b in raw):
                 print(f"  ASCII: {ascii_str[:200]}")
         else:
@@ -245,7 +326,7 @@ def main():
         print(f"  TX[{attempt}]: {hex_dump(frame)}")
         ser.write(frame)
         ser.flush()
-        read_all(1.0, f"broadcast_{attempt}")
+        read_all(1.0, f"broadcast_{attempt}", until=new_frame())
 
         if parser.ready:
             print(f"  >>> Protocol ready! (after {attempt + 1} attempts)")
@@ -276,7 +357,7 @@ def main():
             print(f"  TX[{attempt}]: {hex_dump(frame)}")
             ser.write(frame)
             ser.flush()
-            read_all(1.0, f"broadcast_retry_{attempt}")
+            read_all(1.0, f"broadcast_retry_{attempt}", until=new_frame())
             if parser.ready:
                 print(f"  >>> Protocol ready after reset!")
                 break
@@ -292,7 +373,7 @@ def main():
         print(f"  TX: {hex_dump(frame)}")
         ser.write(frame)
         ser.flush()
-        read_all(2.0, "subscribe")
+        read_all(2.0, "subscribe", until=new_frame())
 
     # Phase 3: If we got responses, try reading all sensors
     print("\n--- Phase 3: Sensor reads ---")
@@ -313,19 +394,30 @@ def main():
         ("cyberpi.get_name()", "name"),
     ]
 
-    for i, (script, label) in enumerate(sensors):
-        idx = 100 + i
-        frame = build_script_frame(script, idx=idx, mode=MODE_RUN_WITH_RESPONSE)
-        print(f"\n  [{label}] TX: {hex_dump(frame[:20])}... ({len(frame)} bytes)")
-        ser.write(frame)
-        ser.flush()
-        read_all(1.0, label)
+    # Every request carries its own idx, so all of them go out in one burst
+    # and replies are matched back by idx instead of one round trip each
+    sensor_idx = [100 + i for i in range(len(sensors))]
+    frames = [build_script_frame(script, idx=idx, mode=MODE_RUN_WITH_RESPONSE)
+              for idx, (script, _) in zip(sensor_idx, sensors)]
+    for idx, (_, label), frame in zip(sensor_idx, sensors, frames):
+        print(f"  [{label}] TX idx={idx}: {hex_dump(frame, limit=20)}... ({len(frame)} bytes)")
+    for idx in sensor_idx:
+        parser.by_idx.pop(idx, None)
+    ser.write(b"".join(frames))
+    ser.flush()
+    read_all(3.0, "sensors", until=lambda: all(idx in parser.by_idx for idx in sensor_idx))
+    for idx, (_, label) in zip(sensor_idx, sensors):
+        frame = parser.by_idx.get(idx)
+        if frame:
+            print(f"  [{label}] RX idx={idx}: {hex_dump(frame[8:-2])}")
+        else:
+            print(f"  [{label}] no response (idx={idx})")
 
     # Phase 4: Try sending a display command (fire-and-forget)
     print("\n--- Phase 4: Display test (no response expected) ---")
     display_script = 'cyberpi.console.println("Hello from Rust!")'
     frame = build_script_frame(display_script, idx=200, mode=MODE_RUN_WITHOUT_RESPONSE)
-    print(f"  TX: {hex_dump(frame[:30])}... ({len(frame)} bytes)")
+    print(f"  TX: {hex_dump(frame, limit=30)}... ({len(frame)} bytes)")
     ser.write(frame)
     ser.flush()
     read_all(1.0, "display")
@@ -334,7 +426,7 @@ def main():
     print("\n--- Phase 5: Motor test (tiny pulse) ---")
     motor_script = 'mbot2.drive_speed(10, 10)'
     frame = build_script_frame(motor_script, idx=201, mode=MODE_RUN_WITHOUT_RESPONSE)
-    print(f"  TX: {hex_dump(frame[:30])}... ({len(frame)} bytes)")
+    print(f"  TX: {hex_dump(frame, limit=30)}... ({len(frame)} bytes)")
     ser.write(frame)
     ser.flush()
     time.sleep(0.3)
@@ -350,7 +442,7 @@ def main():
     print(f"RESULTS: {len(parser.frames)} f3 frames received")
     print(f"Protocol ready: {parser.ready}")
     for i, frame in enumerate(parser.frames):
-        print(f"  Frame {i}: {hex_dump(frame[:40])}{'...' if len(frame) > 40 else ''} ({len(frame)} bytes)")
+        print(f"  Frame {i}: {hex_dump(frame, limit=40)}{'...' if len(frame) > 40 else ''} ({len(frame)} bytes)")
     print("=" * 70)
 
     ser.close()
@@ -18,6 +18,7 @@ Known Makeblock module IDs:
   0x08=rgbled, 0x0a=dc_motor, 0x0b=servo, 0x22=buzzer
 """
 
+import atexit
 import serial
 import time
 import struct
@@ -25,58 +26,86 @@ import struct
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_live_mode.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
+# Results for the summary: "ff55", "f3", "rx"
+FOUND = set()
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
-
-def hex_dump(data):
-    return data.hex(' ') if data else "(empty)"
+    LOGFH.flush()
+
+IDLE_GAP = 0.05  # seconds of silence that ends a serial read
+
+def drain(ser, idle=IDLE_GAP):
+    """Read until the line has been quiet for `idle` seconds; returns the bytes.
+
+    Each ser.read() blocks in the kernel for up to `idle`, so there is no
+    in_waiting polling or sleep between reads.
+    """
+    if ser.timeout != idle:
+        ser.timeout = idle
+    buf = bytearray()
+    chunk = ser.read(ser.in_waiting or 1)
+    while chunk:
+        buf += chunk
+        chunk = ser.read(ser.in_waiting or 1)
+    return bytes(buf)
+
+def hex_dump(data, limit=None):
+    """Hex bytes, at most the first `limit`, without copying them."""
+    return memoryview(data)[:limit].hex(' ') if data else "(empty)"
+
+FF55_MAGIC = b"\xff\x55"
+# Fixed-size response types: dtype -> (frame length, label, value decoder)
+FF55_FIXED = {
+    1: (5, 'byte', struct.Struct('<B')),
+    2: (8, 'float', struct.Struct('<f')),
+    3: (6, 'short', struct.Struct('<H')),
+}
 
 def parse_ff55_response(data):
-    """Parse FF 55 response frames from raw data."""
+    """Parse FF 55 response frames from raw data.
+
+    Jumps between frames with find() and decodes values in place with
+    unpack_from, so no per-byte Python loop and no value slices.
+    """
     results = []
-    i = 0
-    while i < len(data) - 3:
-        if data[i] == 0xff and data[i+1] == 0x55:
-            idx = data[i+2]
-            dtype = data[i+3]
-            if dtype == 1 and i + 4 < len(data):  # byte
-                results.append((idx, 'byte', data[i+4]))
-                i += 5
-            elif dtype == 2 and i + 7 < len(data):  # float (4 bytes LE)
-                val = struct.unpack('<f', data[i+4:i+8])[0]
-                results.append((idx, 'float', val))
-                i += 8
-            elif dtype == 3 and i + 5 < len(data):  # short (2 bytes LE)
-                val = struct.unpack('<H', data[i+4:i+6])[0]
-                results.append((idx, 'short', val))
-                i += 6
-            elif dtype == 4:  # string (null-terminated)
-                end = data.find(0x00, i+4)
-                if end < 0:
-                    end = len(data)
-                text = data[i+4:end].decode('utf-8', errors='replace')
-                results.append((idx, 'string', text))
-                i = end + 1
-            else:
-                results.append((idx, f'type_{dtype}', data[i+4:min(i+12, len(data))].hex(' ')))
-                i += 4
+    n = len(data)
+    i = data.find(FF55_MAGIC)
+    while 0 <= i < n - 3:
+        idx = data[i+2]
+        dtype = data[i+3]
+        fixed = FF55_FIXED.get(dtype)
+        if fixed and i + fixed[0] <= n:
+            size, label, dec = fixed
+            results.append((idx, label, dec.unpack_from(data, i + 4)[0]))
+            i += size
+        elif dtype == 4:  # string (null-terminated)
+            end = data.find(0x00, i+4)
+            if end < 0:
+                end = n
+            text = bytes(data[i+4:end]).decode('utf-8', errors='replace')
+            results.append((idx, 'string', text))
+            i = end + 1
         else:
-            i += 1
+            results.append((idx, f'type_{dtype}', data[i+4:min(i+12, n)].hex(' ')))
+            i += 4
+        i = data.find(FF55_MAGIC, i)
     return results
 
 def make_ff55_request(index, action, module, port=0, extra=b""):
     """Build an FF 55 request frame."""
-    data = bytes([port]) + extra
-    length = 2 + len(data)  # action + module + data
-    frame = bytes([0xff, 0x55, length, index, action, module]) + data
-    return frame
+    length = 3 + len(extra)  # action + module + port + extra
+    return struct.pack('<BBBBBBB', 0xff, 0x55, length, index, action, module, port) + extra
+
+# PHASE 6/7 module sweep: GET (action 1), port 0 for modules 0x00-0x7f.
+# Each request carries index module + 1 so replies can be matched back
+SWEEP_FRAMES = tuple(make_ff55_request(module + 1, 0x01, module, 0) for module in range(128))
+SWEEP_WINDOW = 0.15  # time each module gets to start (and pause within) a reply
 
 def main():
     log(f"=== CyberPi LIVE MODE Test - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
@@ -86,7 +115,7 @@ def main():
     ser = serial.Serial()
     ser.port = SERIAL_PORT
     ser.baudrate = BAUD
-    ser.timeout = 0.1
+    ser.timeout = IDLE_GAP
     ser.dtr = False
     ser.rts = False
     ser.open()
@@ -103,10 +132,7 @@ def main():
     time.sleep(5.0)
 
     # Drain boot data
-    boot = b""
-    while ser.in_waiting:
-        boot += ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    boot = drain(ser)
     log(f"Boot data: {len(boot)} bytes drained")
 
     def send_and_read(data, label, wait=2.0):
@@ -114,13 +140,11 @@ def main():
         ser.reset_input_buffer()
         ser.write(data)
         time.sleep(wait)
-        resp = b""
-        while ser.in_waiting:
-            resp += ser.read(ser.in_waiting)
-            time.sleep(0.05)
+        resp = drain(ser)
         log(f"\n  [{label}] TX: {hex_dump(data)}")
         log(f"  [{label}] RX ({len(resp)} bytes): {hex_dump(resp)}")
         if resp:
+            FOUND.add("rx")
             text = resp.decode('utf-8', errors='replace')
             printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
             if printable.strip():
@@ -128,12 +152,40 @@ def main():
             # Check for FF 55 responses
             ff55_resps = parse_ff55_response(resp)
             if ff55_resps:
+                FOUND.add("ff55")
                 log(f"  FF55 responses: {ff55_resps}")
             # Check for f3 frames
             if 0xf3 in resp:
+                FOUND.add("f3")
                 log(f"  Contains f3 frames!")
         return resp
 
+    def ff55_sweep():
+        """GET every module 0x00-0x7f without flushing between requests.
+
+        Each reply is read until the line has been quiet for SWEEP_WINDOW.
+        Bytes are logged under the module whose window they arrived in, but
+        responders are built from the FF 55 replies in the whole capture,
+        keyed by index byte (module + 1), so a late reply is credited to
+        the module that sent it. Returns {module: [(type, value), ...]}.
+        """
+        responders = {}
+        capture = bytearray()
+        for module in range(0, 128):
+            ser.write(SWEEP_FRAMES[module])
+            resp = drain(ser, SWEEP_WINDOW)
+            if resp:
+                capture += resp
+                log(f"  Module 0x{module:02x} window: RX [{len(resp)}] {hex_dump(resp, limit=32)}")
+        for idx, typ, val in parse_ff55_response(capture):
+            FOUND.add("ff55")
+            if 1 <= idx <= 128:
+                responders.setdefault(idx - 1, []).append((typ, val))
+                log(f"    FF55 parsed: module 0x{idx - 1:02x} -> {typ} {val}")
+            else:
+                log(f"    FF55 parsed: index {idx} -> {typ} {val}")
+        return responders
+
     # ==========================================
     # PHASE 1: Enter LIVE/DEBUG mode
     # ==========================================
@@ -208,9 +260,7 @@ def main():
     ser.rts = False
     log("Reset. Waiting 5s...")
     time.sleep(5.0)
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    drain(ser)
 
     # Enter live mode FIRST (before any other interaction)
     resp = send_and_read(live_mode, "LIVE mode (fresh)", 3.0)
@@ -230,9 +280,7 @@ def main():
     ser.rts = False
     log("Reset. Waiting 5s...")
     time.sleep(5.0)
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    drain(ser)
 
     # Try FF 55 immediately after boot (default mode)
     for idx, name, module, port in sensor_cmds[:6]:
@@ -243,27 +291,12 @@ def main():
     # PHASE 6: Sweep module IDs 0x00-0x7f with FF 55
     # ==========================================
     log("\n=== PHASE 6: FF 55 module ID sweep ===")
-    responders = {}
-    for module in range(0, 128):
-        frame = make_ff55_request(1, 0x01, module, 0)  # GET, port 0
-        ser.reset_input_buffer()
-        ser.write(frame)
-        time.sleep(0.15)
-        resp = b""
-        while ser.in_waiting:
-            resp += ser.read(ser.in_waiting)
-            time.sleep(0.03)
-        if resp:
-            responders[module] = resp
-            log(f"  Module 0x{module:02x}: RX [{len(resp)}] {hex_dump(resp[:32])}")
-            ff55 = parse_ff55_response(resp)
-            if ff55:
-                log(f"    FF55 parsed: {ff55}")
+    responders = ff55_sweep()
 
     log(f"\n  Responding modules: {len(responders)}")
     if responders:
-        for mod, resp in sorted(responders.items()):
-            log(f"    0x{mod:02x}: {hex_dump(resp[:40])}")
+        for mod, values in sorted(responders.items()):
+            log(f"    0x{mod:02x}: {', '.join(f'{typ} {val}' for typ, val in values)}")
 
     # ==========================================
     # PHASE 7: Combined approach - live mode then sweep
@@ -276,48 +309,32 @@ def main():
         time.sleep(0.1)
         ser.rts = False
         time.sleep(5.0)
-        while ser.in_waiting:
-            ser.read(ser.in_waiting)
-            time.sleep(0.05)
+        drain(ser)
 
         # Enter live mode
         ser.write(live_mode)
         time.sleep(2.0)
-        while ser.in_waiting:
-            resp = ser.read(ser.in_waiting)
+        resp = drain(ser)
+        if resp:
             log(f"  Live mode response: {hex_dump(resp)}")
-            time.sleep(0.05)
 
         # Sweep FF 55
         log("  Sweeping modules after live mode...")
-        for module in range(0, 128):
-            frame = make_ff55_request(1, 0x01, module, 0)
-            ser.reset_input_buffer()
-            ser.write(frame)
-            time.sleep(0.15)
-            resp = b""
-            while ser.in_waiting:
-                resp += ser.read(ser.in_waiting)
-                time.sleep(0.03)
-            if resp:
-                log(f"  Module 0x{module:02x}: RX [{len(resp)}] {hex_dump(resp[:32])}")
-                ff55 = parse_ff55_response(resp)
-                if ff55:
-                    log(f"    FF55 parsed: {ff55}")
+        ff55_sweep()
 
     # ==========================================
     # PHASE 8: Extended listen for streaming data
     # ==========================================
     log("\n=== PHASE 8: Extended listen for streaming data (5s) ===")
     ser.reset_input_buffer()
-    all_data = b""
-    deadline = time.time() + 5.0
-    while time.time() < deadline:
-        if ser.in_waiting:
-            chunk = ser.read(ser.in_waiting)
+    all_data = bytearray()
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        # Blocks for at most ser.timeout (IDLE_GAP) when the line is quiet
+        chunk = ser.read(ser.in_waiting or 1)
+        if chunk:
             all_data += chunk
             log(f"  Stream: [{len(chunk)}] {hex_dump(chunk)}")
-        time.sleep(0.05)
     if not all_data:
         log("  No streaming data")
 
@@ -327,12 +344,11 @@ def main():
     log("\n" + "="*60)
     log("LIVE MODE TEST SUMMARY")
     log("="*60)
-    all_text = "\n".join(LOG)
-    if "FF55 responses:" in all_text or "FF55 parsed:" in all_text:
+    if "ff55" in FOUND:
         log("SUCCESS: FF 55 protocol responses received!")
-    elif "f3 frames" in all_text:
+    elif "f3" in FOUND:
         log("PARTIAL: Got f3 frames but no FF 55 responses")
-    elif any("RX (" in l and "0 bytes" not in l for l in LOG):
+    elif "rx" in FOUND:
         log("PARTIAL: Some responses received (check details above)")
     else:
         log("NEGATIVE: No sensor data received")
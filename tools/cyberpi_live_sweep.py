@@ -15,26 +15,71 @@ Also try: text commands in live mode, since CyberPiOS seems to parse
 serial input as commands.
 """
 
+import atexit
+import binascii
 import serial
 import time
 import struct
+from cyberpi_serial_common import (low_latency, read_into, read_quiet, reset_device,
+                                   size_rx_buffer, wait_readable, write_frames)
 
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_live_sweep.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
+
+# Binary sidecar holding every probe that got a reply, in full: one
+# CAPTURE_RECORD (time.time(), len(tx), len(rx)) followed by tx then rx
+CAPTURE_FILE = "/tmp/cyberpi_live_sweep.cap"
+CAPTURE_RECORD = struct.Struct('<dII')
+CAPFH = open(CAPTURE_FILE, "wb", buffering=1 << 16)
+atexit.register(CAPFH.close)
+
+# SWEEP 1/2 probes go out in bursts of this many frames (~130 bytes), few
+# enough not to overrun the device's UART receive buffer
+SWEEP_GROUP = 32
+
+# f3 [type] 00 f4 for every type, built once for SWEEP 1 and the re-sweep
+TYPE_FRAMES = tuple(bytes((0xf3, cmd, 0x00, 0xf4)) for cmd in range(0x100))
+# SWEEP 2: first payload bytes tried on every type
+SWEEP2_PAYLOADS = (0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x08, 0x0d, 0x10, 0x20)
+# Reply timing: once CALIBRATE_AFTER replies have been seen, the wait for a
+# reply's first byte shrinks to twice their 95th-percentile latency (never
+# below MIN_WAIT or above the caller's wait). A reply ends after the line
+# has been quiet for REPLY_GAP (~1150 character times at 115200 baud).
+CALIBRATE_AFTER = 20
+MIN_WAIT = 0.02
+REPLY_GAP = 0.1
+
+# SWEEP 3 commands that may switch the device's mode; these are sent one at
+# a time after the burst so they cannot change how the others are answered
+MODE_TEXT_CMDS = (b"mode\r\n", b"mode live\r\n", b"live\r\n")
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    LOGFH.flush()
+
+# Maps every byte that is not printable ASCII (or \n \r) to '.'
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\n\r" else 0x2e for b in range(256))
+
+def capture(tx, rx):
+    CAPFH.write(CAPTURE_RECORD.pack(time.time(), len(tx), len(rx)))
+    CAPFH.write(tx)
+    CAPFH.write(rx)
 
 def hex_dump(data):
     return data.hex(' ') if data else "(empty)"
 
+def hex_preview(data, limit):
+    """Compact hex of the first `limit` bytes, for per-probe log lines."""
+    return binascii.hexlify(memoryview(data)[:limit]).decode('ascii') if data else "(empty)"
+
 def main():
     log(f"=== CyberPi Live Mode f3 Sweep - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
 
@@ -47,28 +92,63 @@ def main():
     ser.open()
     ser.dtr = False
     ser.rts = False
+    low_latency(ser, log)
+    size_rx_buffer(ser, 10, log)  # the 10s listen must fit if reads stall
     time.sleep(0.1)
 
     # Reset
     log("=== Reset CyberPi ===")
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(5.0)
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    reset_device(ser)
+
+    latencies = []  # seconds from write to a reply's first byte
+
+    def first_byte(wait):
+        """Wait for a reply to start; True if it did within the wait."""
+        if len(latencies) >= CALIBRATE_AFTER:
+            p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+            wait = min(wait, max(MIN_WAIT, 2 * p95))
+        start = time.monotonic()
+        if not wait_readable(ser, wait):
+            return False
+        latencies.append(time.monotonic() - start)
+        return True
 
     def send(data, label, wait=0.3):
         ser.reset_input_buffer()
         ser.write(data)
-        time.sleep(wait)
-        resp = b""
-        while ser.in_waiting:
-            resp += ser.read(ser.in_waiting)
-            time.sleep(0.03)
+        if not first_byte(wait):
+            return b""
+        resp = read_quiet(ser, REPLY_GAP)
+        if resp:
+            capture(data, resp)
         return resp
 
+    def probe(probes, quiet):
+        """Send (key, frame) probes as one burst and return {key: reply}.
+
+        A silent burst costs one round trip. A burst that gets any reply is
+        split in half and re-probed, down to single frames, so every reply
+        is attributed to the frame that caused it.
+        """
+        ser.reset_input_buffer()
+        write_frames(ser, [frame for _, frame in probes])
+        ser.flush()  # quiet time counts from the end of the burst
+        resp = read_quiet(ser, quiet) if first_byte(quiet) else b""
+        if not resp:
+            return {}
+        if len(probes) == 1:
+            capture(probes[0][1], resp)
+            return {probes[0][0]: resp}
+        mid = len(probes) // 2
+        return {**probe(probes[:mid], quiet), **probe(probes[mid:], quiet)}
+
+    def sweep(probes, quiet):
+        """probe() every (key, frame) pair, SWEEP_GROUP frames per burst."""
+        hits = {}
+        for i in range(0, len(probes), SWEEP_GROUP):
+            hits.update(probe(probes[i:i + SWEEP_GROUP], quiet))
+        return hits
+
     # ==========================================
     # Enter LIVE mode
     # ==========================================
@@ -76,8 +156,7 @@ def main():
     resp = send(bytes([0xf3, 0x0d, 0x00, 0x00, 0xf4]), "live mode", 3.0)
     log(f"  Live mode response ({len(resp)}): {hex_dump(resp)}")
     if resp:
-        text = resp.decode('utf-8', errors='replace')
-        printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
+        printable = resp.translate(PRINTABLE).decode('ascii')
         if printable.strip():
             log(f"  TXT: {printable.strip()}")
 
@@ -86,34 +165,30 @@ def main():
     # ==========================================
     log("\n=== SWEEP 1: f3 [type] 00 f4 in Live mode ===")
     responders = {}
-    for cmd in range(0x00, 0x100):
-        if cmd == 0x0d:  # Skip mode switch
-            continue
-        frame = bytes([0xf3, cmd, 0x00, 0xf4])
-        resp = send(frame, f"f3 0x{cmd:02x}", 0.12)
-        if resp:
-            responders[cmd] = resp
-            log(f"  0x{cmd:02x}: [{len(resp)}] {hex_dump(resp[:40])}")
+    probes = [(cmd, TYPE_FRAMES[cmd])
+              for cmd in range(0x00, 0x100)
+              if cmd != 0x0d]  # Skip mode switch
+    for cmd, resp in sweep(probes, 0.05).items():
+        responders[cmd] = resp
+        log(f"  0x{cmd:02x}: [{len(resp)}] {hex_preview(resp, 40)}")
 
     log(f"\n  Responders: {len(responders)}")
     if responders:
         for cmd, resp in sorted(responders.items()):
-            log(f"    0x{cmd:02x}: {hex_dump(resp[:60])}")
+            log(f"    0x{cmd:02x}: {hex_preview(resp, 60)}")
 
     # ==========================================
     # SWEEP 2: f3 with 2-byte payloads
     # ==========================================
     log("\n=== SWEEP 2: f3 [type] [00|01|02] 00 f4 ===")
-    for payload_byte in [0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x08, 0x0d, 0x10, 0x20]:
-        for cmd in range(0x00, 0x100):
-            if cmd == 0x0d:
-                continue
-            frame = bytes([0xf3, cmd, payload_byte, 0x00, 0xf4])
-            resp = send(frame, f"f3 {cmd:02x} {payload_byte:02x}", 0.08)
-            if resp:
-                if cmd not in responders:
-                    responders[cmd] = resp
-                log(f"  type=0x{cmd:02x} p1=0x{payload_byte:02x}: [{len(resp)}] {hex_dump(resp[:40])}")
+    probes = [((cmd, payload_byte), bytes((0xf3, cmd, payload_byte, 0x00, 0xf4)))
+              for payload_byte in SWEEP2_PAYLOADS
+              for cmd in range(0x00, 0x100)
+              if cmd != 0x0d]
+    for (cmd, payload_byte), resp in sweep(probes, 0.08).items():
+        if cmd not in responders:
+            responders[cmd] = resp
+        log(f"  type=0x{cmd:02x} p1=0x{payload_byte:02x}: [{len(resp)}] {hex_preview(resp, 40)}")
 
     log(f"\n  Total responders: {len(responders)}")
 
@@ -146,12 +221,17 @@ def main():
         b"brightness\r\n",
         b"gyro\r\n",
     ]
+    # Independent commands go out in bursts; mode switches follow singly
+    replies = sweep([(cmd, cmd) for cmd in text_cmds if cmd not in MODE_TEXT_CMDS], 0.5)
+    for cmd in MODE_TEXT_CMDS:
+        resp = send(cmd, "text", 0.5)
+        if resp:
+            replies[cmd] = resp
     for cmd in text_cmds:
-        resp = send(cmd, f"text: {cmd.strip()[:30]}", 0.5)
+        resp = replies.get(cmd)
         if resp:
-            log(f"  '{cmd.strip().decode(errors='replace')}': [{len(resp)}] {hex_dump(resp[:40])}")
-            text = resp.decode('utf-8', errors='replace')
-            printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
+            log(f"  '{cmd.strip().decode(errors='replace')}': [{len(resp)}] {hex_preview(resp, 40)}")
+            printable = resp.translate(PRINTABLE).decode('ascii')
             if printable.strip():
                 log(f"    TXT: {printable.strip()[:100]}")
 
@@ -196,11 +276,20 @@ def main():
         bytes([0xf3, 0xfd, 0x00, 0xf4]),
         bytes([0xf3, 0xfe, 0x00, 0xf4]),
     ]
+    # Type 0x0d is the mode switch: those patterns are sent singly after
+    # the others have gone out in bursts. Replies are logged at the end.
+    replies = sweep([(pat, pat) for pat in mblock_patterns if pat[1] != 0x0d], 0.3)
     for pat in mblock_patterns:
-        resp = send(pat, f"f3: {hex_dump(pat)}", 0.3)
-        if resp:
-            log(f"  TX: {hex_dump(pat)}")
-            log(f"  RX: [{len(resp)}] {hex_dump(resp[:40])}")
+        if pat[1] == 0x0d:
+            resp = send(pat, "mblock pattern", 0.3)
+            if resp:
+                replies[pat] = resp
+    for pat in mblock_patterns:
+        resp = replies.get(pat)
+        if not resp:
+            continue
+        log(f"  TX: {hex_dump(pat)}")
+        log(f"  RX: [{len(resp)}] {hex_preview(resp, 40)}")
 
     # ==========================================
     # SWEEP 5: Try re-entering live mode and waiting
@@ -208,29 +297,33 @@ def main():
     log("\n=== SWEEP 5: Re-enter live mode, long listen ===")
 
     # Reset
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(5.0)
-    while ser.in_waiting:
-        ser.read(ser.in_waiting)
-        time.sleep(0.05)
+    reset_device(ser)
 
     # Enter live mode cleanly
     resp = send(bytes([0xf3, 0x0d, 0x00, 0x00, 0xf4]), "live mode", 2.0)
-    log(f"  Live mode: [{len(resp)}] {hex_dump(resp[:40])}")
+    log(f"  Live mode: [{len(resp)}] {hex_preview(resp, 40)}")
 
     # Now listen for 10 seconds - maybe CyberPi streams data in live mode
     log("\n  Listening for 10 seconds...")
     ser.reset_input_buffer()
-    all_data = b""
-    deadline = time.time() + 10.0
-    while time.time() < deadline:
-        if ser.in_waiting:
-            chunk = ser.read(ser.in_waiting)
-            all_data += chunk
-            log(f"  RX @ {time.time()-deadline+10:.1f}s: [{len(chunk)}] {hex_dump(chunk)}")
-        time.sleep(0.05)
+    # Reads land straight in one preallocated buffer; 10s at 115200 baud
+    # is ~115KB, so it never fills
+    listen_buf = memoryview(bytearray(1 << 20))
+    received = 0
+    # Sleeps in select() between bursts: no wakeups while the line is idle
+    start = time.monotonic()
+    deadline = start + 10.0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not wait_readable(ser, remaining):
+            continue
+        n = read_into(ser, listen_buf[received:])
+        chunk = listen_buf[received:received + n]
+        received += n
+        log(f"  RX @ {time.monotonic() - start:.1f}s: [{n}] {hex_dump(chunk)}")
+    all_data = listen_buf[:received]
 
     if all_data:
         log(f"\n  Total received: {len(all_data)} bytes")
@@ -245,22 +338,20 @@ def main():
     hs = bytes([0xf3, 0xf5, 0x02, 0x00, 0x08, 0xc0, 0xc8, 0xf4])
     resp = send(hs, "f5 in live mode", 1.0)
     log(f"  f5 TX: {hex_dump(hs)}")
-    log(f"  f5 RX: [{len(resp)}] {hex_dump(resp[:60])}")
+    log(f"  f5 RX: [{len(resp)}] {hex_preview(resp, 60)}")
     if resp:
-        text = resp.decode('utf-8', errors='replace')
-        printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
+        printable = resp.translate(PRINTABLE).decode('ascii')
         if printable.strip():
             log(f"  TXT: {printable.strip()[:100]}")
 
     # Did f5 change the mode? Try f3 sweep again
     log("\n  Quick re-sweep after f5...")
-    for cmd in [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0a,
-                0x0e, 0x0f, 0x10, 0x20, 0x30, 0x40, 0x50, 0x60, 0x70, 0x80,
-                0x90, 0xa0, 0xb0, 0xf0, 0xf1, 0xf2, 0xf3, 0xf7, 0xf8, 0xf9]:
-        frame = bytes([0xf3, cmd, 0x00, 0xf4])
-        resp = send(frame, f"re-sweep 0x{cmd:02x}", 0.12)
-        if resp:
-            log(f"  0x{cmd:02x}: [{len(resp)}] {hex_dump(resp[:40])}")
+    probes = [(cmd, TYPE_FRAMES[cmd])
+              for cmd in [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0a,
+                          0x0e, 0x0f, 0x10, 0x20, 0x30, 0x40, 0x50, 0x60, 0x70, 0x80,
+                          0x90, 0xa0, 0xb0, 0xf0, 0xf1, 0xf2, 0xf3, 0xf7, 0xf8, 0xf9]]
+    for cmd, resp in sweep(probes, 0.12).items():
+        log(f"  0x{cmd:02x}: [{len(resp)}] {hex_preview(resp, 40)}")
 
     ser.close()
 
@@ -271,7 +362,7 @@ def main():
     log(f"f3 command types that responded: {len(responders)}")
     if responders:
         for cmd, resp in sorted(responders.items()):
-            log(f"  0x{cmd:02x}: {hex_dump(resp[:50])}")
+            log(f"  0x{cmd:02x}: {hex_preview(resp, 50)}")
     else:
         log("  NONE - CyberPi does not respond to any f3 commands in live mode")
         log("\n  CyberPiOS in live mode appears to be a write-only channel.")
@@ -279,6 +370,7 @@ def main():
         log("  mBlock likely uses a DIFFERENT transport for responses (WebSocket? BLE?)")
 
     log(f"\nLog: {LOGFILE}")
+    log(f"Full replies: {CAPTURE_FILE}")
     log("="*60)
     save_log()
 
@@ -15,32 +15,31 @@ This script hunts for where the output goes:
   5. Tries LED flash to confirm execution
 """
 
+import atexit
 import serial
 import time
 import sys
 import threading
+from cyberpi_serial_common import f3_frames, low_latency, read_available, read_until, reset_device, size_rx_buffer, wait_readable
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_output_hunt.log"
-LOG = []
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
 
 def log(msg):
     print(msg)
-    LOG.append(msg)
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
 
 def save_log():
-    with open(LOGFILE, "w") as f:
-        f.write("\n".join(LOG))
+    LOGFH.flush()
 
 def setup_repl(ser):
     """Reset and get to REPL prompt."""
-    # Reset
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(4.0)
-    ser.reset_input_buffer()
+    reset_device(ser, 4.0)
 
     # Enter upload mode
     ser.write(b"mode upload\r\n")
@@ -49,15 +48,7 @@ def setup_repl(ser):
 
     # Ctrl+A to enter REPL (this gave us >>> before)
     ser.write(b"\x01")
-    time.sleep(2.0)
-
-    buf = b""
-    end = time.time() + 3.0
-    while time.time() < end:
-        n = ser.in_waiting
-        if n:
-            buf += ser.read(n)
-        time.sleep(0.01)
+    buf = read_until(ser, b">>>", 5.0)
 
     if b">>>" in buf:
         log("REPL prompt obtained!")
@@ -66,18 +57,27 @@ def setup_repl(ser):
         log(f"No REPL prompt. Got {len(buf)} bytes: {buf[:100]!r}")
         return False
 
-def continuous_read(ser, duration=5.0):
-    """Read bytes continuously, logging timestamps."""
+def continuous_read(ser, duration=5.0, until=None):
+    """Read bytes continuously, logging timestamps.
+
+    If given, reading stops early once the `until` marker has arrived.
+    """
     chunks = []
-    start = time.time()
+    seen = bytearray()
+    start = time.monotonic()
     end = start + duration
-    while time.time() < end:
-        n = ser.in_waiting
-        if n:
-            data = ser.read(n)
-            elapsed = time.time() - start
-            chunks.append((elapsed, data))
-        time.sleep(0.005)  # 5ms poll
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_readable(ser, remaining):
+            data = read_available(ser)
+            if data:
+                chunks.append((time.monotonic() - start, data))
+                if until:
+                    seen += data
+                    if until in seen:
+                        break
     return chunks
 
 def main():
@@ -92,6 +92,8 @@ def main():
     ser.open()
     ser.dtr = False
     ser.rts = False
+    low_latency(ser, log)
+    size_rx_buffer(ser, 10, log)  # the 10s listen must fit if reads stall
     time.sleep(0.1)
 
     if not setup_repl(ser):
@@ -160,8 +162,7 @@ def main():
     log(f"  After Ctrl+C: {resp!r}")
 
     ser.write(b"\x01")  # Ctrl+A - enter raw REPL
-    time.sleep(0.5)
-    chunks = continuous_read(ser, 2.0)
+    chunks = continuous_read(ser, 2.5, until=b">")
     total = b"".join(c[1] for c in chunks)
     log(f"  After Ctrl+A: {len(total)} bytes")
     if total:
@@ -176,7 +177,7 @@ def main():
         log("\n=== TEST 4b: Raw REPL print test ===")
         ser.reset_input_buffer()
         ser.write(b"print('RAW_HELLO')\x04")
-        chunks = continuous_read(ser, 5.0)
+        chunks = continuous_read(ser, 5.0, until=b"\x04>")
         total = b"".join(c[1] for c in chunks)
         log(f"  Received {len(total)} bytes")
         for elapsed, data in chunks:
@@ -191,13 +192,11 @@ def main():
     log("\n=== TEST 5: Paste mode (Ctrl+E from normal REPL) ===")
     ser.reset_input_buffer()
     ser.write(b"\x02")  # Ctrl+B back to normal REPL
-    time.sleep(0.5)
-    resp = ser.read(1000)
+    resp = read_until(ser, b">>>", 0.5)
     log(f"  After Ctrl+B: {resp!r}")
 
     ser.write(b"\x05")  # Ctrl+E - paste mode
-    time.sleep(0.5)
-    chunks = continuous_read(ser, 2.0)
+    chunks = continuous_read(ser, 2.5, until=b"===")
     total = b"".join(c[1] for c in chunks)
     log(f"  After Ctrl+E: {len(total)} bytes")
     if total:
@@ -207,7 +206,7 @@ def main():
         log("  Paste mode detected!")
         ser.write(b"print('PASTE_TEST')\r\n")
         ser.write(b"\x04")  # Ctrl+D to execute
-        chunks = continuous_read(ser, 3.0)
+        chunks = continuous_read(ser, 3.0, until=b">>>")
         total = b"".join(c[1] for c in chunks)
         log(f"  Paste output: {len(total)} bytes")
         if total:
@@ -234,8 +233,7 @@ def main():
     ser.write(b"\x03\x03")
     time.sleep(0.3)
     ser.write(b"\x01")  # Ctrl+A
-    time.sleep(2.0)
-    resp = ser.read(2000)
+    resp = read_until(ser, b">", 2.0)
     if b">>>" in resp or b">" in resp:
         log("  Back in REPL")
         ser.reset_input_buffer()
@@ -262,23 +260,11 @@ def main():
     save_log()
 
 def show_frames(data):
-    idx = 0
-    num = 0
-    while idx < len(data):
-        if data[idx] == 0xf3:
-            end = data.find(b"\xf4", idx + 1)
-            if end != -1:
-                frame = data[idx:end+1]
-                num += 1
-                log(f"    Frame {num}: type=0x{frame[1]:02x} ({frame.hex(' ')})")
-                if len(frame) > 3:
-                    payload = frame[2:-1]
-                    log(f"      Payload: {payload.hex(' ')} | {payload.decode('utf-8', errors='replace')!r}")
-                idx = end + 1
-            else:
-                break
-        else:
-            idx += 1
+    for num, frame in enumerate(f3_frames(data), 1):
+        log(f"    Frame {num}: type=0x{frame[1]:02x} ({frame.hex(' ')})")
+        if len(frame) > 3:
+            payload = frame[2:-1]
+            log(f"      Payload: {payload.hex(' ')} | {payload.decode('utf-8', errors='replace')!r}")
 
 if __name__ == "__main__":
     main()
@@ -22,6 +22,7 @@ import serial
 import time
 import sys
 import os
+from cyberpi_serial_common import f3_frames, low_latency, read_for, read_until, reset_device
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
@@ -39,26 +40,19 @@ def log(msg, data=None):
             except:
                 pass
 
-def read_all(ser, timeout=2.0):
-    """Read all available bytes within timeout."""
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
-        n = ser.in_waiting
-        if n > 0:
-            chunk = ser.read(n)
-            buf += chunk
-        else:
-            time.sleep(0.05)
-    return buf
+def send_and_read(ser, data, label="", timeout=2.0, until=None):
+    """Send data and read response.
 
-def send_and_read(ser, data, label="", timeout=2.0):
-    """Send data and read response."""
+    With `until`, the read ends as soon as that prompt marker arrives.
+    """
     if isinstance(data, str):
         data = data.encode()
     ser.write(data)
-    time.sleep(0.1)
-    resp = read_all(ser, timeout)
+    if until:
+        resp = read_until(ser, until, timeout + 0.1)
+    else:
+        time.sleep(0.1)
+        resp = read_for(ser, timeout)
     if label:
         log(f"\n--- {label} ---")
         log(f"  TX ({len(data)}): {data!r}")
@@ -91,18 +85,14 @@ def main():
     # Ensure DTR/RTS are off
     ser.dtr = False
     ser.rts = False
+    low_latency(ser, log)
     time.sleep(0.1)
 
     log("Port opened. DTR=False, RTS=False")
 
     # Reset via RTS toggle
     log("\n=== PHASE 1: Reset CyberPi ===")
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(2.0)  # Wait for boot
-
-    boot = read_all(ser, 3.0)
+    boot = reset_device(ser, 5.0)
     log("Boot output:", boot)
     if boot:
         text = boot.decode('utf-8', errors='replace')
@@ -111,9 +101,6 @@ def main():
             if stripped:
                 log(f"  BOOT> {stripped}")
 
-    # Flush
-    ser.reset_input_buffer()
-
     # Phase 2: Enter upload mode
     log("\n=== PHASE 2: Enter upload mode ===")
     resp = send_and_read(ser, "mode upload\r\n", "mode upload", 3.0)
@@ -123,7 +110,7 @@ def main():
 
     # Phase 3: Try RAW REPL (Ctrl+A only, NO Ctrl+B)
     log("\n=== PHASE 3: Raw REPL (Ctrl+A only) ===")
-    resp = send_and_read(ser, b"\x01", "Ctrl+A (raw REPL)", 3.0)
+    resp = send_and_read(ser, b"\x01", "Ctrl+A (raw REPL)", 3.0, until=b">")
 
     # Check for raw REPL prompt
     raw_repl_active = b"raw REPL" in resp or b">" in resp
@@ -132,7 +119,7 @@ def main():
     if not raw_repl_active:
         # Maybe we need to send Ctrl+A twice or wait
         log("  Retrying Ctrl+A...")
-        resp2 = send_and_read(ser, b"\x01", "Ctrl+A retry", 2.0)
+        resp2 = send_and_read(ser, b"\x01", "Ctrl+A retry", 2.0, until=b">")
         raw_repl_active = b"raw REPL" in resp2 or b">" in resp2
         resp = resp + resp2
 
@@ -140,7 +127,7 @@ def main():
     log("\n=== PHASE 4: Raw REPL test - print('PROBE_OK') ===")
     # In raw REPL: send code + Ctrl+D (\x04)
     test_code = b"print('PROBE_OK_12345')\x04"
-    resp = send_and_read(ser, test_code, "raw REPL print test", 3.0)
+    resp = send_and_read(ser, test_code, "raw REPL print test", 3.0, until=b"\x04>")
 
     if b"PROBE_OK_12345" in resp:
         log("\n*** SUCCESS: Raw REPL output received! ***")
@@ -155,35 +142,22 @@ def main():
     if b"\xf3" in resp:
         log("  Found f3 bytes - CyberPiOS protocol framing detected")
         # Try to extract f3 frames
-        idx = 0
-        frame_num = 0
-        while idx < len(resp):
-            if resp[idx] == 0xf3:
-                # Find f4 terminator
-                end_idx = resp.find(b"\xf4", idx + 1)
-                if end_idx != -1:
-                    frame = resp[idx:end_idx+1]
-                    frame_num += 1
-                    log(f"  Frame {frame_num}: {frame.hex(' ')}")
-                    # Payload is between f3 XX and f4
-                    if len(frame) > 2:
-                        payload = frame[2:-1]  # skip f3, type byte, and f4
-                        log(f"    Payload: {payload!r}")
-                    idx = end_idx + 1
-                else:
-                    break
-            else:
-                idx += 1
+        for frame_num, frame in enumerate(f3_frames(resp), 1):
+            log(f"  Frame {frame_num}: {frame.hex(' ')}")
+            # Payload is between f3 XX and f4
+            if len(frame) > 2:
+                payload = frame[2:-1]  # skip f3, type byte, and f4
+                log(f"    Payload: {payload!r}")
 
     # Phase 5: Try normal REPL too (Ctrl+B) and test print there
     log("\n=== PHASE 5: Switch to normal REPL (Ctrl+B) ===")
-    resp = send_and_read(ser, b"\x02", "Ctrl+B (normal REPL)", 3.0)
+    resp = send_and_read(ser, b"\x02", "Ctrl+B (normal REPL)", 3.0, until=b">>>")
 
     if b">>>" in resp:
         log("  Normal REPL prompt detected")
 
         log("\n=== PHASE 6: Normal REPL print test ===")
-        resp = send_and_read(ser, b"print('NORMAL_OK_67890')\r\n", "normal REPL print", 3.0)
+        resp = send_and_read(ser, b"print('NORMAL_OK_67890')\r\n", "normal REPL print", 3.0, until=b">>>")
 
         if b"NORMAL_OK_67890" in resp:
             log("\n*** SUCCESS: Normal REPL output received! ***")
@@ -197,7 +171,7 @@ def main():
     if b">>>" in resp:
         resp = send_and_read(ser,
             b"import cyberpi; print('SND:' + str(cyberpi.get_loudness()))\r\n",
-            "sensor read test", 3.0)
+            "sensor read test", 3.0, until=b">>>")
         if b"SND:" in resp:
             log("\n*** SENSOR DATA RECEIVED! ***")
 
@@ -205,7 +179,7 @@ def main():
     log("\n=== PHASE 8: machine.UART direct write ===")
     # Go back to raw REPL for multi-line
     ser.reset_input_buffer()
-    send_and_read(ser, b"\x01", "back to raw REPL", 2.0)
+    send_and_read(ser, b"\x01", "back to raw REPL", 2.0, until=b">")
 
     uart_code = (
         b"import machine\n"
@@ -213,7 +187,7 @@ def main():
         b"u.write(b'UART_DIRECT_OK\\n')\n"
         b"\x04"
     )
-    resp = send_and_read(ser, uart_code, "UART direct write", 3.0)
+    resp = send_and_read(ser, uart_code, "UART direct write", 3.0, until=b"\x04>")
     if b"UART_DIRECT_OK" in resp:
         log("\n*** SUCCESS: machine.UART direct write works! ***")
 
@@ -224,7 +198,7 @@ def main():
         b"sys.stdout.buffer.write(b'STDOUT_BUF_OK\\n')\n"
         b"\x04"
     )
-    resp = send_and_read(ser, stdout_code, "sys.stdout.buffer.write", 3.0)
+    resp = send_and_read(ser, stdout_code, "sys.stdout.buffer.write", 3.0, until=b"\x04>")
     if b"STDOUT_BUF_OK" in resp:
         log("\n*** SUCCESS: sys.stdout.buffer.write works! ***")
 
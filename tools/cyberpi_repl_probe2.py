@@ -8,36 +8,48 @@ Tries the exact sequence that worked in the previous session:
 Then tests every possible way to read output back.
 """
 
+import atexit
 import serial
 import time
 import sys
+from cyberpi_serial_common import (f3_frames, read_for, read_quiet, read_until, reset_device,
+                                   size_rx_buffer, wait_readable)
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_probe2.log"
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
 
-def log(msg, data=None):
+def log(msg, data_hex=None):
     print(msg)
-    with open(LOGFILE, "a") as f:
-        f.write(f"{msg}\n")
-        if data:
-            f.write(f"  HEX: {data.hex(' ')}\n")
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
+    if data_hex:
+        LOGFH.write(f"  HEX: {data_hex}\n")  # file only: the full dump
+
+def save_log():
+    LOGFH.flush()
 
 def read_all(ser, timeout=2.0):
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
-        n = ser.in_waiting
-        if n > 0:
-            buf += ser.read(n)
-        else:
-            time.sleep(0.02)
-    return buf
+    """Everything received in the next timeout seconds (sleeps in select,
+    not in 20ms polls)."""
+    return read_for(ser, timeout)
+
+def wait_reply(ser, first=3.0, quiet=0.5):
+    """Read a reply that has no known terminator: wait up to `first` seconds
+    for it to start, then until it has been quiet for `quiet` seconds."""
+    if not wait_readable(ser, first):
+        return b""
+    return read_quiet(ser, quiet)
 
 def show(label, data):
     log(f"\n[{label}] ({len(data)} bytes)")
     if data:
-        log(f"  HEX: {data[:200].hex(' ')}", data)
+        # Hex the buffer once; the console line shows its first 200 bytes
+        data_hex = data.hex(' ')
+        log(f"  HEX: {data_hex[:3 * 200 - 1]}", data_hex)
         text = data.decode('utf-8', errors='replace')
         for line in text.split('\n'):
             s = line.strip()
@@ -46,134 +58,129 @@ def show(label, data):
     else:
         log("  (empty)")
 
-def main():
-    with open(LOGFILE, "w") as f:
-        f.write(f"=== CyberPi REPL Probe v2 - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+# Prompt-acquisition stages, tried in order until one returns True (a >>>
+# prompt seen). Each takes the open port.
 
-    log(f"Opening {PORT}...")
-    ser = serial.Serial()
-    ser.port = PORT
-    ser.baudrate = BAUD
-    ser.timeout = 0.1
-    ser.dtr = False
-    ser.rts = False
-    ser.open()
-    ser.dtr = False
-    ser.rts = False
-    time.sleep(0.1)
-
-    # Reset
-    log("\n=== RESET ===")
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-
-    # Wait for full boot
-    boot = read_all(ser, 5.0)
-    show("BOOT", boot)
-
-    # Try "mode upload"
+def upload_then_ctrl_ab(ser):
+    """The sequence that worked before: mode upload, Ctrl+A, Ctrl+B."""
     log("\n=== MODE UPLOAD ===")
     ser.reset_input_buffer()
     ser.write(b"mode upload\r\n")
-    time.sleep(0.5)
-    resp = read_all(ser, 3.0)
+    resp = wait_reply(ser, 3.0)
     show("mode upload response", resp)
 
-    # Now the exact sequence: Ctrl+A then Ctrl+B
     log("\n=== CTRL+A then CTRL+B ===")
     ser.reset_input_buffer()
     ser.write(b"\x01")  # Ctrl+A
-    time.sleep(0.5)
-    resp_a = read_all(ser, 2.0)
+    resp_a = read_until(ser, b">", 2.0)
     show("After Ctrl+A", resp_a)
 
     ser.write(b"\x02")  # Ctrl+B
-    time.sleep(0.5)
-    resp_b = read_all(ser, 3.0)
+    resp_b = read_until(ser, b">>>", 3.0)
     show("After Ctrl+B", resp_b)
+    return b">>>" in resp_b or b">>>" in resp_a
 
-    got_prompt = b">>>" in resp_b or b">>>" in resp_a
+def ctrl_c_then_ctrl_ab(ser):
+    """Maybe we need to try harder - interrupt first, then Ctrl+A/B."""
+    log("\n=== RETRY: Ctrl+C x3, then Ctrl+A, Ctrl+B ===")
+    ser.reset_input_buffer()
+    ser.write(b"\x03\x03\x03")  # 3x Ctrl+C
+    resp = wait_reply(ser, 1.0, 0.3)
+    show("After 3x Ctrl+C", resp)
 
-    if not got_prompt:
-        # Maybe we need to try harder - send multiple Ctrl+C then Ctrl+A/B
-        log("\n=== RETRY: Ctrl+C x3, then Ctrl+A, Ctrl+B ===")
-        ser.reset_input_buffer()
-        ser.write(b"\x03\x03\x03")  # 3x Ctrl+C
-        time.sleep(0.5)
-        resp = read_all(ser, 1.0)
-        show("After 3x Ctrl+C", resp)
-
-        ser.write(b"\x01")  # Ctrl+A
-        time.sleep(0.3)
-        ser.write(b"\x02")  # Ctrl+B
-        time.sleep(0.5)
-        resp = read_all(ser, 3.0)
-        show("After Ctrl+A Ctrl+B retry", resp)
-        got_prompt = b">>>" in resp
-
-    if not got_prompt:
-        # Try sending just \r\n to see if we get any prompt
-        log("\n=== RETRY: Just send Enter ===")
-        ser.reset_input_buffer()
-        ser.write(b"\r\n")
-        time.sleep(0.3)
-        resp = read_all(ser, 2.0)
-        show("After Enter", resp)
-        got_prompt = b">>>" in resp
-
-    if not got_prompt:
-        # Maybe mode upload takes longer, or we need "mode upload\n" (no \r)
-        log("\n=== RETRY: Full reset + mode upload (no \\r) ===")
-        ser.rts = True
-        time.sleep(0.1)
-        ser.rts = False
-        boot2 = read_all(ser, 5.0)
-        show("BOOT2", boot2)
+    ser.write(b"\x01")  # Ctrl+A
+    time.sleep(0.3)
+    ser.write(b"\x02")  # Ctrl+B
+    resp = read_until(ser, b">>>", 3.0)
+    show("After Ctrl+A Ctrl+B retry", resp)
+    return b">>>" in resp
 
-        ser.reset_input_buffer()
-        ser.write(b"mode upload\n")
-        time.sleep(1.0)
-        resp = read_all(ser, 3.0)
-        show("mode upload (no \\r)", resp)
-
-        ser.write(b"\x01\x02")  # Ctrl+A Ctrl+B together
-        time.sleep(1.0)
-        resp = read_all(ser, 3.0)
-        show("Ctrl+A+B together", resp)
-        got_prompt = b">>>" in resp
-
-    if not got_prompt:
-        # One more try: maybe the CyberPi is already in some state
-        # Try sending "help" to see if normal text mode works
-        log("\n=== TEST: Send 'help' in text mode ===")
-        ser.reset_input_buffer()
-        ser.write(b"help\r\n")
-        time.sleep(0.5)
-        resp = read_all(ser, 2.0)
-        show("help response", resp)
+def bare_enter(ser):
+    """Send just \\r\\n to see if we get any prompt."""
+    log("\n=== RETRY: Just send Enter ===")
+    ser.reset_input_buffer()
+    ser.write(b"\r\n")
+    resp = read_until(ser, b">>>", 2.0)
+    show("After Enter", resp)
+    return b">>>" in resp
 
-        # Try "reboot" command
-        ser.reset_input_buffer()
-        ser.write(b"reboot\r\n")
-        time.sleep(3.0)
-        resp = read_all(ser, 3.0)
-        show("reboot response", resp)
+def reset_upload_no_cr(ser):
+    """Maybe mode upload takes longer, or we need "mode upload\\n" (no \\r)."""
+    log("\n=== RETRY: Full reset + mode upload (no \\r) ===")
+    boot2 = reset_device(ser, 5.0)
+    show("BOOT2", boot2)
 
-        # After reboot try the sequence again
-        ser.reset_input_buffer()
-        ser.write(b"mode upload\r\n")
-        time.sleep(2.0)
-        resp = read_all(ser, 2.0)
-        show("mode upload after reboot", resp)
-
-        ser.write(b"\x01")
-        time.sleep(0.5)
-        ser.write(b"\x02")
-        time.sleep(1.0)
-        resp = read_all(ser, 3.0)
-        show("Ctrl+A Ctrl+B after reboot", resp)
-        got_prompt = b">>>" in resp
+    ser.reset_input_buffer()
+    ser.write(b"mode upload\n")
+    resp = wait_reply(ser, 3.0)
+    show("mode upload (no \\r)", resp)
+
+    ser.write(b"\x01\x02")  # Ctrl+A Ctrl+B together
+    resp = read_until(ser, b">>>", 3.0)
+    show("Ctrl+A+B together", resp)
+    return b">>>" in resp
+
+def help_reboot_retry(ser):
+    """Maybe the CyberPi is already in some state: check text mode with
+    help, reboot it, then repeat the upload sequence."""
+    log("\n=== TEST: Send 'help' in text mode ===")
+    ser.reset_input_buffer()
+    ser.write(b"help\r\n")
+    resp = wait_reply(ser, 2.0)
+    show("help response", resp)
+
+    # Try "reboot" command
+    ser.reset_input_buffer()
+    ser.write(b"reboot\r\n")
+    resp = wait_reply(ser, 3.0, 1.0)  # boot output pauses while it starts
+    show("reboot response", resp)
+
+    # After reboot try the sequence again
+    ser.reset_input_buffer()
+    ser.write(b"mode upload\r\n")
+    resp = wait_reply(ser, 3.0)
+    show("mode upload after reboot", resp)
+
+    ser.write(b"\x01")
+    time.sleep(0.5)
+    ser.write(b"\x02")
+    resp = read_until(ser, b">>>", 3.0)
+    show("Ctrl+A Ctrl+B after reboot", resp)
+    return b">>>" in resp
+
+PROMPT_STAGES = [upload_then_ctrl_ab, ctrl_c_then_ctrl_ab, bare_enter,
+                 reset_upload_no_cr, help_reboot_retry]
+
+def main():
+    LOGFH.write(f"=== CyberPi REPL Probe v2 - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+
+    log(f"Opening {PORT}...")
+    ser = serial.Serial()
+    ser.port = PORT
+    ser.baudrate = BAUD
+    ser.timeout = 0.1
+    ser.dtr = False
+    ser.rts = False
+    ser.open()
+    ser.dtr = False
+    ser.rts = False
+    size_rx_buffer(ser, 5, log)  # the 5s boot dump must fit if reads stall
+    time.sleep(0.1)
+
+    # Reset
+    log("\n=== RESET ===")
+    boot = reset_device(ser, 5.0)  # returns once the boot output goes quiet
+    show("BOOT", boot)
+
+    got_prompt = False
+    stage_times = []
+    for stage in PROMPT_STAGES:
+        start = time.monotonic()
+        got_prompt = stage(ser)
+        stage_times.append(f"{stage.__name__} {(time.monotonic() - start) * 1000:.0f}ms")
+        if got_prompt:
+            break
+    log(f"\n  Stage times: {', '.join(stage_times)}")
 
     if got_prompt:
         log("\n*** GOT PROMPT! Testing output... ***")
@@ -181,8 +188,7 @@ def main():
         # Test 1: Simple print
         ser.reset_input_buffer()
         ser.write(b"print('HELLO_CYBERPI')\r\n")
-        time.sleep(0.5)
-        resp = read_all(ser, 2.0)
+        resp = read_until(ser, b">>>", 2.5)
         show("print test", resp)
 
         if b"HELLO_CYBERPI" in resp:
@@ -198,22 +204,19 @@ def main():
         # Test 3: Check what sys.stdout is
         ser.reset_input_buffer()
         ser.write(b"import sys; print(type(sys.stdout))\r\n")
-        time.sleep(0.5)
-        resp = read_all(ser, 2.0)
+        resp = read_until(ser, b">>>", 2.5)
         show("sys.stdout type", resp)
 
         # Test 4: Try repr trick - the REPL echoes expression results
         ser.reset_input_buffer()
         ser.write(b"'EXPR_' + 'TEST'\r\n")
-        time.sleep(0.5)
-        resp = read_all(ser, 2.0)
+        resp = read_until(ser, b">>>", 2.5)
         show("expression eval test", resp)
 
         # Test 5: Read back filesystem
         ser.reset_input_buffer()
         ser.write(b"import os; print(os.listdir('/'))\r\n")
-        time.sleep(0.5)
-        resp = read_all(ser, 2.0)
+        resp = read_until(ser, b">>>", 2.5)
         show("os.listdir test", resp)
 
     else:
@@ -237,26 +240,15 @@ def main():
     log("========================================")
 
     ser.close()
+    save_log()
 
 def parse_f3_frames(data):
-    idx = 0
-    num = 0
-    while idx < len(data):
-        if data[idx] == 0xf3:
-            end = data.find(b"\xf4", idx + 1)
-            if end != -1:
-                frame = data[idx:end+1]
-                num += 1
-                log(f"  Frame {num}: type=0x{frame[1]:02x} len={len(frame)}")
-                log(f"    HEX: {frame.hex(' ')}")
-                if len(frame) > 2:
-                    payload = frame[2:-1]
-                    log(f"    Payload text: {payload.decode('utf-8', errors='replace')}")
-                idx = end + 1
-            else:
-                break
-        else:
-            idx += 1
+    for num, frame in enumerate(f3_frames(data), 1):
+        log(f"  Frame {num}: type=0x{frame[1]:02x} len={len(frame)}")
+        log(f"    HEX: {frame.hex(' ')}")
+        if len(frame) > 2:
+            payload = frame[2:-1]
+            log(f"    Payload text: {payload.decode('utf-8', errors='replace')}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+CyberPi serial shared helpers
+
+Port tuning and read helpers used by the USB-serial probe tools.
+"""
+
+import os
+import re
+import select
+import serial
+import sys
+import time
+
+# Frames per probe_burst() in sweep_probes()
+SWEEP_GROUP = 32
+
+# One f3 ... f4 frame: an f3, then everything up to the first f4 after it
+F3_FRAME_RE = re.compile(rb"\xf3[^\xf4]*\xf4")
+
+def f3_frames(data):
+    """Every f3 ... f4 frame in data, in order, found in one regex scan."""
+    return F3_FRAME_RE.findall(data)
+
+def open_port(port, baud, timeout=0.1):
+    """Open the CyberPi's serial port without resetting it.
+
+    DTR and RTS are held low before and after opening: either line going
+    high resets the ESP32.
+    """
+    ser = serial.Serial()
+    ser.port = port
+    ser.baudrate = baud
+    ser.timeout = timeout
+    ser.dtr = False
+    ser.rts = False
+    ser.open()
+    ser.dtr = False
+    ser.rts = False
+    time.sleep(0.1)
+    return ser
+
+def low_latency(ser, log=print):
+    """Cut the USB-serial driver's receive latency to ~1ms.
+
+    USB-serial adapters hold received bytes for up to 16ms before handing
+    them to the host. Setting ASYNC_LOW_LATENCY (TIOCSSERIAL) asks the
+    driver to pass them on at once; FTDI's latency_timer is the fallback.
+    Best effort: without either the port keeps the default latency.
+    """
+    try:
+        ser.set_low_latency_mode(True)
+        log("  Serial: low-latency mode on")
+        return True
+    except (AttributeError, NotImplementedError, OSError, ValueError) as e:
+        err = e
+    timer = f"/sys/bus/usb-serial/devices/{os.path.basename(ser.port)}/latency_timer"
+    try:
+        with open(timer, "w") as f:
+            f.write("1")
+        log("  Serial: latency_timer set to 1ms")
+        return True
+    except OSError:
+        log(f"  Serial: low-latency mode unavailable ({err})")
+        return False
+
+def size_rx_buffer(ser, seconds, log=print):
+    """Size the driver's receive buffer to hold `seconds` of input at the
+    port's baud rate (10 bits per byte).
+
+    Only the Windows driver can be resized (pyserial's set_buffer_size).
+    The Linux tty buffer is fixed at 4KB, so the long listens there rely
+    on reading continuously rather than on buffer size.
+    """
+    if not hasattr(ser, "set_buffer_size"):
+        return
+    size = ser.baudrate // 10 * seconds
+    ser.set_buffer_size(rx_size=size)
+    log(f"  Serial: receive buffer {size} bytes")
+
+def wait_readable(ser, timeout):
+    """Sleep until ser has input or timeout seconds pass; True if readable.
+
+    Sleeps in select() on the port's fd, so it wakes as soon as a byte
+    arrives. pyserial ports are not selectable on Windows; poll there.
+    """
+    if sys.platform == "win32":
+        end = time.monotonic() + timeout
+        while not ser.in_waiting:
+            if time.monotonic() >= end:
+                return False
+            time.sleep(0.005)
+        return True
+    r, _, _ = select.select([ser.fileno()], [], [], timeout)
+    return bool(r)
+
+def read_available(ser):
+    """Bytes already waiting on ser, read straight from the fd on POSIX
+    (one os.read instead of pyserial's read loop)."""
+    if sys.platform == "win32":
+        return ser.read(ser.in_waiting)
+    try:
+        return os.read(ser.fileno(), 65536)
+    except BlockingIOError:
+        return b""
+
+def read_into(ser, view):
+    """Read bytes already waiting on ser into the writable view without an
+    intermediate bytes object; returns the count."""
+    if sys.platform == "win32":
+        return ser.readinto(view[:ser.in_waiting])
+    try:
+        return os.readv(ser.fileno(), [view])
+    except BlockingIOError:
+        return 0
+
+def write_frames(ser, frames):
+    """Write a list of frames as one burst.
+
+    On POSIX the frames go to the fd in a single os.writev gather write,
+    without first joining them into one buffer. Whatever the driver does not
+    take at once is finished through pyserial's blocking write.
+    """
+    if sys.platform == "win32":
+        ser.write(b"".join(frames))
+        return
+    try:
+        sent = os.writev(ser.fileno(), frames)
+    except BlockingIOError:
+        sent = 0
+    if sent < sum(map(len, frames)):
+        ser.write(b"".join(frames)[sent:])
+
+def read_for(ser, timeout):
+    """Everything that arrives within timeout seconds."""
+    buf = bytearray()
+    end = time.monotonic() + timeout
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_readable(ser, remaining):
+            buf += read_available(ser)
+    return bytes(buf)
+
+def read_quiet(ser, quiet, limit=3.0):
+    """Collect input until the line has been quiet for `quiet` seconds
+    (at most `limit` seconds in total)."""
+    buf = bytearray()
+    end = time.monotonic() + limit
+    while time.monotonic() < end and wait_readable(ser, quiet):
+        buf += read_available(ser)
+    return bytes(buf)
+
+def read_until(ser, marker, timeout):
+    """Read until marker has arrived or timeout seconds pass.
+
+    Returns everything read, as soon as the marker is in it, so a
+    responsive device never costs the full timeout.
+    """
+    buf = bytearray()
+    end = time.monotonic() + timeout
+    while marker not in buf:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_readable(ser, remaining):
+            buf += read_available(ser)
+    return bytes(buf)
+
+def enter_upload_repl(ser, timeout=3.0):
+    """From CyberPiOS's default mode, switch to upload mode and press Ctrl+A.
+
+    Waits for the mode switch's reply to finish rather than a fixed delay,
+    then returns what arrived after Ctrl+A, up to and including the >>>
+    prompt (at most timeout seconds). Callers check it for b">>>".
+    """
+    ser.reset_input_buffer()
+    ser.write(b"mode upload\r\n")
+    if wait_readable(ser, 2.0):
+        read_quiet(ser, 0.3)
+    ser.reset_input_buffer()
+    ser.write(b"\x01")  # Ctrl+A
+    return read_until(ser, b">>>", timeout)
+
+def exec_raw_repl(ser, src, timeout=5.0):
+    """Run src as one block in raw REPL (Ctrl+A, source, Ctrl+D), then
+    return to the normal REPL with Ctrl+B.
+
+    Returns everything received while the block ran, up to the end of
+    the raw REPL reply OK<stdout>\\x04<stderr>\\x04> (see raw_repl_sections).
+    """
+    ser.reset_input_buffer()
+    ser.write(b"\x01")
+    read_until(ser, b"\r\n>", 1.0)  # raw REPL; CTRL-B to exit
+    ser.write(src.encode() + b"\x04")
+    resp = read_until(ser, b"\x04>", timeout)
+    ser.write(b"\x02")
+    read_until(ser, b">>> ", 1.0)
+    return resp
+
+def raw_repl_sections(resp):
+    """(stdout, stderr) of a raw REPL reply, or None if it has no OK."""
+    ok = resp.find(b"OK")
+    if ok == -1:
+        return None
+    out, err = (resp[ok + 2:].split(b"\x04") + [b"", b""])[:2]
+    return out, err
+
+def probe_burst(ser, probes, quiet):
+    """Send (key, frame) probes as one burst and return {key: reply}.
+
+    A silent burst costs one round trip. A burst that gets any reply is
+    split in half and re-probed, down to single frames, so every reply
+    is attributed to the frame that caused it.
+    """
+    ser.reset_input_buffer()
+    write_frames(ser, [frame for _, frame in probes])
+    ser.flush()  # quiet time counts from the end of the burst
+    resp = read_quiet(ser, quiet) if wait_readable(ser, quiet) else b""
+    if not resp:
+        return {}
+    if len(probes) == 1:
+        return {probes[0][0]: resp}
+    mid = len(probes) // 2
+    return {**probe_burst(ser, probes[:mid], quiet), **probe_burst(ser, probes[mid:], quiet)}
+
+def sweep_probes(ser, probes, quiet):
+    """probe_burst() every (key, frame) pair, SWEEP_GROUP frames per burst;
+    returns [(key, reply)] for the frames that got one, in probe order."""
+    hits = {}
+    for i in range(0, len(probes), SWEEP_GROUP):
+        hits.update(probe_burst(ser, probes[i:i + SWEEP_GROUP], quiet))
+    return [(key, hits[key]) for key, _ in probes if key in hits]
+
+def reset_device(ser, boot_time=5.0, quiet=1.0):
+    """Pulse RTS to reset the CyberPi and wait for it to finish booting.
+
+    Rather than always sleeping boot_time, waits for the boot banner to
+    start and returns once it has been quiet for `quiet` seconds (or
+    boot_time has passed). Returns the boot output; anything left in the
+    input buffer is discarded.
+    """
+    ser.rts = True
+    time.sleep(0.1)
+    ser.rts = False
+    boot = bytearray()
+    end = time.monotonic() + boot_time
+    wait = boot_time  # the first byte may take the whole boot time
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0 or not wait_readable(ser, min(wait, remaining)):
+            break
+        boot += read_available(ser)
+        wait = quiet
+    ser.reset_input_buffer()
+    return bytes(boot)
@@ -18,12 +18,37 @@ import serial
 import time
 import struct
 import sys
+from cyberpi_serial_common import (f3_frames, read_available, read_quiet, read_until,
+                                   size_rx_buffer, sweep_probes, wait_readable)
 
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_serial_f3_default.log"
 LOG = []
 
+# Probe frames, built once as (key, frame) pairs for sweep_probes().
+# PHASE 4 approaches 1 and 2: ((cmd, payload), frame)
+APPROACH1_PROBES = [((cmd, payload), bytes([0xf3, cmd]) + payload + b"\xf4")
+                    for cmd in range(0x01, 0x21)
+                    for payload in (b"\x00", b"\x01", b"\x00\x00", b"\x01\x00", b"\x02\x00")]
+APPROACH2_PROBES = [((cmd, payload), bytes([0xf3, cmd]) + payload + b"\xf4")
+                    for cmd in range(0xf0, 0x100)
+                    if cmd not in (0xf5, 0xf6)  # tested in PHASE 3
+                    for payload in (b"\x00", b"\x01", b"\x02\x00\x08",
+                                    b"\x03\x00\x0d\x00\x00\x0d")]
+# Approach 3: mid-range commands (0x30-0x50, 0x60-0x80), (cmd, frame)
+APPROACH3_PROBES = [(cmd, bytes((0xf3, cmd, 0x00, 0xf4)))
+                    for cmd in (0x30, 0x31, 0x32, 0x40, 0x41, 0x42, 0x50, 0x51,
+                                0x60, 0x61, 0x62, 0x70, 0x71, 0x72, 0x80, 0x81)]
+# Approach 4: ((device_id, cmd), frame); CyberPi sensors: gyro=0x06,
+# sound=0x07, light=0x03, etc.
+APPROACH4_PROBES = [((device_id, cmd), bytes((0xf3, cmd, device_id, 0x00, 0xf4)))
+                    for device_id in (0x01, 0x02, 0x03, 0x06, 0x07, 0x08, 0x09, 0x0a,
+                                      0x10, 0x11, 0x12, 0x20, 0x21, 0x30, 0x3c, 0x3d)
+                    for cmd in (0x01, 0x02, 0x03, 0x04, 0x05)]
+# PHASE 6: f3 [cmd] 00 f4, indexed by cmd
+SWEEP_FRAMES = [bytes((0xf3, cmd, 0x00, 0xf4)) for cmd in range(0x100)]
+
 def log(msg):
     print(msg)
     LOG.append(msg)
@@ -32,23 +57,14 @@ def save_log():
     with open(LOGFILE, "w") as f:
         f.write("\n".join(LOG))
 
+# Map every byte that is not printable ASCII (or \n \r) to '.';
+# PRINTABLE_TAB also keeps \t
+PRINTABLE = bytes(b if 32 <= b < 127 or b in b"\n\r" else 0x2e for b in range(256))
+PRINTABLE_TAB = bytes(b if 32 <= b < 127 or b in b"\n\r\t" else 0x2e for b in range(256))
+
 def parse_f3_frames(data):
     """Extract f3...f4 frames from raw data."""
-    frames = []
-    i = 0
-    while i < len(data):
-        if data[i] == 0xf3:
-            # Find matching f4
-            for j in range(i + 1, len(data)):
-                if data[j] == 0xf4:
-                    frames.append(data[i:j+1])
-                    i = j + 1
-                    break
-            else:
-                i += 1
-        else:
-            i += 1
-    return frames
+    return f3_frames(data)
 
 def hex_dump(data):
     return data.hex(' ') if data else "(empty)"
@@ -71,6 +87,7 @@ def main():
     ser.open()
     ser.dtr = False
     ser.rts = False
+    size_rx_buffer(ser, 5, log)  # boot output and the 5s listen must fit
     time.sleep(0.1)
 
     # RTS toggle = ESP32 reset
@@ -84,28 +101,34 @@ def main():
     # PHASE 2: Capture ALL boot data
     # ==========================================
     log("\n=== PHASE 2: Capture boot data ===")
-    boot_data = b""
-    deadline = time.time() + 3.0
-    while time.time() < deadline:
-        if ser.in_waiting:
-            chunk = ser.read(ser.in_waiting)
+    boot_data = bytearray()
+    boot_lines = []  # text lines, split off while waiting for the next chunk
+    partial = ""
+    deadline = time.monotonic() + 3.0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_readable(ser, remaining):
+            chunk = read_available(ser)
             boot_data += chunk
             log(f"  RX [{len(chunk)}]: {hex_dump(chunk)}")
-        time.sleep(0.05)
+            *lines, partial = (partial + chunk.translate(PRINTABLE_TAB).decode('ascii')).split('\n')
+            boot_lines += lines
+    boot_data = bytes(boot_data)
+    boot_lines.append(partial)
 
     log(f"\nTotal boot data: {len(boot_data)} bytes")
+    boot_frames = parse_f3_frames(boot_data)
     if boot_data:
-        # Try to decode text portions
-        text = boot_data.decode('utf-8', errors='replace')
-        printable = ''.join(c if c.isprintable() or c in '\n\r\t' else '.' for c in text)
-        for line in printable.split('\n'):
+        # Text portions, decoded as the chunks arrived
+        for line in boot_lines:
             if line.strip():
                 log(f"  TXT: {line.strip()}")
 
         # Parse f3 frames
-        frames = parse_f3_frames(boot_data)
-        log(f"\n  Found {len(frames)} f3 frames in boot data:")
-        for i, frame in enumerate(frames):
+        log(f"\n  Found {len(boot_frames)} f3 frames in boot data:")
+        for i, frame in enumerate(boot_frames):
             log(f"    [{i}] {hex_dump(frame)}")
             if len(frame) >= 3:
                 log(f"         Type: 0x{frame[1]:02x}, Payload: {hex_dump(frame[2:-1])}")
@@ -119,11 +142,11 @@ def main():
         """Send f3 frame, return response bytes."""
         ser.reset_input_buffer()
         ser.write(data)
-        time.sleep(wait)
-        resp = b""
-        while ser.in_waiting:
-            resp += ser.read(ser.in_waiting)
-            time.sleep(0.05)
+        # Replies are f4-terminated: return once one completes, plus any
+        # frames following back-to-back, instead of sitting out a gap
+        resp = read_until(ser, b"\xf4", wait)
+        if b"\xf4" in resp:
+            resp += read_quiet(ser, 0.01)
         return resp
 
     # The handshake that worked over BLE
@@ -163,51 +186,30 @@ def main():
 
     # Approach 1: Simple command types (0x01-0x20) with minimal payloads
     log("--- Approach 1: Command types 0x01-0x20 ---")
-    for cmd in range(0x01, 0x21):
-        for payload in [bytes([0x00]), bytes([0x01]), bytes([0x00, 0x00]),
-                        bytes([0x01, 0x00]), bytes([0x02, 0x00])]:
-            frame = bytes([0xf3, cmd]) + payload + bytes([0xf4])
-            resp = send_f3(frame, f"cmd 0x{cmd:02x}", 0.2)
-            if resp:
-                log(f"  0x{cmd:02x} payload={payload.hex()}: RX {hex_dump(resp)}")
-                frames = parse_f3_frames(resp)
-                for f in frames:
-                    log(f"    Frame: {hex_dump(f)}")
+    for (cmd, payload), resp in sweep_probes(ser, APPROACH1_PROBES, 0.2):
+        log(f"  0x{cmd:02x} payload={payload.hex()}: RX {hex_dump(resp)}")
+        frames = parse_f3_frames(resp)
+        for f in frames:
+            log(f"    Frame: {hex_dump(f)}")
 
     # Approach 2: High command types (0xf0-0xff) - where f5/f6 live
     log("\n--- Approach 2: Command types 0xf0-0xff ---")
-    for cmd in range(0xf0, 0x100):
-        if cmd in (0xf5, 0xf6):
-            continue  # Already tested
-        for payload in [bytes([0x00]), bytes([0x01]), bytes([0x02, 0x00, 0x08]),
-                        bytes([0x03, 0x00, 0x0d, 0x00, 0x00, 0x0d])]:
-            frame = bytes([0xf3, cmd]) + payload + bytes([0xf4])
-            resp = send_f3(frame, f"cmd 0x{cmd:02x}", 0.2)
-            if resp:
-                log(f"  0x{cmd:02x} payload={payload.hex()}: RX {hex_dump(resp)}")
-                frames = parse_f3_frames(resp)
-                for f in frames:
-                    log(f"    Frame: {hex_dump(f)}")
+    for (cmd, payload), resp in sweep_probes(ser, APPROACH2_PROBES, 0.2):
+        log(f"  0x{cmd:02x} payload={payload.hex()}: RX {hex_dump(resp)}")
+        frames = parse_f3_frames(resp)
+        for f in frames:
+            log(f"    Frame: {hex_dump(f)}")
 
     # Approach 3: Mid-range commands (0x30-0x50, 0x60-0x80)
     log("\n--- Approach 3: Mid-range commands ---")
-    for cmd in [0x30, 0x31, 0x32, 0x40, 0x41, 0x42, 0x50, 0x51,
-                0x60, 0x61, 0x62, 0x70, 0x71, 0x72, 0x80, 0x81]:
-        frame = bytes([0xf3, cmd, 0x00, 0xf4])
-        resp = send_f3(frame, f"cmd 0x{cmd:02x}", 0.2)
-        if resp:
-            log(f"  0x{cmd:02x}: RX {hex_dump(resp)}")
+    for cmd, resp in sweep_probes(ser, APPROACH3_PROBES, 0.2):
+        log(f"  0x{cmd:02x}: RX {hex_dump(resp)}")
 
     # Approach 4: Makeblock device ID style (device_id, port, slot format)
     log("\n--- Approach 4: Device ID style queries ---")
-    # CyberPi sensors: gyro=0x06, sound=0x07, light=0x03, etc.
-    for device_id in [0x01, 0x02, 0x03, 0x06, 0x07, 0x08, 0x09, 0x0a,
-                      0x10, 0x11, 0x12, 0x20, 0x21, 0x30, 0x3c, 0x3d]:
-        for cmd in [0x01, 0x02, 0x03, 0x04, 0x05]:
-            frame = bytes([0xf3, cmd, device_id, 0x00, 0xf4])
-            resp = send_f3(frame, f"dev {device_id:02x} cmd {cmd:02x}", 0.15)
-            if resp:
-                log(f"  cmd=0x{cmd:02x} dev=0x{device_id:02x}: RX {hex_dump(resp)}")
+    # Burst the queries: only the device IDs that answer get probed singly
+    for (device_id, cmd), resp in sweep_probes(ser, APPROACH4_PROBES, 0.15):
+        log(f"  cmd=0x{cmd:02x} dev=0x{device_id:02x}: RX {hex_dump(resp)}")
 
     # Approach 5: Subscribe-style commands (maybe f3 supports data streaming)
     log("\n--- Approach 5: Subscribe/stream commands ---")
@@ -223,10 +225,8 @@ def main():
         bytes([0xf3, 0x0c, 0x01, 0x00, 0xf4]),
         bytes([0xf3, 0x0d, 0x01, 0x00, 0xf4]),
     ]
-    for frame in subscribe_frames:
-        resp = send_f3(frame, f"subscribe: {hex_dump(frame)}", 0.5)
-        if resp:
-            log(f"  {hex_dump(frame)}: RX {hex_dump(resp)}")
+    for frame, resp in sweep_probes(ser, [(frame, frame) for frame in subscribe_frames], 0.5):
+        log(f"  {hex_dump(frame)}: RX {hex_dump(resp)}")
 
     # ==========================================
     # PHASE 5: Try second handshake + different f5 parameters
@@ -260,41 +260,45 @@ def main():
         bytes([0xf3, 0xf5, 0x03, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),
         bytes([0xf3, 0xf5, 0x04, 0x00, 0x08, 0xc0, 0xc8, 0xf4]),
     ]
-    for v in variants:
-        resp = send_f3(v, f"f5 variant", 0.3)
-        if resp:
-            log(f"  TX: {hex_dump(v)}")
-            log(f"  RX: {hex_dump(resp)}")
+    for v, resp in sweep_probes(ser, [(v, v) for v in variants], 0.3):
+        log(f"  TX: {hex_dump(v)}")
+        log(f"  RX: {hex_dump(resp)}")
 
     # ==========================================
     # PHASE 6: Full sweep 0x00-0xff (definitive)
     # ==========================================
     log("\n=== PHASE 6: Full command type sweep 0x00-0xff ===")
-    responders = {}
-    for cmd in range(0x00, 0x100):
-        frame = bytes([0xf3, cmd, 0x00, 0xf4])
-        resp = send_f3(frame, f"sweep 0x{cmd:02x}", 0.12)
-        if resp:
-            responders[cmd] = resp
-            log(f"  0x{cmd:02x}: RX [{len(resp)}] {hex_dump(resp[:32])}")
+    responders = dict(sweep_probes(ser, list(enumerate(SWEEP_FRAMES)), 0.12))
+    rx_hex = {}  # reply bytes -> hex preview, formatted once per distinct reply
+    for cmd, resp in sorted(responders.items()):
+        if resp not in rx_hex:
+            rx_hex[resp] = hex_dump(resp[:40])
+        log(f"  0x{cmd:02x}: RX [{len(resp)}] {rx_hex[resp]}")
 
-    log(f"\n  Responding command types: {len(responders)}")
+    # Many types give the same reply (an echo or a generic error): log each
+    # distinct reply once with every type that produced it
+    seen = {}
     for cmd, resp in sorted(responders.items()):
-        log(f"    0x{cmd:02x}: {hex_dump(resp[:40])}")
+        seen.setdefault(resp, []).append(cmd)
+    log(f"\n  Responding command types: {len(responders)} ({len(seen)} distinct replies)")
+    for resp, cmds in seen.items():
+        log(f"    {', '.join(f'0x{c:02x}' for c in cmds)}: {rx_hex[resp]}")
 
     # ==========================================
     # PHASE 7: Listen for unsolicited data
     # ==========================================
     log("\n=== PHASE 7: Listen for unsolicited data (5s) ===")
     ser.reset_input_buffer()
-    all_rx = b""
-    deadline = time.time() + 5.0
-    while time.time() < deadline:
-        if ser.in_waiting:
-            chunk = ser.read(ser.in_waiting)
+    all_rx = bytearray()
+    deadline = time.monotonic() + 5.0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_readable(ser, remaining):
+            chunk = read_available(ser)
             all_rx += chunk
             log(f"  RX: {hex_dump(chunk)}")
-        time.sleep(0.05)
     if not all_rx:
         log("  No unsolicited data")
 
@@ -315,15 +319,11 @@ def main():
     for cmd in text_cmds:
         ser.reset_input_buffer()
         ser.write(cmd)
-        time.sleep(1.0)
-        resp = b""
-        while ser.in_waiting:
-            resp += ser.read(ser.in_waiting)
-            time.sleep(0.05)
+        # Wake on the first reply byte; the reply ends at a 100ms gap
+        resp = read_quiet(ser, 0.1) if wait_readable(ser, 1.0) else b""
         if resp:
             log(f"  '{cmd.strip().decode()}': [{len(resp)}] {hex_dump(resp[:64])}")
-            text = resp.decode('utf-8', errors='replace')
-            printable = ''.join(c if c.isprintable() or c in '\n\r' else '.' for c in text)
+            printable = resp.translate(PRINTABLE).decode('ascii')
             if printable.strip():
                 log(f"    TXT: {printable.strip()[:100]}")
         else:
@@ -346,8 +346,8 @@ def main():
     log("SUMMARY")
     log("="*60)
     log(f"Boot data: {len(boot_data)} bytes")
-    log(f"f3 frames in boot: {len(parse_f3_frames(boot_data))}")
-    log(f"f5 handshake over serial: {'YES' if any(0xf5 in responders for _ in [1]) else 'Check above'}")
+    log(f"f3 frames in boot: {len(boot_frames)}")
+    log(f"f5 handshake over serial: {'YES' if 0xf5 in responders else 'Check above'}")
     log(f"Responding command types: {len(responders)}")
     if responders:
         log(f"  Types: {', '.join(f'0x{k:02x}' for k in sorted(responders.keys()))}")
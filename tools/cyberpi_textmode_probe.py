@@ -9,15 +9,27 @@ Let's find what OTHER commands exist, especially for sensor data.
 Also probes the f3 binary protocol for sensor read commands.
 """
 
-import serial
 import time
 import struct
+from cyberpi_serial_common import open_port, read_for, reset_device, sweep_probes
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_textmode.log"
 LOG = []
 
+# f3 probe frames, built once
+# f3 [type] 00 f4 for types 0x01-0x1f: (cmd_type, frame)
+TYPE_PROBES = [(cmd_type, bytes((0xf3, cmd_type, 0x00, 0xf4))) for cmd_type in range(0x01, 0x20)]
+# f3 [type] [subcmd] f4 around the f5/f6 types: ((cmd_type, subcmd), frame)
+SUBCMD_PROBES = [((cmd_type, subcmd), bytes((0xf3, cmd_type, subcmd, 0xf4)))
+                 for cmd_type in (0xf5, 0xf6, 0xf7, 0xf8, 0xf9, 0xfa, 0xfb)
+                 for subcmd in (0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x10, 0x20)]
+# f3 [type] [payload] f4 for types 0xf0-0xff: ((cmd_type, payload), frame)
+EXT_TYPE_PROBES = [((cmd_type, payload), bytes((0xf3, cmd_type)) + payload + b"\xf4")
+                   for cmd_type in range(0xf0, 0x100)
+                   for payload in (b"\x00", b"\x01", b"\x01\x00", b"\x02\x00")]
+
 def log(msg):
     print(msg)
     LOG.append(msg)
@@ -27,14 +39,9 @@ def save_log():
         f.write("\n".join(LOG))
 
 def read_all(ser, timeout=2.0):
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
-        n = ser.in_waiting
-        if n:
-            buf += ser.read(n)
-        time.sleep(0.01)
-    return buf
+    """Everything received in the next timeout seconds (sleeps in select,
+    not in 10ms polls)."""
+    return read_for(ser, timeout)
 
 def send_text(ser, cmd, label=None, timeout=2.0):
     """Send text command, read response."""
@@ -75,24 +82,11 @@ def send_binary(ser, data, label="", timeout=1.0):
 def main():
     log(f"=== CyberPi Text Mode Probe - {time.strftime('%Y-%m-%d %H:%M:%S')} ===")
 
-    ser = serial.Serial()
-    ser.port = PORT
-    ser.baudrate = BAUD
-    ser.timeout = 0.01
-    ser.dtr = False
-    ser.rts = False
-    ser.open()
-    ser.dtr = False
-    ser.rts = False
-    time.sleep(0.1)
+    ser = open_port(PORT, BAUD, 0.01)
 
     # Reset
     log("\n=== PHASE 1: Reset and boot ===")
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(5.0)
-    boot = read_all(ser, 2.0)
+    boot = reset_device(ser, 7.0)
     log(f"Boot: {len(boot)} bytes")
     if boot:
         text = boot.decode('utf-8', errors='replace')
@@ -158,21 +152,17 @@ def main():
     # f3 f5 02 00 08 c0 c8 f4 - sent by CyberPi after mode upload
     # f3 f6 03 00 0d 00 00 0d f4 - sent by CyberPi after mode upload
 
-    # Try various f3 command types
-    for cmd_type in range(0x01, 0x20):
-        frame = bytes([0xf3, cmd_type, 0x00, 0xf4])
-        resp = send_binary(ser, frame, f"f3 {cmd_type:02x} 00", 0.5)
-        if resp:
-            log(f"    *** GOT RESPONSE for type 0x{cmd_type:02x}! ***")
+    # Try various f3 command types: all 31 frames in one burst, split
+    # down only where a reply comes back
+    for cmd_type, resp in sweep_probes(ser, TYPE_PROBES, 0.5):
+        log(f"\n  [f3 {cmd_type:02x} 00] RX ({len(resp)}): {resp.hex(' ')}")
+        log(f"    *** GOT RESPONSE for type 0x{cmd_type:02x}! ***")
 
     # Try with more payload variations
     log("\n  --- Extended f3 probing ---")
-    for cmd_type in [0xf5, 0xf6, 0xf7, 0xf8, 0xf9, 0xfa, 0xfb]:
-        for subcmd in [0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x10, 0x20]:
-            frame = bytes([0xf3, cmd_type, subcmd, 0xf4])
-            resp = send_binary(ser, frame, f"f3 {cmd_type:02x} {subcmd:02x}", 0.3)
-            if resp:
-                log(f"    *** GOT RESPONSE for f3 {cmd_type:02x} {subcmd:02x}! ***")
+    for (cmd_type, subcmd), resp in sweep_probes(ser, SUBCMD_PROBES, 0.3):
+        log(f"\n  [f3 {cmd_type:02x} {subcmd:02x}] RX ({len(resp)}): {resp.hex(' ')}")
+        log(f"    *** GOT RESPONSE for f3 {cmd_type:02x} {subcmd:02x}! ***")
 
     # PHASE 4: Try Makeblock's mblock-link protocol
     # mBlock uses a different protocol for live sensor monitoring
@@ -210,11 +200,9 @@ def main():
 
     # Now try f3 commands in upload mode
     log("\n  --- f3 probing in upload mode ---")
-    for cmd_type in range(0x01, 0x20):
-        frame = bytes([0xf3, cmd_type, 0x00, 0xf4])
-        resp = send_binary(ser, frame, f"upload: f3 {cmd_type:02x}", 0.5)
-        if resp:
-            log(f"    *** RESPONSE in upload mode for 0x{cmd_type:02x}! ***")
+    for cmd_type, resp in sweep_probes(ser, TYPE_PROBES, 0.5):
+        log(f"\n  [upload: f3 {cmd_type:02x}] RX ({len(resp)}): {resp.hex(' ')}")
+        log(f"    *** RESPONSE in upload mode for 0x{cmd_type:02x}! ***")
 
     # Try echoing back the frames CyberPi sent us
     log("\n  --- Echoing CyberPi's own frames ---")
@@ -227,13 +215,11 @@ def main():
 
     # Try f3 with extended type bytes (f5, f6 etc - might be the actual protocol space)
     log("\n  --- Extended f3 types (0xf0-0xff) ---")
-    for cmd_type in range(0xf0, 0x100):
-        for payload in [b"\x00", b"\x01", b"\x01\x00", b"\x02\x00"]:
-            frame = bytes([0xf3, cmd_type]) + payload + bytes([0xf4])
-            resp = send_binary(ser, frame, f"f3 {cmd_type:02x} {payload.hex()}", 0.3)
-            if resp:
-                log(f"    *** RESPONSE for f3 {cmd_type:02x} {payload.hex()}! ***")
-                break  # Found a working type, move to next
+    # One burst per 32 frames; only bursts that get a reply are split down
+    # to the frame that caused it
+    for (cmd_type, payload), resp in sweep_probes(ser, EXT_TYPE_PROBES, 0.3):
+        log(f"\n  [f3 {cmd_type:02x} {payload.hex()}] RX ({len(resp)}): {resp.hex(' ')}")
+        log(f"    *** RESPONSE for f3 {cmd_type:02x} {payload.hex()}! ***")
 
     # PHASE 6: Try Scratch-link style protocol
     # Makeblock Scratch extensions use a specific binary protocol
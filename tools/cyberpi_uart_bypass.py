@@ -9,45 +9,39 @@ Test 2: WiFi AP + TCP socket bridge
   - Create AP, start TCP server, confirm data flows over WiFi
 """
 
-import serial
+import atexit
 import time
 import socket
 import subprocess
+from cyberpi_serial_common import (enter_upload_repl, exec_raw_repl, open_port, raw_repl_sections,
+                                   read_for, read_until, reset_device)
 
 PORT = "/dev/ttyUSB0"
 BAUD = 115200
 LOGFILE = "/tmp/cyberpi_bypass.log"
+LOGFH = open(LOGFILE, "w", buffering=1 << 16)
+atexit.register(LOGFH.close)
 
 def log(msg):
     print(msg)
-    with open(LOGFILE, "a") as f:
-        f.write(f"{msg}\n")
+    if msg.startswith("\n==="):
+        LOGFH.flush()  # section boundary: keep partial logs on disk
+    LOGFH.write(f"{msg}\n")
+
+def save_log():
+    LOGFH.flush()
 
 def read_all(ser, timeout=2.0):
-    end = time.time() + timeout
-    buf = b""
-    while time.time() < end:
-        n = ser.in_waiting
-        if n:
-            buf += ser.read(n)
-        time.sleep(0.01)
-    return buf
+    """Everything received in the next timeout seconds (sleeps in select,
+    not in 10ms polls)."""
+    return read_for(ser, timeout)
 
 def enter_repl(ser):
     """Reset and enter REPL."""
-    ser.rts = True
-    time.sleep(0.1)
-    ser.rts = False
-    time.sleep(5.0)
-    ser.reset_input_buffer()
-
-    ser.write(b"mode upload\r\n")
-    time.sleep(2.0)
-    ser.reset_input_buffer()
+    boot = reset_device(ser, 5.0)
+    log(f"Boot: {len(boot)} bytes")
 
-    ser.write(b"\x01")
-    time.sleep(2.0)
-    resp = read_all(ser, 3.0)
+    resp = enter_upload_repl(ser, 5.0)
     if b">>>" in resp:
         log("REPL ready")
         return True
@@ -55,31 +49,26 @@ def enter_repl(ser):
     return False
 
 def send_repl(ser, code, delay=0.5):
-    """Send a line of code to REPL."""
+    """Send a line of code to REPL.
+
+    Returns once the next >>> prompt arrives, i.e. when the line has run,
+    or after delay + 0.5s if no prompt comes back.
+    """
     if isinstance(code, str):
         code = code.encode()
     ser.write(code + b"\r\n")
-    time.sleep(delay)
     # Read any response (usually empty due to output capture)
-    return read_all(ser, 0.5)
+    return read_until(ser, b">>> ", delay + 0.5)
 
 def main():
-    with open(LOGFILE, "w") as f:
-        f.write(f"=== CyberPi UART Bypass - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
-
-    ser = serial.Serial()
-    ser.port = PORT
-    ser.baudrate = BAUD
-    ser.timeout = 0.01
-    ser.dtr = False
-    ser.rts = False
-    ser.open()
-    ser.dtr = False
-    ser.rts = False
+    LOGFH.write(f"=== CyberPi UART Bypass - {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+
+    ser = open_port(PORT, BAUD, 0.01)
 
     if not enter_repl(ser):
         log("Could not enter REPL. Aborting.")
         ser.close()
+        save_log()
         return
 
     # ========================================
@@ -151,15 +140,6 @@ def main():
         "import cyberpi",
         "cyberpi.led.on(0, 0, 255)",  # Blue = AP starting
     ]
-    for line in wifi_lines:
-        send_repl(ser, line, 0.5)
-        log(f"  Sent: {line}")
-
-    log("  Waiting for AP to start (3s)...")
-    time.sleep(3.0)
-
-    # LED green = AP ready
-    send_repl(ser, "cyberpi.led.on(0, 255, 0)", 0.3)
 
     # Step 2: Start TCP server
     tcp_lines = [
@@ -171,9 +151,27 @@ def main():
         # LED yellow = server ready
         "cyberpi.led.on(255, 255, 0)",
     ]
-    for line in tcp_lines:
-        send_repl(ser, line, 0.5)
-        log(f"  Sent: {line}")
+
+    # Run both steps as one raw-REPL exec: a failing line stops the block
+    # and comes back on stderr instead of being skipped by the next line
+    ap_wait = [
+        "import time",
+        "time.sleep(3)",  # wait for the AP to start
+        "cyberpi.led.on(0, 255, 0)",  # LED green = AP ready
+    ]
+    setup_src = "\n".join(wifi_lines + ap_wait + tcp_lines)
+    log("  Running WiFi AP + TCP setup in raw REPL...")
+    result = raw_repl_sections(exec_raw_repl(ser, setup_src, 10.0))
+    if result is None:
+        log("  No OK from raw REPL; setup may not have run")
+    else:
+        out, err = result
+        if out:
+            log(f"  stdout: {out!r}")
+        if err:
+            log(f"  SETUP FAILED: {err.decode(errors='replace').strip()}")
+        else:
+            log("  Setup ran without errors")
 
     log("\n  WiFi AP + TCP server should now be running on CyberPi!")
     log("  AP SSID: mBot2Bridge")
@@ -248,6 +246,7 @@ def main():
     log("========================================")
 
     ser.close()
+    save_log()
 
 if __name__ == "__main__":
     main()
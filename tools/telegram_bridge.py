@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """Telegram <-> mBot Voice API bridge.
 
-Polls Telegram for messages, forwards them to the voice API /api/text endpoint,
-sends the response back to Telegram. No pip install needed (stdlib only).
+Polls Telegram for messages (or receives them on a webhook), forwards them to
+the voice API /api/text endpoint, sends the response back to Telegram. No pip
+install needed (stdlib only); uses orjson for JSON when it is installed.
 
 Usage:
     python3 tools/telegram_bridge.py
@@ -10,87 +11,296 @@ Usage:
 Requires:
     MBOT_TELEGRAM_TOKEN env var (or reads from .env file)
     Voice API running on localhost:8088
+
+Optional:
+    MBOT_TELEGRAM_WEBHOOK_URL   public https URL that reaches this machine;
+                                Telegram then pushes updates instead of the
+                                bridge long-polling getUpdates
+    MBOT_TELEGRAM_WEBHOOK_PORT  local port the webhook listens on (8443)
+    MBOT_VOICE_API_SOCK         Unix socket the voice API is served on; used
+                                instead of TCP to MBOT_VOICE_API_URL
 """
 
-import json
+import contextlib
+import functools
+import http.client
 import os
+import secrets
+import socket
 import sys
+import threading
 import time
-import urllib.request
-import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlencode, urlsplit
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:  # stdlib fallback
+    import json
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+    _loads = json.loads
 
 VOICE_API = os.environ.get("MBOT_VOICE_API_URL", "http://localhost:8088")
+VOICE_API_SOCK = os.environ.get("MBOT_VOICE_API_SOCK")
+TELEGRAM_API = "https://api.telegram.org"
+# Emoji shown next to each voice API mood
+MOOD_EMOJI = {"CALM": "\U0001f916", "Active": "\U0001f914", "Spike": "\U0001f631", "Protect": "\U0001f628"}
+DEFAULT_MOOD_EMOJI = "\U0001f916"
+# Reply to /start
+START_TEXT = (
+    "Hi! I'm mBot \U0001f916\n\n"
+    "Send me commands:\n"
+    "  forward / back / left / right\n"
+    "  circle / spin / dance\n"
+    "  stop\n"
+    "  say <text>\n"
+    "  hello / how are you\n\n"
+    "I'll move the real robot!"
+)
+CHAT_WORKERS = 8  # chats whose messages are handled at the same time
+TG_MAX_TEXT = 4096  # longest text one sendMessage accepts
+REPLY_SEPARATOR = "\n---\n"  # between replies sent as one message
+# chat_id -> [lock held while that chat's messages are answered, number of
+# threads holding or waiting for it]; an entry is dropped when that reaches 0
+CHAT_LOCKS = {}
+_CHAT_LOCKS_GUARD = threading.Lock()
+
+# One kept-alive connection per (scheme, host) and thread: the Telegram long
+# poll and the voice API calls reuse their TCP (and TLS) session instead of
+# reconnecting on every request
+_LOCAL = threading.local()
 
 def load_env():
     """Load .env file if present."""
     env_path = os.path.join(os.path.dirname(__file__), "..", ".env")
     if os.path.exists(env_path):
         with open(env_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    key, _, val = line.partition("=")
-                    os.environ.setdefault(key.strip(), val.strip())
+            lines = f.read().splitlines()
+        for line in lines:
+            # One partition per line; comments and lines without = are skipped
+            key, sep, val = line.partition("=")
+            key = key.strip()
+            if sep and key and key[0] != "#":
+                os.environ.setdefault(key, val.strip())
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix domain socket; the URL's host only fills the Host header."""
+
+    def __init__(self, host, sock_path, timeout=60):
+        super().__init__(host, timeout=timeout)
+        self.sock_path = sock_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.sock_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+# The bridge only ever calls a handful of URLs: build and split each once
+split_url = functools.lru_cache(maxsize=32)(urlsplit)
+
+@functools.lru_cache(maxsize=32)
+def tg_url(token, method):
+    return f"{TELEGRAM_API}/bot{token}/{method}"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+def http_request(url, body=None, headers=JSON_HEADERS, timeout=60, sock_path=None):
+    """POST body to url (GET if there is no body) over a kept-alive
+    connection, through the Unix socket sock_path if one is given.
+    Returns (status, body bytes).
+
+    A request that fails on a reused connection because the server closed
+    it while idle (nothing of the response arrived) is sent once more on a
+    new connection. Any other failure is raised: the request may already
+    have been processed, and sending a POST again could repeat it.
+    """
+    parts = split_url(url)
+    key = (parts.scheme, parts.netloc, sock_path)
+    method = "POST" if body else "GET"
+    if not body:
+        headers = {}
+    conns = getattr(_LOCAL, "conns", None)
+    if conns is None:
+        conns = _LOCAL.conns = {}
+    while True:
+        conn = conns.get(key)
+        reused = conn is not None
+        if conn is None:
+            if sock_path:
+                conn = UnixHTTPConnection(parts.netloc, sock_path, timeout)
+            elif parts.scheme == "https":
+                conn = http.client.HTTPSConnection(parts.netloc, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(parts.netloc, timeout=timeout)
+            conns[key] = conn
+        conn.timeout = timeout
+        if conn.sock:
+            conn.sock.settimeout(timeout)
+        try:
+            conn.request(method, parts.path, body, headers)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError):
+            conn.close()
+            del conns[key]
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            del conns[key]
+            raise
+
+def tg_form(data):
+    """URL-encode Bot API parameters; only list/dict values need JSON."""
+    return urlencode({k: _dumps(v).decode() if isinstance(v, (list, dict)) else v
+                      for k, v in data.items()}).encode()
 
 def tg_request(token, method, data=None):
     """Call Telegram Bot API."""
-    url = f"https://api.telegram.org/bot{token}/{method}"
-    if data:
-        body = json.dumps(data).encode()
-        req = urllib.request.Request(url, body, {"Content-Type": "application/json"})
-    else:
-        req = urllib.request.Request(url)
+    url = tg_url(token, method)
     try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            return json.loads(resp.read())
-    except urllib.error.HTTPError as e:
-        print(f"Telegram API error ({method}): {e.code} {e.read().decode()}")
-        return None
+        status, body = http_request(url, tg_form(data) if data else None, FORM_HEADERS, 60)
     except Exception as e:
         print(f"Telegram request failed ({method}): {e}")
         return None
+    if status >= 400:
+        print(f"Telegram API error ({method}): {status} {body.decode(errors='replace')}")
+        return None
+    return _loads(body)
 
 def voice_api_text(text):
-    """Send text command to voice API, return response."""
-    url = f"{VOICE_API}/api/text"
-    body = json.dumps({"text": text}).encode()
-    req = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+    """Send text command to voice API, return response.
+
+    Only the text, actions and mood fields are kept, and all three are
+    always present (empty when the API left them out).
+    """
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read())
+        status, body = http_request(f"{VOICE_API}/api/text", _dumps({"text": text}), JSON_HEADERS, 15,
+                                    VOICE_API_SOCK)
+        if status >= 400:
+            raise RuntimeError(f"HTTP {status}")
+        data = _loads(body)
+        return {"text": data.get("text") or "", "actions": data.get("actions") or [],
+                "mood": data.get("mood") or ""}
     except Exception as e:
         return {"text": f"Voice API error: {e}", "actions": [], "mood": "?"}
 
 def format_response(data):
-    """Format voice API response for Telegram."""
+    """Format voice API response for Telegram.
+
+    data is a voice_api_text() result, so all three keys are present.
+    """
+    text, actions, mood = data["text"], data["actions"], data["mood"]
     parts = []
-    if data.get("text"):
-        parts.append(data["text"])
-    if data.get("actions"):
-        parts.append(f"Actions: {', '.join(data['actions'])}")
-    if data.get("mood"):
-        moods = {"CALM": "\U0001f916", "Active": "\U0001f914", "Spike": "\U0001f631", "Protect": "\U0001f628"}
-        emoji = moods.get(data["mood"], "\U0001f916")
-        parts.append(f"Mood: {emoji} {data['mood']}")
+    if text:
+        parts.append(text)
+    if actions:
+        parts.append(f"Actions: {', '.join(actions)}")
+    if mood:
+        parts.append(f"Mood: {MOOD_EMOJI.get(mood, DEFAULT_MOOD_EMOJI)} {mood}")
     return "\n".join(parts) if parts else "..."
 
-def main():
-    load_env()
-    token = os.environ.get("MBOT_TELEGRAM_TOKEN") or os.environ.get("TELEGRAM_BOT_TOKEN")
-    if not token:
-        print("Error: MBOT_TELEGRAM_TOKEN not set in env or .env file")
-        sys.exit(1)
+def start_command(user, text):
+    return START_TEXT
 
-    # Verify bot token
-    me = tg_request(token, "getMe")
-    if not me or not me.get("ok"):
-        print(f"Invalid bot token: {me}")
-        sys.exit(1)
-    bot_name = me["result"]["username"]
-    print(f"Telegram bot @{bot_name} connected!")
-    print(f"Voice API: {VOICE_API}")
-    print("Send messages to the bot in Telegram. Ctrl+C to stop.\n")
+# Bot commands answered locally, keyed by the message's first word;
+# everything else goes to the voice API
+COMMANDS = {"/start": start_command}
+
+def handle_message(user, text):
+    """Reply text for one Telegram message."""
+    command = COMMANDS.get(text.split(" ", 1)[0])
+    if command:
+        return command(user, text)
+
+    print(f"[{user}] {text}")
+
+    # Forward to voice API
+    resp = voice_api_text(text)
+    reply = format_response(resp)
+    print(f"  -> {reply}")
+    return reply
+
+@contextlib.contextmanager
+def chat_lock(chat_id):
+    """Hold chat_id's lock; CHAT_LOCKS only keeps chats being answered."""
+    with _CHAT_LOCKS_GUARD:
+        entry = CHAT_LOCKS.setdefault(chat_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _CHAT_LOCKS_GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                del CHAT_LOCKS[chat_id]
+
+def handle_chat(token, chat_id, messages):
+    """Answer a chat's (user, text) messages, in order.
 
+    The replies go back joined into as few sendMessage calls as Telegram's
+    message size allows, instead of one call per message.
+    """
+    with chat_lock(chat_id):
+        replies = [handle_message(user, text) for user, text in messages]
+        batch = replies[0]
+        for reply in replies[1:]:
+            if len(batch) + len(REPLY_SEPARATOR) + len(reply) > TG_MAX_TEXT:
+                tg_request(token, "sendMessage", {"chat_id": chat_id, "text": batch})
+                batch = reply
+            else:
+                batch += REPLY_SEPARATOR + reply
+        tg_request(token, "sendMessage", {"chat_id": chat_id, "text": batch})
+
+class ChatLanes:
+    """CHAT_WORKERS single-thread executors answering webhook updates.
+
+    A chat's updates always go to the same lane, so they are answered in
+    the order they were submitted; different chats spread over the lanes
+    and are answered at the same time. Each lane's thread keeps its
+    Telegram and voice API connections alive across deliveries.
+    """
+
+    def __init__(self, token, lanes=CHAT_WORKERS):
+        self.token = token
+        self.lanes = [ThreadPoolExecutor(1) for _ in range(lanes)]
+
+    def submit(self, chat_id, user, text):
+        lane = self.lanes[hash(chat_id) % len(self.lanes)]
+        return lane.submit(self.answer, chat_id, user, text)
+
+    def answer(self, chat_id, user, text):
+        try:
+            handle_chat(self.token, chat_id, [(user, text)])
+        except Exception as e:
+            print(f"Error: {e}")
+
+    def shutdown(self, wait=False):
+        for lane in self.lanes:
+            lane.shutdown(wait=wait)
+
+def read_message(update):
+    """(chat_id, user, text) of a text message update, or None."""
+    msg = update.get("message", {})
+    text = msg.get("text", "")
+    chat_id = msg.get("chat", {}).get("id")
+    if not text or not chat_id:
+        return None
+    return chat_id, msg.get("from", {}).get("first_name", "?"), text
+
+def poll_updates(token):
+    """Long-poll getUpdates and answer every message until Ctrl+C."""
+    pool = ThreadPoolExecutor(CHAT_WORKERS)
     offset = 0
     while True:
         try:
@@ -103,51 +313,105 @@ def main():
                 time.sleep(2)
                 continue
 
+            # Messages are handled in order within a chat; different chats
+            # wait on the voice API and Telegram at the same time
+            by_chat = {}
             for update in updates["result"]:
                 offset = update["update_id"] + 1
-                msg = update.get("message", {})
-                text = msg.get("text", "")
-                chat_id = msg.get("chat", {}).get("id")
-                user = msg.get("from", {}).get("first_name", "?")
-
-                if not text or not chat_id:
-                    continue
-
-                # Handle /start
-                if text == "/start":
-                    tg_request(token, "sendMessage", {
-                        "chat_id": chat_id,
-                        "text": (
-                            "Hi! I'm mBot \U0001f916\n\n"
-                            "Send me commands:\n"
-                            "  forward / back / left / right\n"
-                            "  circle / spin / dance\n"
-                            "  stop\n"
-                            "  say <text>\n"
-                            "  hello / how are you\n\n"
-                            "I'll move the real robot!"
-                        )
-                    })
-                    continue
-
-                print(f"[{user}] {text}")
-
-                # Forward to voice API
-                resp = voice_api_text(text)
-                reply = format_response(resp)
-                print(f"  -> {reply}")
-
-                tg_request(token, "sendMessage", {
-                    "chat_id": chat_id,
-                    "text": reply
-                })
+                message = read_message(update)
+                if message:
+                    chat_id, user, text = message
+                    by_chat.setdefault(chat_id, []).append((user, text))
+
+            # list() waits for every chat and re-raises the first error
+            list(pool.map(handle_chat, [token] * len(by_chat), by_chat, by_chat.values()))
 
         except KeyboardInterrupt:
             print("\nStopping Telegram bridge...")
+            pool.shutdown(wait=False)
             break
         except Exception as e:
             print(f"Error: {e}")
             time.sleep(2)
 
+def serve_webhook(token, public_url, port):
+    """Register a webhook with Telegram and answer the updates it pushes
+    until Ctrl+C; the webhook is removed again on exit."""
+    # Unguessable path plus Telegram's secret header: only Telegram can post
+    secret = secrets.token_hex(16)
+    path = f"/webhook/{secret}"
+    resp = tg_request(token, "setWebhook", {
+        "url": public_url.rstrip("/") + path,
+        "secret_token": secret,
+        # One delivery at a time, so updates are queued in update_id order
+        "max_connections": 1,
+        "allowed_updates": ["message"]
+    })
+    if not resp or not resp.get("ok"):
+        print(f"setWebhook failed: {resp}")
+        sys.exit(1)
+
+    lanes = ChatLanes(token)
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        timeout = 30  # a stalled client cannot hold the server forever
+
+        def do_POST(self):
+            if (self.path != path
+                    or self.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret):
+                self.send_response(403)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            # Acknowledge first so Telegram does not resend while we work
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            try:
+                message = read_message(_loads(body))
+                if message:
+                    lanes.submit(*message)
+            except Exception as e:
+                print(f"Error: {e}")
+
+        def log_message(self, format, *args):
+            pass
+
+    # The handler only acknowledges and queues each update, so a single
+    # thread serves them, in the order Telegram delivers them
+    server = HTTPServer(("", port), WebhookHandler)
+    print(f"Webhook listening on port {port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping Telegram bridge...")
+    finally:
+        server.server_close()
+        lanes.shutdown()
+        tg_request(token, "deleteWebhook")
+
+def main():
+    load_env()
+    token = os.environ.get("MBOT_TELEGRAM_TOKEN") or os.environ.get("TELEGRAM_BOT_TOKEN")
+    if not token:
+        print("Error: MBOT_TELEGRAM_TOKEN not set in env or .env file")
+        sys.exit(1)
+
+    # Verify bot token
+    me = tg_request(token, "getMe")
+    if not me or not me.get("ok"):
+        print(f"Invalid bot token: {me}")
+        sys.exit(1)
+    bot_name = me["result"]["username"]
+    print(f"Telegram bot @{bot_name} connected!")
+    print(f"Voice API: {VOICE_API}" + (f" via {VOICE_API_SOCK}" if VOICE_API_SOCK else ""))
+    print("Send messages to the bot in Telegram. Ctrl+C to stop.\n")
+
+    webhook_url = os.environ.get("MBOT_TELEGRAM_WEBHOOK_URL")
+    if webhook_url:
+        serve_webhook(token, webhook_url, int(os.environ.get("MBOT_TELEGRAM_WEBHOOK_PORT", "8443")))
+    else:
+        poll_updates(token)
+
 if __name__ == "__main__":
     main()